@@ -1,11 +1,13 @@
 import os
 import sys
+import time
+import uuid
 import streamlit as st
-from streamlit_webrtc import VideoHTMLAttributes, webrtc_streamer
-from aiortc.contrib.media import MediaRecorder
-import av
-import cv2
-from utils import get_mediapipe_pose
+# Heavy modules (streamlit_webrtc, av, cv2, mediapipe) are imported once an exercise is picked,
+# or ahead of time by the prewarm thread while the member is still on the selectbox
+from cold_start import mark_first_frame, start_prewarm, startup_report
+from pose_pool import PosePool
+from metrics import REGISTRY, draw_metrics_hud, start_metrics_server, start_textfile_writer
 
 # Set base directory and append to system path for conditional imports later
 #BASE_DIR = os.path.abspath(os.path.join(__file__, '../../'))
@@ -17,6 +19,97 @@ st.title('FITVOYAGE AI FITNESS TRAINER')
 # Dropdown menu for exercise selection
 exercise_choice = st.selectbox("Choose Exercise", ("Select", "Bicep Curls", "Squats"))
 
+# Run inference and drawing off the WebRTC callback thread so slow frames are dropped instead of queued
+pipelined = st.sidebar.checkbox("Pipelined inference (low latency)", value=False)
+
+# Hand frames to the server-wide inference workers instead of a per-session pipeline
+shared_scheduler = st.sidebar.checkbox("Shared inference scheduler", value=False)
+
+# Run inference and drawing in worker processes; frames go through shared memory
+multiprocess_workers = st.sidebar.checkbox("Multiprocess workers", value=False)
+
+# Only run the pose model every N frames, N picked from the latency budget
+adaptive_cadence = st.sidebar.checkbox("Adaptive inference cadence", value=False)
+
+# Only feed the region around the athlete (from the previous frame's landmarks) to the pose model
+roi_cropping = st.sidebar.checkbox("Crop inference to athlete", value=False)
+
+# One-Euro filter over the landmarks; removes the jitter of the lite model that flips rep states
+smooth_landmarks = st.sidebar.checkbox("Smooth landmarks", value=False)
+
+# Save the raw pose output of this session as a landmark trace for offline re-analysis
+record_trace = st.sidebar.checkbox("Record landmark trace", value=False)
+
+# Switch between the lite, full and heavy pose models at runtime from inference latency and CPU load
+autoscale_complexity = st.sidebar.checkbox("Autoscale model complexity", value=False)
+
+# Speak rep counts and warnings back over the WebRTC audio track (needs microphone access)
+audio_cues = st.sidebar.checkbox("Audio cues", value=False)
+
+# Background recording of every session, split into segments; RECORDING_MODE sets the default
+record_modes = ("annotated", "raw", "landmarks", "off")
+record_mode = st.sidebar.selectbox("Record session", record_modes,
+                                   index=record_modes.index(os.environ.get("RECORDING_MODE", "annotated")))
+
+# Overlay per-stage p50/p95 latencies on the video
+debug_hud = st.sidebar.checkbox("Debug HUD", value=False)
+
+# Export latency histograms once per server process: METRICS_PORT serves /metrics, METRICS_FILE writes a textfile
+@st.cache_resource
+def start_metrics_export():
+    if os.environ.get("METRICS_PORT"):
+        start_metrics_server(int(os.environ["METRICS_PORT"]))
+    if os.environ.get("METRICS_FILE"):
+        start_textfile_writer(os.environ["METRICS_FILE"], interval=float(os.environ.get("METRICS_INTERVAL", 10)))
+    return True
+
+start_metrics_export()
+
+# Per-session latency histograms; the registry only holds them while the session does
+if "metrics" not in st.session_state:
+    st.session_state["metrics"] = REGISTRY.session(uuid.uuid4().hex[:8])
+metrics = st.session_state["metrics"]
+
+# Rep events for dashboards, batched to the sinks in EVENT_SINKS (e.g. "jsonl:events.jsonl,sqlite:events.db")
+@st.cache_resource
+def get_event_bus():
+    if not os.environ.get("EVENT_SINKS"):
+        return None
+    from event_bus import EventBus, make_sink
+    return EventBus([make_sink(spec) for spec in os.environ["EVENT_SINKS"].split(",")])
+
+event_bus = get_event_bus()
+
+# One pool of pose graphs shared by every browser session in this server process
+@st.cache_resource
+def get_pose_pool():
+    return PosePool(max_instances=int(os.environ.get("POSE_POOL_SIZE", 4)),
+                    idle_timeout=float(os.environ.get("POSE_POOL_IDLE_TIMEOUT", 300)))
+
+
+# Keep this session's pose graph across reruns; it goes back to the pool when the session ends
+def get_session_pose():
+    lease = st.session_state.get("pose_lease")
+    if lease is not None and st.session_state.get("pose_autoscale") != autoscale_complexity:
+        lease.release()
+
+    if lease is None or lease.released:
+        pool = get_pose_pool()
+        with st.spinner("Waiting for a free pose model..."):
+            lease = pool.checkout()
+
+        if autoscale_complexity:
+            from complexity_autoscaler import ComplexityAutoscaler
+            # Graphs for other complexities come from the same pool; a switch is skipped while it is full
+            lease = ComplexityAutoscaler(lambda complexity: pool.checkout(timeout=0, model_complexity=complexity),
+                                         initial_pose=lease,
+                                         latency_budget=float(os.environ.get("POSE_LATENCY_BUDGET", 0.033)))
+
+        st.session_state["pose_lease"] = lease
+        st.session_state["pose_autoscale"] = autoscale_complexity
+    return lease
+
+
 # Initialize variables for processing and threshold setup
 live_process_frame = None
 thresholds = None
@@ -32,7 +125,7 @@ if exercise_choice == "Bicep Curls":
     # Initialize threshold and processing objects
     thresholds = get_bicep_curl_thresholds()
     live_process_frame = ProcessFrame(thresholds=thresholds, flip_frame=True)
-    pose = get_mediapipe_pose()
+    pose = get_session_pose() if not multiprocess_workers else None
     
     st.subheader("Bicep Curl Analysis")
 
@@ -44,32 +137,232 @@ elif exercise_choice == "Squats":
     # Initialize threshold and processing objects
     thresholds = get_thresholds()
     live_process_frame = ProcessFrame2(thresholds=thresholds, flip_frame=True)
-    pose = get_mediapipe_pose()
+    pose = get_session_pose() if not multiprocess_workers else None
     
     st.subheader("Squats Analysis")
 
-# Output video file name based on exercise choice
-output_video_file = f'output_{exercise_choice.lower()}.flv' if exercise_choice != "Select" else None
+if live_process_frame:
+    live_process_frame.metrics = metrics
+    if event_bus is not None:
+        live_process_frame.events = event_bus.channel(metrics.session_id, exercise_choice)
+
+if roi_cropping and pose:
+    from roi_pose import RoiCropPose
+    pose = RoiCropPose(pose)
+
+if adaptive_cadence and pose:
+    from adaptive_pose import AdaptiveCadencePose
+    pose = AdaptiveCadencePose(pose)
+
+# One trace file per exercise selection; the previous one is finalized when the selection changes
+trace_key = f"{exercise_choice}-{record_trace}"
+
+if st.session_state.get("trace_key") != trace_key:
+    old_writer = st.session_state.pop("trace_writer", None)
+    if old_writer is not None:
+        old_writer.close()
+
+    if record_trace and pose:
+        from landmark_trace import TraceWriter, session_trace_path
+        st.session_state["trace_writer"] = TraceWriter(session_trace_path(os.environ.get("TRACE_DIR", "traces"),
+                                                                          exercise_choice.lower().replace(" ", "_")),
+                                                       meta={"exercise": exercise_choice})
+    st.session_state["trace_key"] = trace_key
+
+if "trace_writer" in st.session_state and pose:
+    from landmark_trace import RecordingPose
+    pose = RecordingPose(pose, st.session_state["trace_writer"])
+    st.sidebar.caption(f"Recording to {st.session_state['trace_writer'].path}")
+
+# One recorder per session, exercise selection and take (play to stop); closing it finalizes the current segment
+recording_take = st.session_state.get("recording_take", 0)
+recorder_key = f"{exercise_choice}-{record_mode}-{recording_take}"
+
+if st.session_state.get("recorder_key") != recorder_key:
+    old_recorder = st.session_state.pop("recorder", None)
+    if old_recorder is not None:
+        old_recorder.close()
+
+    if record_mode != "off" and live_process_frame:
+        from segmented_recorder import SegmentedRecorder
+        st.session_state["recorder"] = SegmentedRecorder(os.environ.get("RECORDING_DIR", "recordings"),
+                                                         f"{exercise_choice.lower().replace(' ', '_')}-{metrics.session_id}",
+                                                         mode=record_mode,
+                                                         segment_seconds=float(os.environ.get("RECORDING_SEGMENT_SECONDS", 300)))
+    st.session_state["recorder_key"] = recorder_key
+
+recorder = st.session_state.get("recorder")
+
+# Landmark recordings take the raw pose output, like traces; the worker processes don't expose it
+if recorder is not None and recorder.mode == "landmarks" and pose:
+    from landmark_trace import RecordingPose
+    pose = RecordingPose(pose, recorder)
+
+if recorder is not None:
+    st.sidebar.json(recorder.stats())
+
+# Smooth after recording so traces keep the raw model output and can be re-smoothed offline
+if smooth_landmarks and pose:
+    from landmark_filter import SmoothedPose
+    pose = SmoothedPose(pose)
+
+# One set of inference workers serving every camera stream in this server process, round-robin
+@st.cache_resource
+def get_inference_scheduler():
+    from inference_scheduler import InferenceScheduler, DEFAULT_DEADLINE
+    return InferenceScheduler(num_workers=int(os.environ.get("INFERENCE_WORKERS", os.cpu_count())),
+                              deadline=float(os.environ.get("INFERENCE_DEADLINE", DEFAULT_DEADLINE)))
+
+
+# Worker processes with their own pose graphs, shared by every session in this server process
+@st.cache_resource
+def get_worker_pool():
+    from shm_workers import ShmWorkerPool
+    return ShmWorkerPool(num_workers=int(os.environ.get("POSE_WORKERS", os.cpu_count())),
+                         max_sessions=int(os.environ.get("POSE_WORKER_SESSIONS", 16)))
+
+
+# Start (or replace) this session's pipeline when pipelined, scheduled or multiprocess mode is on
+pipeline_key = f"{exercise_choice}-{pipelined}-{shared_scheduler}-{multiprocess_workers}-{adaptive_cadence}-{roi_cropping}-{record_trace}-{autoscale_complexity}-{smooth_landmarks}-{record_mode}-{recording_take}"
+
+if st.session_state.get("pipeline_key") != pipeline_key:
+    old_pipeline = st.session_state.pop("pipeline", None)
+    if old_pipeline is not None:
+        old_pipeline.stop()
+
+    if multiprocess_workers and live_process_frame:
+        exercise_key = "bicep_curls" if exercise_choice == "Bicep Curls" else "squats"
+        st.session_state["pipeline"] = get_worker_pool().open_session(exercise_key, flip_frame=True, roi_cropping=roi_cropping,
+                                                                      adaptive_cadence=adaptive_cadence, smooth_landmarks=smooth_landmarks)
+        st.session_state["pipeline"].events = live_process_frame.events
+    elif shared_scheduler and live_process_frame and pose:
+        st.session_state["pipeline"] = get_inference_scheduler().register(live_process_frame, pose)
+    elif pipelined and live_process_frame and pose:
+        from async_pipeline import AsyncFrameProcessor
+        st.session_state["pipeline"] = AsyncFrameProcessor(live_process_frame, pose)
+    st.session_state["pipeline_key"] = pipeline_key
+
+pipeline = st.session_state.get("pipeline")
+
+if pipeline is not None:
+    st.sidebar.json(pipeline.stats())
+
+if shared_scheduler:
+    st.sidebar.json(get_inference_scheduler().stats())
+
+if multiprocess_workers:
+    st.sidebar.json(get_worker_pool().stats())
+
+if event_bus is not None:
+    st.sidebar.json(event_bus.stats())
+
+if autoscale_complexity and "pose_lease" in st.session_state:
+    st.sidebar.json(st.session_state["pose_lease"].stats())
+
+# Members who haven't picked an exercise (or use the worker processes) don't need to hold a pose graph
+if (exercise_choice == "Select" or multiprocess_workers) and "pose_lease" in st.session_state:
+    st.session_state.pop("pose_lease").release()
+
+# Import the heavy modules and build a warm pose graph in the background while the member chooses
+if exercise_choice == "Select":
+    start_prewarm(get_pose_pool())
+
+st.sidebar.json(get_pose_pool().stats())
+st.sidebar.json(startup_report())
+
+# Preallocated decode / encode buffers for this session, sized on the first frame
+frame_buffers = None
+
+if exercise_choice != "Select":
+    if "frame_buffers" not in st.session_state:
+        from frame_buffers import FrameBufferPool
+        st.session_state["frame_buffers"] = FrameBufferPool()
+    frame_buffers = st.session_state["frame_buffers"]
+
+    if frame_buffers.frames:
+        st.sidebar.json(frame_buffers.stats())
+
+# Cue clips from AUDIO_CUE_DIR (1.wav, 2.wav, ..., incorrect.wav, reset_counters.wav), decoded once per server process
+@st.cache_resource
+def get_cue_cache():
+    from audio_cues import CueCache
+    return CueCache(os.environ.get("AUDIO_CUE_DIR"))
+
+# Per-session mixer thread feeding the outgoing audio track
+if audio_cues and "cue_mixer" not in st.session_state:
+    from audio_cues import CueMixer
+    st.session_state["cue_mixer"] = CueMixer(get_cue_cache())
+elif not audio_cues and "cue_mixer" in st.session_state:
+    st.session_state.pop("cue_mixer").stop()
+cue_mixer = st.session_state.get("cue_mixer")
+
+if cue_mixer is not None:
+    from audio_cues import make_audio_frame
+    st.sidebar.json(cue_mixer.stats())
 
 # Function to process each video frame
-def video_frame_callback(frame: av.VideoFrame):
-    if live_process_frame and pose:
-        frame = frame.to_ndarray(format="rgb24")  # Decode and get RGB frame
-        frame, _ = live_process_frame.process(frame, pose)  # Process frame
-        return av.VideoFrame.from_ndarray(frame, format="rgb24")  # Encode and return RGB frame
-    return frame
+def video_frame_callback(frame: "av.VideoFrame"):
+    if not (pipeline is not None or (live_process_frame and pose)):
+        return frame
+
+    start = time.perf_counter()
+
+    if pipeline is not None and not getattr(pipeline, "copies_frames", False):
+        img = frame_buffers.decode_new(frame)  # The pipeline holds on to frames, so they can't share the pooled buffer
+    else:
+        img = frame_buffers.decode(frame)  # Decode into the pooled RGB buffer (pipelines that copy frames on submit too)
+    decoded = time.perf_counter()
+
+    if recorder is not None and recorder.mode == "raw":
+        recorder.submit(img)  # Copied and queued for the encoder thread; dropped if it is behind
 
-# Function to set up video recording output
-def out_recorder_factory() -> MediaRecorder:
-    return MediaRecorder(output_video_file)
+    if pipeline is not None:
+        img = pipeline.process(img)  # Queue for analysis, get the latest finished frame
+        play_sound = pipeline.pop_sound()
+    else:
+        img, play_sound = live_process_frame.process(img, pose)  # Process frame in place
+
+    if recorder is not None and recorder.mode == "annotated":
+        recorder.submit(img)
+
+    if play_sound is not None and cue_mixer is not None:
+        cue_mixer.trigger(play_sound)
+
+    encode_start = time.perf_counter()
+    out = frame_buffers.encode(img, frame)  # Convert into a pooled output frame
+    encode_end = time.perf_counter()
+
+    if debug_hud:
+        draw_metrics_hud(frame_buffers.luma(out), metrics)  # On the outgoing frame only, not on img (a pipeline's latest frame, recordings)
+    end = time.perf_counter()
+
+    # The session's first annotated frame shows whether the graph was warm
+    if "callback" not in metrics.histograms:
+        metrics.observe('first_frame', end - start)
+        mark_first_frame(end - start)
+
+    metrics.observe('decode', decoded - start)
+    metrics.observe('encode', encode_end - encode_start)
+    metrics.observe('callback', end - start)
+    return out
+
+# Outgoing audio carries the mixed cues; incoming microphone frames only pace it
+def audio_frame_callback(frame: "av.AudioFrame"):
+    return make_audio_frame(cue_mixer, frame)
 
 # Only display the webrtc streamer if a valid exercise is selected
 if exercise_choice != "Select":
-    webrtc_streamer(
+    from streamlit_webrtc import VideoHTMLAttributes, webrtc_streamer
+    ctx = webrtc_streamer(
         key=f"{exercise_choice}-pose-analysis",
         video_frame_callback=video_frame_callback,
+        audio_frame_callback=audio_frame_callback if cue_mixer is not None else None,
         rtc_configuration={"iceServers": []},
-        media_stream_constraints={"video": {"width": {'min': 480, 'ideal': 720}}, "audio": False},
-        video_html_attrs=VideoHTMLAttributes(autoPlay=True, controls=False, muted=False),
-        out_recorder_factory=out_recorder_factory
-    )
\ No newline at end of file
+        media_stream_constraints={"video": {"width": {'min': 480, 'ideal': 720}}, "audio": cue_mixer is not None},
+        video_html_attrs=VideoHTMLAttributes(autoPlay=True, controls=False, muted=False)
+    )
+
+    # A stopped stream sends no more frames: finalize its recording now, the next play starts a new one
+    if not ctx.state.playing and recorder is not None and recorder.submitted:
+        st.session_state.pop("recorder").close()
+        st.session_state["recording_take"] = st.session_state.get("recording_take", 0) + 1
\ No newline at end of file
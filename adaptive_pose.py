@@ -0,0 +1,158 @@
+import math
+import time
+
+import numpy as np
+
+from pose_replay import landmarks_to_array, pose_result_from_array
+
+
+# Adaptive inference cadence.
+#
+# pose.process only runs on keyframes. On the frames in between, landmarks are linearly
+# extrapolated from the last two keyframes so the rep state machine and the overlay
+# still see a pose on every frame. The keyframe stride is picked from a moving average of the
+# measured inference latency and a per-frame latency budget.
+
+
+
+def _extrapolate(prev_lm, last_lm, key_gap, steps):
+    # Linear extrapolation of all landmarks, steps frames after the last keyframe.
+    if prev_lm is None or key_gap <= 0:
+        return last_lm
+
+    lm = last_lm + (last_lm - prev_lm) * (steps / key_gap)
+    lm[:, 3] = last_lm[:, 3]
+
+    return lm
+
+
+
+class AdaptiveCadencePose:
+    # Drop-in wrapper around a MediaPipe Pose object.
+    def __init__(self, pose, latency_budget = 0.010, max_stride = 4, ema_alpha = 0.2, clock = time.perf_counter):
+        self.pose = pose
+        self.latency_budget = latency_budget
+        self.max_stride = max_stride
+        self.ema_alpha = ema_alpha
+        self.clock = clock
+
+        self.stride = 1
+        self.latency_ema = None
+
+        self.frame_idx = 0
+        self.inferred_frames = 0
+        self.extrapolated_frames = 0
+
+        # (frame index, landmarks) of the last two keyframes with a detected pose.
+        self._prev_key = None
+        self._last_key = None
+
+
+    def process(self, frame):
+        if self._needs_inference():
+            result = self._infer(frame)
+        else:
+            prev_idx, prev_lm = self._prev_key if self._prev_key else (None, None)
+            last_idx, last_lm = self._last_key
+
+            key_gap = last_idx - prev_idx if prev_idx is not None else 0
+            result = pose_result_from_array(_extrapolate(prev_lm, last_lm, key_gap, self.frame_idx - last_idx))
+            self.extrapolated_frames += 1
+
+        self.frame_idx += 1
+
+        return result
+
+
+    def stats(self):
+        return {
+            'stride'              : self.stride,
+            'latency_ema'         : self.latency_ema,
+            'inferred_frames'     : self.inferred_frames,
+            'extrapolated_frames' : self.extrapolated_frames,
+        }
+
+
+    def _needs_inference(self):
+        # Always run the model while tracking is lost.
+        if self._last_key is None:
+            return True
+
+        return self.frame_idx - self._last_key[0] >= self.stride
+
+
+    def _infer(self, frame):
+        start = self.clock()
+        result = self.pose.process(frame)
+        latency = self.clock() - start
+
+        self.inferred_frames += 1
+        self.latency_ema = latency if self.latency_ema is None else \
+                           (1 - self.ema_alpha) * self.latency_ema + self.ema_alpha * latency
+
+        # Smallest stride that keeps the amortized inference cost within budget.
+        self.stride = min(self.max_stride, max(1, math.ceil(self.latency_ema / self.latency_budget)))
+
+        landmarks = landmarks_to_array(result.pose_landmarks)
+
+        if landmarks is None:
+            self._prev_key = None
+            self._last_key = None
+        else:
+            self._prev_key = self._last_key
+            self._last_key = (self.frame_idx, landmarks)
+
+        return result
+
+
+
+def subsample_landmarks(landmark_seq, stride, mode = 'extrapolate'):
+    # Simulates running inference every `stride` frames on a full-rate (num_frames, 33, 4) landmark
+    # sequence. Frames in between are extrapolated from the previous keyframes (what the live
+    # wrapper does) or, with mode='interpolate', interpolated between the surrounding keyframes
+    # (only possible offline).
+    if mode not in ('extrapolate', 'interpolate'):
+        raise ValueError("mode needs to be either 'extrapolate' or 'interpolate'")
+
+    out = landmark_seq.copy()
+    num_frames = len(landmark_seq)
+    keys = list(range(0, num_frames, stride))
+
+    for i, key in enumerate(keys):
+        stop = keys[i + 1] if i + 1 < len(keys) else num_frames
+        last_lm = landmark_seq[key]
+
+        for idx in range(key + 1, stop):
+            if np.isnan(last_lm[0, 0]):
+                out[idx] = last_lm
+            elif mode == 'interpolate' and stop < num_frames and not np.isnan(landmark_seq[stop][0, 0]):
+                w = (idx - key) / (stop - key)
+                out[idx] = (1 - w) * last_lm + w * landmark_seq[stop]
+            else:
+                prev_lm = landmark_seq[key - stride] if key >= stride else None
+                if prev_lm is not None and np.isnan(prev_lm[0, 0]):
+                    prev_lm = None
+                out[idx] = _extrapolate(prev_lm, last_lm, stride, idx - key)
+
+    return out
+
+
+
+def compare_cadence(landmark_seq, exercise, frame_shape, fps, strides = (2, 3), mode = 'extrapolate'):
+    # Reports how rep counts at reduced inference cadence differ from the full-rate run.
+    from batch_process import replay_landmarks
+
+    full = replay_landmarks(landmark_seq, exercise, frame_shape, fps)
+    report = {'full_rate': {'correct': full['correct'], 'incorrect': full['incorrect']}, 'strides': {}}
+
+    for stride in strides:
+        reduced = replay_landmarks(subsample_landmarks(landmark_seq, stride, mode), exercise, frame_shape, fps)
+        report['strides'][stride] = {
+            'inference_hz'    : round(fps / stride, 2),
+            'correct'         : reduced['correct'],
+            'incorrect'       : reduced['incorrect'],
+            'correct_diff'    : reduced['correct'] - full['correct'],
+            'incorrect_diff'  : reduced['incorrect'] - full['incorrect'],
+        }
+
+    return report
@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import deque
+
+from pose_replay import PrecomputedPose
+
+
+# Pipelined frame processing for the WebRTC callback.
+#
+#   ingest (callback thread) --[ingest queue]--> inference thread (pose.process)
+#                            --[render queue]--> render thread (ProcessFrame.process)
+#                            --> latest completed frame, read back by the callback
+#
+# Every queue is bounded and keeps only the newest items: when a stage falls behind, the oldest
+# pending frame is dropped instead of building up latency. The callback never waits on inference.
+
+
+
+class LatestQueue:
+    # Bounded queue with a latest-item-wins drop policy.
+    def __init__(self, maxsize = 1):
+        self.maxsize = maxsize
+        self.drops = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+
+
+    def __len__(self):
+        return len(self._items)
+
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.drops += 1
+            self._items.append(item)
+            self._cond.notify()
+
+
+    def get(self, timeout = None):
+        # Returns None on timeout.
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+
+
+class AsyncFrameProcessor:
+    def __init__(self, processor, pose, queue_size = 1, poll_interval = 0.1):
+        self.processor = processor
+        self.pose = pose
+        self.poll_interval = poll_interval
+
+        self.ingest_queue = LatestQueue(queue_size)
+        self.render_queue = LatestQueue(queue_size)
+
+        # Most recent completed analysis, swapped atomically by the render thread.
+        self._latest_frame = None
+        self._latest_ingest_time = None
+
+        # play_sound values are queued so none are lost when the callback skips results.
+        self.sounds = deque(maxlen = 32)
+
+        self.submitted = 0
+        self.completed = 0
+        self.last_latency = None
+
+        self._running = True
+        self._threads = [
+            threading.Thread(target = self._inference_loop, name = 'pose-inference', daemon = True),
+            threading.Thread(target = self._render_loop, name = 'pose-render', daemon = True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+
+    def submit(self, frame):
+        # Never blocks: a frame still waiting in the ingest queue is replaced.
+        self.submitted += 1
+        self.ingest_queue.put((frame, time.perf_counter()))
+
+
+    def latest(self):
+        # Most recent annotated frame, or None until the first frame has gone through the pipeline.
+        return self._latest_frame
+
+
+    def process(self, frame):
+        # Callback helper: submit the new frame and return the newest finished one (or the input).
+        self.submit(frame)
+        latest = self._latest_frame
+
+        return frame if latest is None else latest
+
+
+    def pop_sound(self):
+        return self.sounds.popleft() if self.sounds else None
+
+
+    def stats(self):
+        return {
+            'ingest_depth' : len(self.ingest_queue),
+            'render_depth' : len(self.render_queue),
+            'ingest_drops' : self.ingest_queue.drops,
+            'render_drops' : self.render_queue.drops,
+            'submitted'    : self.submitted,
+            'completed'    : self.completed,
+            'last_latency' : self.last_latency,
+        }
+
+
+    def stop(self, timeout = 1.0):
+        self._running = False
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+    def _inference_loop(self):
+        while self._running:
+            item = self.ingest_queue.get(self.poll_interval)
+            if item is None:
+                continue
+
+            frame, ingest_time = item
+            start = time.perf_counter()
+            keypoints = self.pose.process(frame)
+            self.render_queue.put((frame, keypoints, time.perf_counter() - start, ingest_time))
+
+
+    def _render_loop(self):
+        precomputed = PrecomputedPose()
+
+        while self._running:
+            item = self.render_queue.get(self.poll_interval)
+            if item is None:
+                continue
+
+            frame, keypoints, inference_seconds, ingest_time = item
+            precomputed.result, precomputed.inference_seconds = keypoints, inference_seconds
+
+            frame, play_sound = self.processor.process(frame, precomputed)
+
+            if play_sound is not None:
+                self.sounds.append(play_sound)
+
+            self._latest_frame = frame
+            self.completed += 1
+            self.last_latency = time.perf_counter() - ingest_time
@@ -0,0 +1,294 @@
+import os
+import threading
+import wave
+from collections import deque
+
+import numpy as np
+
+
+# Spoken / audible feedback for the play_sound values of the processors ('1', '2', ...,
+# 'incorrect', 'reset_counters').
+#
+# CueCache decodes every clip once into 48 kHz mono int16 PCM (wave for .wav, PyAV for anything
+# else) and synthesizes a short tone for every cue without a clip, so nothing is decoded or read
+# from disk after startup. One cache is shared by all sessions of the process.
+#
+# CueMixer is per session. trigger() only appends the cue name to a deque, so the frame path never
+# waits. A dedicated thread mixes the active cues into a small ring buffer that it keeps at most
+# `lead` seconds ahead of playback; the WebRTC audio callback only copies samples out of the ring.
+# A cue therefore starts playing at most `lead` seconds after it was triggered.
+
+SAMPLE_RATE = 48000
+
+CUE_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.m4a', '.flac')
+
+# Rep counts with their own cue; higher counts use the generic 'rep' cue.
+MAX_COUNT_CUE = 50
+
+DEFAULT_LEAD = 0.04
+BLOCK_SECONDS = 0.01
+
+
+
+def _tone(freqs, seconds, gain = 0.3):
+    # Sine tones played one after another, with short fades against clicks.
+    parts = []
+    for freq in freqs:
+        t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+        part = np.sin(2 * np.pi * freq * t)
+
+        fade = min(len(part) // 4, int(SAMPLE_RATE * 0.005))
+        part[:fade] *= np.linspace(0, 1, fade)
+        part[len(part) - fade:] *= np.linspace(1, 0, fade)
+
+        parts.append(part)
+        parts.append(np.zeros(int(SAMPLE_RATE * 0.03)))
+
+    return (np.concatenate(parts) * gain * 32767).astype(np.int16)
+
+
+
+# Fallbacks when no clip is available: a high beep per good rep, a low double buzz for an
+# incorrect one, a falling sweep for a counter reset.
+SYNTH_CUES = {
+    'rep'            : lambda: _tone((880,), 0.12),
+    'incorrect'      : lambda: _tone((220, 220), 0.12),
+    'reset_counters' : lambda: _tone((660, 440, 330), 0.1),
+}
+
+
+
+def _resample(samples, rate):
+    if rate == SAMPLE_RATE or not len(samples):
+        return samples
+
+    positions = np.arange(int(len(samples) * SAMPLE_RATE / rate)) * (rate / SAMPLE_RATE)
+    return np.interp(positions, np.arange(len(samples)), samples)
+
+
+
+def _decode_wav(path):
+    with wave.open(path, 'rb') as f:
+        if f.getsampwidth() != 2:
+            raise ValueError('Only 16 bit PCM wav files are read directly')
+
+        channels, rate = f.getnchannels(), f.getframerate()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16).reshape(-1, channels)
+
+    return _resample(samples.mean(axis=1), rate).astype(np.int16)
+
+
+
+def _decode_av(path):
+    import av
+
+    resampler = av.AudioResampler(format='s16', layout='mono', rate=SAMPLE_RATE)
+    chunks = []
+
+    with av.open(path) as container:
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                chunks.append(out.to_ndarray().reshape(-1))
+
+    for out in resampler.resample(None):
+        chunks.append(out.to_ndarray().reshape(-1))
+
+    return np.concatenate(chunks).astype(np.int16) if chunks else np.zeros(0, dtype=np.int16)
+
+
+
+def decode_clip(path):
+    if path.endswith('.wav'):
+        try:
+            return _decode_wav(path)
+        except (ValueError, wave.Error):
+            pass
+
+    return _decode_av(path)
+
+
+
+class CueCache:
+    # Immutable name -> int16 PCM mapping, built once.
+    def __init__(self, cue_dir = None, max_count = MAX_COUNT_CUE):
+        self.cues = {}
+        self.decoded = 0
+        self.synthesized = 0
+        self.errors = {}
+
+        names = [str(count) for count in range(1, max_count + 1)] + list(SYNTH_CUES)
+        clips = {}
+
+        if cue_dir and os.path.isdir(cue_dir):
+            for filename in os.listdir(cue_dir):
+                name, ext = os.path.splitext(filename)
+                if ext.lower() in CUE_EXTENSIONS:
+                    clips[name] = os.path.join(cue_dir, filename)
+
+        for name in set(names) | set(clips):
+            samples = None
+
+            if name in clips:
+                try:
+                    samples = decode_clip(clips[name])
+                    self.decoded += 1
+                except Exception as e:
+                    self.errors[name] = repr(e)
+
+            if samples is None and name in SYNTH_CUES:
+                samples = SYNTH_CUES[name]()
+                self.synthesized += 1
+
+            if samples is not None:
+                samples.setflags(write=False)
+                self.cues[name] = samples
+
+        if 'rep' not in self.cues:
+            self.cues['rep'] = SYNTH_CUES['rep']()
+
+
+    def get(self, name):
+        # Rep counts without their own clip fall back to the generic rep cue.
+        samples = self.cues.get(name)
+        if samples is None and name.isdigit():
+            samples = self.cues['rep']
+
+        return samples
+
+
+    def stats(self):
+        return {
+            'cues'        : len(self.cues),
+            'decoded'     : self.decoded,
+            'synthesized' : self.synthesized,
+            'errors'      : self.errors,
+        }
+
+
+
+class CueMixer:
+    def __init__(self, cache, lead = DEFAULT_LEAD, capacity = 0.5, gain = 1.0):
+        self.cache = cache
+        self.gain = gain
+
+        self._block = int(SAMPLE_RATE * BLOCK_SECONDS)
+        self._lead = max(self._block, int(SAMPLE_RATE * lead))
+
+        # Ring buffer of mixed samples; _read and _write only ever grow.
+        self._ring = np.zeros(max(int(SAMPLE_RATE * capacity), 2 * self._lead), dtype=np.int16)
+        self._read = 0
+        self._write = 0
+        self._mix = np.zeros(self._block, dtype=np.int32)
+
+        self._triggers = deque(maxlen = 16)
+        self._voices = []
+
+        self.triggered = 0
+        self.unknown = 0
+        self.underruns = 0
+
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target = self._run, name = 'cue-mixer', daemon = True)
+        self._thread.start()
+
+
+    def trigger(self, name):
+        # Frame path: never blocks.
+        self._triggers.append(name)
+        self.triggered += 1
+
+
+    def read(self, num_samples):
+        # Audio callback: returns the next num_samples mixed samples (silence on underrun).
+        out = np.zeros(num_samples, dtype=np.int16)
+
+        with self._cond:
+            available = min(num_samples, self._write - self._read)
+            if available < num_samples:
+                self.underruns += 1
+
+            start = self._read % len(self._ring)
+            first = min(available, len(self._ring) - start)
+            out[:first] = self._ring[start:start + first]
+            out[first:available] = self._ring[:available - first]
+
+            self._read += available
+            self._cond.notify()
+
+        return out
+
+
+    def stats(self):
+        return {
+            'triggered' : self.triggered,
+            'unknown'   : self.unknown,
+            'playing'   : len(self._voices),
+            'underruns' : self.underruns,
+        }
+
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(1.0)
+
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Stay at most `lead` ahead of playback so new cues are heard quickly.
+                while self._running and self._write - self._read >= self._lead:
+                    self._cond.wait()
+                if not self._running:
+                    return
+
+            self._render_block()
+
+
+    def _render_block(self):
+        while self._triggers:
+            name = self._triggers.popleft()
+            samples = self.cache.get(name)
+            if samples is None:
+                self.unknown += 1
+            else:
+                self._voices.append([samples, 0])
+
+        mix = self._mix
+        mix[:] = 0
+
+        for voice in self._voices:
+            samples, pos = voice
+            chunk = samples[pos:pos + self._block]
+            mix[:len(chunk)] += chunk
+            voice[1] = pos + self._block
+
+        self._voices = [voice for voice in self._voices if voice[1] < len(voice[0])]
+
+        if self.gain != 1.0:
+            mix = (mix * self.gain).astype(np.int32)
+        block = np.clip(mix, -32768, 32767).astype(np.int16)
+
+        with self._cond:
+            start = self._write % len(self._ring)
+            first = min(self._block, len(self._ring) - start)
+            self._ring[start:start + first] = block[:first]
+            self._ring[:self._block - first] = block[first:]
+            self._write += self._block
+
+
+
+def make_audio_frame(mixer, source):
+    # Replaces the content of an incoming (microphone) av.AudioFrame with the mixed cues; the mic
+    # itself is not sent back so the member doesn't hear themselves.
+    import av
+
+    num_samples = int(source.samples * SAMPLE_RATE / source.sample_rate)
+    out = av.AudioFrame.from_ndarray(mixer.read(num_samples).reshape(1, -1), format='s16', layout='mono')
+    out.sample_rate = SAMPLE_RATE
+    out.pts = source.pts
+    out.time_base = source.time_base
+
+    return out
@@ -0,0 +1,308 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from landmark_trace import TRACE_SUFFIX
+from media_clock import MediaClock
+from pose_replay import NUM_LANDMARKS, ReplayPose, landmarks_to_array
+
+
+# Headless analysis of recorded workout videos.
+#
+# Pose inference is by far the most expensive step, so it is run over fixed-size segments of the
+# video in a process pool (one MediaPipe graph per worker process). The per-segment landmark
+# results are then concatenated in frame order and replayed through a single ProcessFrame /
+# ProcessFrame2 instance, so state_seq, the counters and the inactivity timers carry over segment
+# boundaries exactly as they would in a live session. Inactivity is timed with the frames'
+# presentation timestamps (a MediaClock), not the wall clock, so the result does not depend on how
+# much faster than real time the replay runs.
+
+EXERCISES = {
+    'bicep_curls': ('process_frame', 'ProcessFrame', 'get_bicep_curl_thresholds'),
+    'squats'     : ('process_frame2', 'ProcessFrame2', 'get_thresholds'),
+}
+
+DEFAULT_SEGMENT_FRAMES = 900
+
+
+# Pose graph owned by each worker process.
+_worker_pose = None
+
+
+
+def _init_worker(pose_kwargs):
+    global _worker_pose
+    from utils import get_mediapipe_pose
+
+    _worker_pose = get_mediapipe_pose(**pose_kwargs)
+
+
+
+def _infer_segment(segment):
+    video_path, start, stop = segment
+
+    cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    landmarks = []
+    timestamps = []
+    idx = start
+
+    while stop is None or idx < stop:
+        ok, frame = cap.read()
+        if not ok:
+            break
+
+        # Presentation time of the frame just read.
+        timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+
+        keypoints = _worker_pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        lm_array = landmarks_to_array(keypoints.pose_landmarks)
+
+        if lm_array is None:
+            lm_array = np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+
+        landmarks.append(lm_array)
+        idx += 1
+
+    cap.release()
+
+    if not landmarks:
+        return start, np.empty((0, NUM_LANDMARKS, 4), dtype=np.float32), []
+
+    return start, np.stack(landmarks), timestamps
+
+
+
+def probe_video(video_path):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError('Could not open video: {}'.format(video_path))
+
+    info = {
+        'frame_count': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        'fps'        : cap.get(cv2.CAP_PROP_FPS) or 30.0,
+        'width'      : int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height'     : int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    }
+    cap.release()
+
+    return info
+
+
+
+def frame_timestamps(timestamps, num_frames, fps):
+    # Container timestamps when the capture backend reports usable ones (increasing, not all
+    # zero), else frame_idx / fps.
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+
+    if len(timestamps) == num_frames and num_frames > 1 and timestamps[-1] > 0 and np.all(np.diff(timestamps) > 0):
+        return timestamps
+
+    return np.arange(num_frames) / fps
+
+
+
+def split_segments(video_path, frame_count, segment_frames):
+    # The last segment is open-ended since CAP_PROP_FRAME_COUNT is only an estimate for some containers.
+    starts = list(range(0, max(frame_count, 1), segment_frames))
+    segments = [(video_path, start, start + segment_frames) for start in starts[:-1]]
+    segments.append((video_path, starts[-1], None))
+
+    return segments
+
+
+
+def infer_landmarks(video_path, workers = None, segment_frames = DEFAULT_SEGMENT_FRAMES, pose_kwargs = None):
+    # Runs pose inference over the whole video and returns a (num_frames, 33, 4) float32 array.
+    # Frames without a detected pose are filled with NaN. info['timestamps'] holds the
+    # presentation time of every frame in seconds.
+    info = probe_video(video_path)
+    segments = split_segments(video_path, info['frame_count'], segment_frames)
+
+    with ProcessPoolExecutor(max_workers = workers, initializer = _init_worker, initargs = (pose_kwargs or {},)) as pool:
+        results = list(pool.map(_infer_segment, segments))
+
+    # pool.map preserves submission order, but sort anyway so stitching never depends on it.
+    results.sort(key = lambda r: r[0])
+
+    landmark_seq = np.concatenate([lm for _, lm, _ in results])
+    info['timestamps'] = frame_timestamps([t for _, _, ts in results for t in ts], len(landmark_seq), info['fps'])
+
+    return landmark_seq, info
+
+
+
+def make_processor(exercise, flip_frame = False, render = True, clock = time.perf_counter):
+    import importlib
+
+    module_name, class_name, thresholds_fn = EXERCISES[exercise]
+    processor_cls = getattr(importlib.import_module(module_name), class_name)
+    thresholds = getattr(importlib.import_module('thresholds'), thresholds_fn)()
+
+    return processor_cls(thresholds = thresholds, flip_frame = flip_frame, render = render, clock = clock)
+
+
+
+def replay_landmarks(landmark_seq, exercise, frame_shape, fps, video_path = None, output_path = None, timestamps = None):
+    # Runs the exercise state machine over precomputed landmarks in frame order. If output_path is
+    # given the original frames are decoded again and the annotated result is written out;
+    # otherwise nothing is drawn. The processor's clock follows timestamps (seconds per frame),
+    # or frame_idx / fps without them.
+    render = output_path is not None
+    clock = MediaClock()
+    processor = make_processor(exercise, render = render, clock = clock)
+    replay_pose = ReplayPose(landmark_seq)
+    start_time = timestamps[0] if timestamps is not None and len(timestamps) else 0.0
+
+    cap = None
+    writer = None
+    canvas = np.zeros(frame_shape, dtype=np.uint8)
+
+    if render:
+        cap = cv2.VideoCapture(video_path)
+        writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (frame_shape[1], frame_shape[0]))
+
+    events = []
+
+    for frame_idx in range(len(replay_pose)):
+        if timestamps is not None:
+            clock.set(timestamps[frame_idx] - start_time)
+        else:
+            clock.set_frame_index(frame_idx, fps)
+
+        if cap is not None:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            frame, play_sound = processor.process(frame, replay_pose)
+            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        else:
+            play_sound = processor.process(canvas, replay_pose).event
+
+        if play_sound is not None:
+            events.append({'frame': frame_idx, 'time': round(clock(), 3), 'event': play_sound})
+
+    if cap is not None:
+        cap.release()
+        writer.release()
+
+    return {
+        'exercise'      : exercise,
+        'frames'        : len(replay_pose),
+        'correct'       : processor.state.correct,
+        'incorrect'     : processor.state.incorrect,
+        'events'        : events,
+    }
+
+
+
+def analyse_video(video_path, exercise, workers = None, segment_frames = DEFAULT_SEGMENT_FRAMES, output_path = None, pose_kwargs = None,
+                  cadence_strides = None, trace_path = None, smooth = False):
+    landmark_seq, info = infer_landmarks(video_path, workers, segment_frames, pose_kwargs)
+    frame_shape = (info['height'], info['width'], 3)
+
+    # Traces keep the raw model output.
+    if trace_path:
+        from landmark_trace import save_trace
+        save_trace(trace_path, landmark_seq, info['fps'], frame_shape, timestamps = info['timestamps'], meta = {'video': os.path.basename(video_path)})
+
+    if smooth:
+        from landmark_filter import smooth_landmarks
+        landmark_seq = smooth_landmarks(landmark_seq, info['fps'], info['timestamps'])
+
+    summary = replay_landmarks(
+                                landmark_seq,
+                                exercise,
+                                frame_shape,
+                                info['fps'],
+                                video_path = video_path,
+                                output_path = output_path,
+                                timestamps = info['timestamps']
+                              )
+    summary['video'] = video_path
+
+    if cadence_strides:
+        from adaptive_pose import compare_cadence
+        summary['cadence'] = compare_cadence(landmark_seq, exercise, frame_shape, info['fps'], cadence_strides)
+
+    return summary
+
+
+
+def analyse_trace(trace_path, exercise, cadence_strides = None, smooth = False):
+    # Re-analyses a recorded landmark trace without decoding the video or running inference.
+    from landmark_trace import TraceReader
+
+    with TraceReader(trace_path) as reader:
+        fps = reader.fps or 30.0
+        frame_shape = reader.frame_shape or (720, 1280, 3)
+
+        landmark_seq = reader
+        if smooth:
+            from landmark_filter import smooth_landmarks
+            landmark_seq = smooth_landmarks(reader.landmarks(), fps, reader.timestamps)
+
+        summary = replay_landmarks(landmark_seq, exercise, frame_shape, fps, timestamps = reader.timestamps)
+        summary['trace'] = trace_path
+
+        if cadence_strides:
+            from adaptive_pose import compare_cadence
+            summary['cadence'] = compare_cadence(reader.landmarks(), exercise, frame_shape, fps, cadence_strides)
+
+    return summary
+
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Analyse recorded workout videos without Streamlit or WebRTC.')
+    parser.add_argument('videos', nargs = '+', help = 'Input video files, or landmark traces (.lmtrace) to re-analyse without inference.')
+    parser.add_argument('--exercise', choices = sorted(EXERCISES), required = True)
+    parser.add_argument('--workers', type = int, default = os.cpu_count(), help = 'Number of inference processes.')
+    parser.add_argument('--segment-frames', type = int, default = DEFAULT_SEGMENT_FRAMES, help = 'Frames per inference segment.')
+    parser.add_argument('--output-dir', help = 'Write annotated videos into this directory.')
+    parser.add_argument('--json', help = 'Write the per-video summaries to this file instead of stdout.')
+    parser.add_argument('--model-complexity', type = int, default = 1, choices = (0, 1, 2))
+    parser.add_argument('--compare-cadence', type = lambda v: [int(x) for x in v.split(',')], default = None,
+                        help = 'Comma separated inference strides to compare against the full-rate rep counts, e.g. 2,3.')
+    parser.add_argument('--trace-dir', help = 'Record the inferred landmarks of every video as a trace into this directory.')
+    parser.add_argument('--smooth', action = 'store_true', help = 'One-Euro filter the landmarks before counting reps (recommended with --model-complexity 0).')
+    args = parser.parse_args(argv)
+
+    pose_kwargs = {'model_complexity': args.model_complexity}
+    summaries = []
+
+    for video_path in args.videos:
+        if video_path.endswith(TRACE_SUFFIX):
+            summaries.append(analyse_trace(video_path, args.exercise, args.compare_cadence, args.smooth))
+            continue
+
+        trace_path = None
+        if args.trace_dir:
+            os.makedirs(args.trace_dir, exist_ok = True)
+            trace_path = os.path.join(args.trace_dir, os.path.splitext(os.path.basename(video_path))[0] + TRACE_SUFFIX)
+
+        output_path = None
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok = True)
+            output_path = os.path.join(args.output_dir, os.path.splitext(os.path.basename(video_path))[0] + '_annotated.mp4')
+
+        summaries.append(analyse_video(video_path, args.exercise, args.workers, args.segment_frames, output_path, pose_kwargs,
+                                       args.compare_cadence, trace_path, args.smooth))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summaries, f, indent = 2)
+    else:
+        print(json.dumps(summaries, indent = 2))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,423 @@
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from landmark_trace import load_landmarks
+from pose_replay import NUM_LANDMARKS, pose_result_from_array
+
+
+# Reproducible performance benchmarks for the frame processors and the drawing helpers.
+#
+# Pose inference is replaced by FakePose, which replays synthetic (or recorded) landmark
+# sequences deterministically, so the numbers only reflect our own per-frame code. Results are
+# written as JSON and can be compared against a previous run with --baseline.
+
+RESOLUTIONS = {
+    '480p' : (480, 640),
+    '720p' : (720, 1280),
+    '1080p': (1080, 1920),
+}
+
+EXERCISES = ('bicep_curls', 'squats')
+
+# Relative slowdown against the baseline that is reported as a regression.
+REGRESSION_TOLERANCE = 0.10
+
+
+
+def synthetic_landmarks(exercise, num_frames = 300, period = 60, noise = 0.002, seed = 0):
+    # Side-view landmark sequence of repeated reps, as a (num_frames, 33, 4) float32 array.
+    rng = np.random.default_rng(seed)
+    seq = np.zeros((num_frames, NUM_LANDMARKS, 4), dtype=np.float32)
+    seq[:, :, 3] = 1.0
+
+    # Non-square frames stretch normalized x; keep limbs straight at 16:9.
+    aspect = np.array([0.5625, 1.0])
+
+    for t in range(num_frames):
+        phase = 0.5 - 0.5 * np.cos(2 * np.pi * t / period)
+        lm = np.zeros((NUM_LANDMARKS, 2))
+
+        shoulder = np.array([0.5, 0.3])
+        hip = np.array([0.5, 0.55])
+        knee = np.array([0.5, 0.72])
+        ankle = np.array([0.5, 0.9])
+        foot = np.array([0.55, 0.92])
+
+        if exercise == 'bicep_curls':
+            elbow = shoulder + [0.0, 0.12]
+            forearm = np.deg2rad(20 + phase * 125)
+            wrist = elbow + 0.1 * np.array([np.sin(forearm), np.cos(forearm)]) * aspect
+        else:
+            thigh = np.deg2rad(8 + phase * 80)
+            hip = knee + 0.17 * np.array([-np.sin(thigh), -np.cos(thigh)]) * aspect
+            shoulder = hip + [0.02, -0.25]
+            elbow = shoulder + [0.0, 0.12]
+            wrist = elbow + [0.0, 0.1]
+
+        lm[0] = (0.52, 0.15)
+
+        # The left side faces the camera; the right side is slightly foreshortened.
+        for ids, scale in (((11, 13, 15, 23, 25, 27, 31), 1.0), ((12, 14, 16, 24, 26, 28, 32), 0.9)):
+            for idx, point in zip(ids, (shoulder, elbow, wrist, hip, knee, ankle, foot)):
+                lm[idx] = (point[0] + (1.0 - scale) * 0.1, point[1] * scale)
+
+        seq[t, :, :2] = lm + rng.normal(0, noise, lm.shape)
+
+    return seq
+
+
+
+class FakePose:
+    # Deterministic stand-in for the MediaPipe pose object: replays a landmark sequence in a loop.
+    def __init__(self, landmark_seq):
+        self.results = [pose_result_from_array(lm) for lm in landmark_seq]
+        self.index = 0
+
+
+    def process(self, frame):
+        result = self.results[self.index % len(self.results)]
+        self.index += 1
+        return result
+
+
+
+def _make_processor(exercise, flip_frame = True, render = True):
+    from batch_process import make_processor
+    return make_processor(exercise, flip_frame = flip_frame, render = render)
+
+
+
+def _time_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+
+def run_micro_benchmarks(repeat = 2000):
+    from utils import draw_text, draw_text_cached, draw_rounded_rect, draw_dotted_line, find_angle, get_joint_angles
+
+    frame = np.zeros(RESOLUTIONS['720p'] + (3,), dtype=np.uint8)
+    coords = (synthetic_landmarks('squats', 1)[0, :, :2] * (1280, 720)).astype(np.int64)
+    p1, p2, ref = np.array([640, 200]), np.array([640, 0]), np.array([660, 400])
+
+    cases = {
+        'draw_text'         : lambda: draw_text(frame, 'CORRECT: 12', pos=(870, 30), font_scale=0.7),
+        'draw_text_cached'  : lambda: draw_text_cached(frame, 'CORRECT: 12', pos=(870, 30), font_scale=0.7),
+        'draw_rounded_rect' : lambda: draw_rounded_rect(frame, (850, 20), (1050, 60), 8, (18, 185, 0)),
+        'draw_dotted_line'  : lambda: draw_dotted_line(frame, ref, ref[1] - 50, ref[1] + 20, (0, 127, 255)),
+        'find_angle'        : lambda: find_angle(p1, p2, ref),
+        'get_joint_angles'  : lambda: get_joint_angles(coords),
+    }
+
+    return {name: {'us_per_call': round(_time_call(fn, repeat) * 1e6, 3)} for name, fn in cases.items()}
+
+
+
+def _wrap_stage(processor, method_name, totals, stage):
+    method = getattr(processor, method_name)
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        totals[stage] += time.perf_counter() - start
+        return result
+
+    setattr(processor, method_name, timed)
+
+
+
+def run_frame_benchmark(exercise, resolution, landmark_seq, num_frames = 300, warmup = 30, render = True):
+    height, width = RESOLUTIONS[resolution]
+    base = np.full((height, width, 3), 40, dtype=np.uint8)
+    frame = base.copy()
+
+    processor = _make_processor(exercise, render = render)
+    pose = FakePose(landmark_seq)
+
+    # Per-stage timers. Drawing includes flipping, which is reported (and subtracted) separately.
+    totals = dict.fromkeys(('geometry', 'state_machine', 'drawing', 'flip'), 0.0)
+    _wrap_stage(processor, '_geometry', totals, 'geometry')
+    _wrap_stage(processor, '_select_side', totals, 'geometry')
+    for name in ('_update_aligned', '_update_misaligned', '_update_no_pose', '_expire_feedback'):
+        _wrap_stage(processor, name, totals, 'state_machine')
+    for name in ('_draw_aligned', '_draw_misaligned', '_draw_no_pose'):
+        _wrap_stage(processor, name, totals, 'drawing')
+    _wrap_stage(processor, '_flip', totals, 'flip')
+
+    for _ in range(warmup):
+        np.copyto(frame, base)
+        processor.process(frame, pose)
+
+    for stage in totals:
+        totals[stage] = 0.0
+
+    elapsed = 0.0
+    for _ in range(num_frames):
+        np.copyto(frame, base)
+        start = time.perf_counter()
+        processor.process(frame, pose)
+        elapsed += time.perf_counter() - start
+
+    stages_ms = {stage: round(total / num_frames * 1e3, 4) for stage, total in totals.items()}
+    stages_ms['drawing'] = round((totals['drawing'] - totals['flip']) / num_frames * 1e3, 4)
+
+    # Allocation profile: transient bytes per frame (peak above the starting point) and memory
+    # still held after the run.
+    tracemalloc.start()
+    retained_start = tracemalloc.get_traced_memory()[0]
+    peak_total = 0
+    for _ in range(min(num_frames, 100)):
+        np.copyto(frame, base)
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        processor.process(frame, pose)
+        peak_total += tracemalloc.get_traced_memory()[1] - current
+    retained = tracemalloc.get_traced_memory()[0] - retained_start
+    tracemalloc.stop()
+
+    return {
+        'fps'                 : round(num_frames / elapsed, 1),
+        'ms_per_frame'        : round(elapsed / num_frames * 1e3, 4),
+        'stages_ms'           : stages_ms,
+        'alloc_bytes_per_frame': int(peak_total / min(num_frames, 100)),
+        'retained_bytes'      : int(retained),
+    }
+
+
+
+# Largest allocation (tracemalloc peak above the frame's starting point, in bytes) a steady-state
+# frame may make per stage and in the whole process() call; --check-allocations fails above these.
+# The state machine allocates nothing but loop iterators; geometry and drawing keep a few small
+# NumPy temporaries. Frames that complete a rep or reset the counters are not steady state: they
+# create the play_sound string and render a new counter text. 'retained' is for the whole run
+# and covers interpreter free lists filling up; a single object leaked per frame exceeds it.
+ALLOCATION_BUDGETS = {
+    'geometry'      : 5120,
+    'state_machine' : 160,
+    'drawing'       : 2048,
+    'frame'         : 5120,
+    'retained'      : 2048,
+}
+
+ALLOCATION_STAGES = {
+    'geometry'      : ('_geometry', '_select_side'),
+    'state_machine' : ('_update_aligned', '_update_misaligned', '_update_no_pose', '_expire_feedback'),
+    'drawing'       : ('_draw_aligned', '_draw_misaligned', '_draw_no_pose', '_analysis'),
+}
+
+
+
+def _trace_stage(processor, method_name, peaks, stage):
+    # Like _wrap_stage, but records the stage's tracemalloc peak for the current frame in
+    # peaks[stage] and the highest absolute peak in peaks[-1]. peaks is an int64 array, so the
+    # measurement itself leaves no Python ints behind.
+    method = getattr(processor, method_name)
+
+    def traced(*args, **kwargs):
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = method(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+
+        peaks[stage] = max(peaks[stage], peak - start)
+        peaks[-1] = max(peaks[-1], peak)
+        return result
+
+    setattr(processor, method_name, traced)
+
+
+
+def _traced_call(fn, *args):
+    # (bytes allocated before, after, tracemalloc peak) around one call.
+    start = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    fn(*args)
+    current, peak = tracemalloc.get_traced_memory()
+
+    return start, current, peak
+
+
+
+def check_allocations(exercise, resolution, landmark_seq, num_frames = 300, render = True):
+    # Runs the whole process() path (fake pose, geometry, state machine, drawing or analysis) and
+    # records, per steady-state frame, the tracemalloc peak of every stage and of the frame. The
+    # warm-up pass goes once through the landmark sequence so cached texts are already rendered.
+    # retained_bytes is the memory steady-state frames left allocated, summed over the run.
+    height, width = RESOLUTIONS[resolution]
+    base = np.full((height, width, 3), 40, dtype=np.uint8)
+    frame = base.copy()
+
+    processor = _make_processor(exercise, render = render)
+    pose = FakePose(landmark_seq)
+
+    for _ in range(len(landmark_seq)):
+        np.copyto(frame, base)
+        processor.process(frame, pose)
+
+    # Per stage, then the frame, then the highest absolute peak (see _trace_stage).
+    names = list(ALLOCATION_STAGES) + ['frame']
+    peaks = np.zeros(len(names) + 1, dtype=np.int64)
+    for stage, method_names in enumerate(ALLOCATION_STAGES.values()):
+        for name in method_names:
+            _trace_stage(processor, name, peaks, stage)
+
+    worst = np.zeros(len(names), dtype=np.int64)
+    total = np.zeros(len(names), dtype=np.int64)
+    measured = 0
+    retained = 0
+
+    tracemalloc.start()
+
+    # Reading the counters leaves a tuple and two ints behind; subtract what that costs.
+    overhead = int(np.median([current - start for start, current, _ in (_traced_call(lambda *args: None, frame, pose) for _ in range(16))]))
+
+    for _ in range(num_frames):
+        np.copyto(frame, base)
+        counts = (processor.state.correct, processor.state.incorrect)
+        peaks.fill(0)
+
+        start, current, peak = _traced_call(processor.process, frame, pose)
+        peaks[-2] = max(peak, peaks[-1]) - start
+
+        if counts == (processor.state.correct, processor.state.incorrect):
+            measured += 1
+            retained += current - start - overhead
+            np.maximum(worst, peaks[:-1], out = worst)
+            total += peaks[:-1]
+    tracemalloc.stop()
+
+    return {
+        'frames'         : measured,
+        'max_bytes'      : dict(zip(names, worst.tolist())),
+        'mean_bytes'     : {stage: round(value / max(measured, 1), 1) for stage, value in zip(names, total.tolist())},
+        'retained_bytes' : retained,
+    }
+
+
+
+def allocation_failures(entry, budgets = ALLOCATION_BUDGETS):
+    failures = ['{} {} B > {} B'.format(stage, entry['max_bytes'][stage], budget)
+                for stage, budget in budgets.items() if stage in entry['max_bytes'] and entry['max_bytes'][stage] > budget]
+    if entry['retained_bytes'] > budgets['retained']:
+        failures.append('retained {} B > {} B'.format(entry['retained_bytes'], budgets['retained']))
+
+    return failures
+
+
+
+def run_benchmarks(resolutions = tuple(RESOLUTIONS), exercises = EXERCISES, num_frames = 300, landmark_seq = None, micro_repeat = 2000):
+    results = {
+        'meta': {
+            'python'   : platform.python_version(),
+            'numpy'    : np.__version__,
+            'opencv'   : cv2.__version__,
+            'machine'  : platform.machine(),
+            'frames'   : num_frames,
+            'landmarks': 'recorded' if landmark_seq is not None else 'synthetic',
+        },
+        'micro': run_micro_benchmarks(micro_repeat),
+        'frames': {},
+        'allocations': {},
+    }
+
+    for exercise in exercises:
+        seq = landmark_seq if landmark_seq is not None else synthetic_landmarks(exercise)
+        for resolution in resolutions:
+            results['frames']['{}/{}'.format(exercise, resolution)] = run_frame_benchmark(exercise, resolution, seq, num_frames)
+
+        # Headless (render=False) cost does not depend on the resolution.
+        results['frames']['{}/headless'.format(exercise)] = run_frame_benchmark(exercise, resolutions[0], seq, num_frames, render = False)
+
+        results['allocations']['{}/{}'.format(exercise, resolutions[0])] = check_allocations(exercise, resolutions[0], seq, num_frames)
+        results['allocations']['{}/headless'.format(exercise)] = check_allocations(exercise, resolutions[0], seq, num_frames, render = False)
+
+    return results
+
+
+
+def compare_to_baseline(results, baseline, tolerance = REGRESSION_TOLERANCE):
+    # Returns {metric: (baseline, current, relative change)} plus a list of regressions.
+    changes = {}
+    regressions = []
+
+    def check(name, old, new):
+        if old is None or new is None or old == 0:
+            return
+        rel = (new - old) / old
+        changes[name] = (old, new, round(rel, 4))
+        if rel > tolerance:
+            regressions.append(name)
+
+    for name, entry in results['micro'].items():
+        check('micro/' + name, baseline.get('micro', {}).get(name, {}).get('us_per_call'), entry['us_per_call'])
+
+    for name, entry in results['frames'].items():
+        old = baseline.get('frames', {}).get(name)
+        if old is None:
+            continue
+        check('frames/{}/ms_per_frame'.format(name), old['ms_per_frame'], entry['ms_per_frame'])
+        for stage, value in entry['stages_ms'].items():
+            check('frames/{}/{}'.format(name, stage), old['stages_ms'].get(stage), value)
+
+    return changes, regressions
+
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark the frame processors with a deterministic fake pose backend.')
+    parser.add_argument('--output', default = 'benchmark_results.json', help = 'Where to write the JSON results.')
+    parser.add_argument('--baseline', help = 'Previous results to compare against.')
+    parser.add_argument('--frames', type = int, default = 300)
+    parser.add_argument('--resolutions', default = ','.join(RESOLUTIONS), help = 'Comma separated subset of ' + ', '.join(RESOLUTIONS))
+    parser.add_argument('--exercises', default = ','.join(EXERCISES))
+    parser.add_argument('--landmarks', help = 'Recorded landmark trace (.lmtrace) or (num_frames, 33, 4) sequence (.npy) instead of synthetic reps.')
+    parser.add_argument('--check-allocations', action = 'store_true', help = 'Fail if steady-state frames allocate more than ALLOCATION_BUDGETS or keep memory.')
+    args = parser.parse_args(argv)
+
+    landmark_seq = load_landmarks(args.landmarks) if args.landmarks else None
+
+    results = run_benchmarks(tuple(args.resolutions.split(',')), tuple(args.exercises.split(',')), args.frames, landmark_seq)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent = 2)
+
+    for name, entry in results['frames'].items():
+        print('{:<22} {:>8.1f} fps  {:>7.3f} ms/frame  {}'.format(name, entry['fps'], entry['ms_per_frame'], entry['stages_ms']))
+
+    for name, entry in results['allocations'].items():
+        print('{:<22} allocations, max B/frame: {}  retained: {} B'.format(name, entry['max_bytes'], entry['retained_bytes']))
+
+    if args.check_allocations:
+        failures = {name: allocation_failures(entry) for name, entry in results['allocations'].items()}
+        failures = {name: failed for name, failed in failures.items() if failed}
+        for name, failed in failures.items():
+            print('Allocation budget exceeded in {}: {}'.format(name, ', '.join(failed)))
+        if failures:
+            return 1
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        changes, regressions = compare_to_baseline(results, baseline)
+        for name, (old, new, rel) in sorted(changes.items()):
+            print('{:<50} {:>10} -> {:>10}  {:+.1%}'.format(name, old, new, rel))
+
+        if regressions:
+            print('Regressions over {:.0%}: {}'.format(REGRESSION_TOLERANCE, ', '.join(regressions)))
+            return 1
+
+    return 0
+
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,180 @@
+import argparse
+import importlib
+import json
+import logging
+import sys
+import threading
+import time
+
+
+# Cold-start measurement and prewarming.
+#
+# Importing mediapipe, cv2, av and streamlit_webrtc and building the first Pose graph take
+# seconds, and the first pose.process() call pays for graph start-up on top. Live_Stream imports
+# none of these while the member is still on the exercise selectbox; instead start_prewarm()
+# imports them on a background thread and parks a pose graph, already run once on a blank frame,
+# in the PosePool. By the time an exercise is picked the first live frame finds everything ready.
+#
+# STARTUP collects per-module import times, the prewarm graph build time and the time from
+# process start to the first annotated frame; startup_report() rounds them to milliseconds.
+# Running this file measures the same numbers cold, without prewarming.
+
+logger = logging.getLogger(__name__)
+
+PROCESS_START = time.perf_counter()
+
+# Roughly in the order the first live frame needs them.
+PREWARM_MODULES = ('numpy', 'cv2', 'av', 'streamlit_webrtc', 'mediapipe', 'exercise_engine', 'process_frame', 'process_frame2', 'frame_buffers')
+
+DEFAULT_WARM_SHAPE = (480, 640, 3)
+
+STARTUP = {
+    'imports'              : {},
+    'pose_graph'           : None,
+    'prewarm_error'        : None,
+    'first_frame'          : None,
+    'first_frame_callback' : None,
+}
+
+_prewarm_lock = threading.Lock()
+_prewarm_thread = None
+
+
+
+def timed_import(name):
+    # Imports a module and records how long that took, unless something loaded it already.
+    if name in sys.modules:
+        return sys.modules[name]
+
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    STARTUP['imports'][name] = time.perf_counter() - start
+
+    return module
+
+
+
+def start_prewarm(pool, modules = PREWARM_MODULES, warm_shape = DEFAULT_WARM_SHAPE, **pose_settings):
+    # Starts the prewarm thread once per process; later calls return the same thread.
+    global _prewarm_thread
+
+    with _prewarm_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target = _prewarm, args = (pool, modules, warm_shape, pose_settings),
+                                               name = 'prewarm', daemon = True)
+            _prewarm_thread.start()
+
+    return _prewarm_thread
+
+
+
+def _prewarm(pool, modules, warm_shape, pose_settings):
+    for name in modules:
+        try:
+            timed_import(name)
+        except ImportError as e:
+            logger.warning('prewarm could not import %s: %s', name, e)
+
+    import numpy as np
+
+    start = time.perf_counter()
+    try:
+        if pool.prewarm(np.zeros(warm_shape, dtype=np.uint8), **pose_settings):
+            STARTUP['pose_graph'] = time.perf_counter() - start
+    except Exception as e:
+        STARTUP['prewarm_error'] = repr(e)
+        logger.warning('prewarming the pose graph failed: %r', e)
+        return
+
+    logger.info('prewarm done: %s', startup_report())
+
+
+
+def mark_first_frame(callback_seconds):
+    # Called for the first annotated frame of every session; only the process-wide first one is kept.
+    if STARTUP['first_frame'] is not None:
+        return
+
+    STARTUP['first_frame'] = time.perf_counter() - PROCESS_START
+    STARTUP['first_frame_callback'] = callback_seconds
+    logger.info('first annotated frame: %s', startup_report())
+
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1e3, 1)
+
+
+
+def startup_report():
+    return {
+        'imports_ms'              : {name: _ms(seconds) for name, seconds in STARTUP['imports'].items()},
+        'import_total_ms'         : _ms(sum(STARTUP['imports'].values())),
+        'pose_graph_ms'           : _ms(STARTUP['pose_graph']),
+        'prewarm_error'           : STARTUP['prewarm_error'],
+        'first_frame_ms'          : _ms(STARTUP['first_frame']),
+        'first_frame_callback_ms' : _ms(STARTUP['first_frame_callback']),
+    }
+
+
+
+def measure_cold_start(exercise = 'bicep_curls', warm_shape = DEFAULT_WARM_SHAPE):
+    # Everything the first live frame pays for without prewarming, measured in this process.
+    import numpy as np
+
+    for name in PREWARM_MODULES:
+        try:
+            timed_import(name)
+        except ImportError as e:
+            STARTUP['imports'][name] = None
+            logger.warning('could not import %s: %s', name, e)
+    STARTUP['imports'] = {name: seconds for name, seconds in STARTUP['imports'].items() if seconds is not None}
+
+    from batch_process import make_processor
+    from utils import get_mediapipe_pose
+
+    frame = np.zeros(warm_shape, dtype=np.uint8)
+    result = {}
+
+    try:
+        start = time.perf_counter()
+        pose = get_mediapipe_pose()
+        STARTUP['pose_graph'] = time.perf_counter() - start
+    except Exception as e:
+        STARTUP['prewarm_error'] = repr(e)
+        return dict(startup_report(), exercise = exercise)
+
+    processor = make_processor(exercise, flip_frame = True)
+
+    for label in ('first_process_ms', 'warm_process_ms'):
+        start = time.perf_counter()
+        processor.process(frame.copy(), pose)
+        result[label] = _ms(time.perf_counter() - start)
+
+        if STARTUP['first_frame'] is None:
+            mark_first_frame(time.perf_counter() - start)
+
+    pose.close()
+
+    return dict(startup_report(), exercise = exercise, **result)
+
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Measure import time and time to the first annotated frame in a fresh process.')
+    parser.add_argument('--exercise', default = 'bicep_curls', choices = ('bicep_curls', 'squats'))
+    parser.add_argument('--json', help = 'Write the report to this file instead of stdout.')
+    args = parser.parse_args(argv)
+
+    report = measure_cold_start(args.exercise)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent = 2)
+    else:
+        print(json.dumps(report, indent = 2))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+import logging
+import os
+import threading
+import time
+
+from pose_pool import _close_pose
+
+
+# Runtime model_complexity autoscaling for one session.
+#
+# ComplexityAutoscaler wraps the session's pose graph and watches the per-frame inference latency
+# (EMA) and the host load (1 minute load average per core). When either runs hot it steps down
+# to a lighter model; when both have headroom, and the heavier model is predicted to fit the
+# latency budget, it steps up. High/low water marks give hysteresis and min_dwell keeps it from
+# flapping. The new graph is built on a background thread, then run once on the same frame as
+# the old one: if it lost the athlete the switch is abandoned, otherwise it takes over on the
+# next frame, so the state machine never sees a gap in the landmarks. Every switch (and every
+# abandoned one) is logged together with what triggered it.
+
+logger = logging.getLogger(__name__)
+
+MIN_COMPLEXITY, MAX_COMPLEXITY = 0, 2
+
+# Rough relative inference cost of the lite, full and heavy models, used to predict the latency
+# of a model that hasn't been measured yet.
+RELATIVE_COST = {0: 1.0, 1: 1.6, 2: 4.0}
+
+
+
+def normalized_load():
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+
+def _dispose(pose):
+    # Pool leases go back to the pool, plain graphs are closed.
+    release = getattr(pose, 'release', None)
+    if release is not None:
+        release()
+    else:
+        _close_pose(pose)
+
+
+
+class ComplexityAutoscaler:
+    def __init__(
+                    self,
+                    factory,
+                    initial_pose = None,
+                    initial_complexity = 1,
+                    latency_budget = 0.033,
+                    high_water = 1.0,
+                    low_water = 0.6,
+                    load_high = 0.9,
+                    load_low = 0.5,
+                    min_dwell = 10.0,
+                    ema_alpha = 0.1,
+                    load_interval = 1.0,
+                    clock = time.perf_counter,
+                    load_fn = normalized_load
+                ):
+
+        # factory(complexity) -> pose graph (or pool lease)
+        self.factory = factory
+        self.latency_budget = latency_budget
+        self.high_water = high_water
+        self.low_water = low_water
+        self.load_high = load_high
+        self.load_low = load_low
+        self.min_dwell = min_dwell
+        self.ema_alpha = ema_alpha
+        self.load_interval = load_interval
+        self.clock = clock
+        self.load_fn = load_fn
+
+        self.complexity = initial_complexity
+        self.pose = initial_pose if initial_pose is not None else factory(initial_complexity)
+
+        # Latency EMA per complexity; the current one is updated every frame.
+        self.latency_ema = {}
+        self.load = 0.0
+        self._load_checked = None
+
+        self.last_switch = clock()
+        self.switches = []
+
+        # Switch in progress: (target complexity, reason) while the new graph is being built.
+        self._pending = None
+        self._pending_pose = None
+        self._pending_error = None
+        self._lock = threading.Lock()
+        self._released = False
+
+
+    def process(self, frame):
+        with self._lock:
+            ready = self._pending is not None and (self._pending_pose is not None or self._pending_error is not None)
+
+        if ready:
+            return self._finish_switch(frame)
+
+        start = self.clock()
+        result = self.pose.process(frame)
+        latency = self.clock() - start
+
+        ema = self.latency_ema.get(self.complexity)
+        self.latency_ema[self.complexity] = latency if ema is None else (1 - self.ema_alpha) * ema + self.ema_alpha * latency
+
+        self._maybe_switch()
+
+        return result
+
+
+    def stats(self):
+        return {
+            'complexity'  : self.complexity,
+            'latency_ema' : self.latency_ema.get(self.complexity),
+            'load'        : self.load,
+            'switching'   : self._pending[0] if self._pending else None,
+            'switches'    : len(self.switches),
+            'last_switch' : self.switches[-1] if self.switches else None,
+        }
+
+
+    @property
+    def released(self):
+        return self._released
+
+
+    def release(self):
+        # Same contract as pose_pool.PoseLease, so a session can hold the autoscaler as its lease.
+        if self._released:
+            return
+        self._released = True
+
+        _dispose(self.pose)
+        with self._lock:
+            if self._pending_pose is not None:
+                _dispose(self._pending_pose)
+                self._pending_pose = None
+
+
+    close = release
+
+
+    def _maybe_switch(self):
+        now = self.clock()
+
+        if self._load_checked is None or now - self._load_checked >= self.load_interval:
+            self.load = self.load_fn()
+            self._load_checked = now
+
+        if self._pending is not None or now - self.last_switch < self.min_dwell:
+            return
+
+        latency = self.latency_ema[self.complexity]
+        budget = self.latency_budget
+
+        if self.complexity > MIN_COMPLEXITY:
+            if latency > budget * self.high_water:
+                return self._start_switch(self.complexity - 1, 'latency {:.1f} ms over {:.1f} ms'.format(latency * 1e3, budget * self.high_water * 1e3))
+            if self.load > self.load_high:
+                return self._start_switch(self.complexity - 1, 'load {:.2f} over {:.2f}'.format(self.load, self.load_high))
+
+        if self.complexity < MAX_COMPLEXITY and self.load < self.load_low:
+            target = self.complexity + 1
+            predicted = self.latency_ema.get(target, latency * RELATIVE_COST[target] / RELATIVE_COST[self.complexity])
+
+            if predicted < budget * self.low_water:
+                return self._start_switch(target, 'predicted latency {:.1f} ms under {:.1f} ms at load {:.2f}'.format(
+                                                  predicted * 1e3, budget * self.low_water * 1e3, self.load))
+
+
+    def _start_switch(self, target, reason):
+        self._pending = (target, reason)
+        logger.info('model_complexity %d -> %d requested: %s', self.complexity, target, reason)
+
+        threading.Thread(target = self._build, args = (target,), name = 'pose-complexity-{}'.format(target), daemon = True).start()
+
+
+    def _build(self, target):
+        try:
+            pose = self.factory(target)
+        except Exception as e:
+            with self._lock:
+                self._pending_error = e
+            return
+
+        with self._lock:
+            if self._released:
+                _dispose(pose)
+            else:
+                self._pending_pose = pose
+
+
+    def _finish_switch(self, frame):
+        with self._lock:
+            (target, reason), new_pose, error = self._pending, self._pending_pose, self._pending_error
+            self._pending = self._pending_pose = self._pending_error = None
+
+        self.last_switch = self.clock()
+
+        # The current graph keeps serving this frame either way.
+        result = self.pose.process(frame)
+
+        if error is not None:
+            logger.warning('model_complexity %d -> %d abandoned, could not create graph: %r', self.complexity, target, error)
+            return result
+
+        # Warm the new graph on the same frame; only switch if it finds the athlete too.
+        if result.pose_landmarks and not new_pose.process(frame).pose_landmarks:
+            _dispose(new_pose)
+            logger.warning('model_complexity %d -> %d abandoned, new graph lost the pose', self.complexity, target)
+            return result
+
+        _dispose(self.pose)
+        self.switches.append({'from': self.complexity, 'to': target, 'reason': reason, 'time': time.time()})
+        logger.info('model_complexity %d -> %d switched (%s)', self.complexity, target, reason)
+
+        self.pose = new_pose
+        self.complexity = target
+
+        return result
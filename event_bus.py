@@ -0,0 +1,272 @@
+import asyncio
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+
+
+# Rep event stream for dashboards.
+#
+# The processors emit typed events through an EventChannel attached as processor.events. Emitting
+# is a single deque.append (atomic in CPython, no lock, no I/O), so the frame path never waits.
+# An asyncio loop on a background thread wakes up every flush_interval, takes the queued events
+# in batches and hands each batch to every sink; file and database writes run in the loop's
+# executor, the socket sink uses asyncio streams. If the sinks fall behind, the queue is bounded
+# and new events are dropped (and counted) rather than growing without limit.
+
+REP_COMPLETED = 'rep_completed'
+REP_INCORRECT = 'rep_incorrect'
+COUNTERS_RESET = 'counters_reset'
+CAMERA_MISALIGNED = 'camera_misaligned'
+FEEDBACK_SHOWN = 'feedback_shown'
+
+EVENT_KINDS = (REP_COMPLETED, REP_INCORRECT, COUNTERS_RESET, CAMERA_MISALIGNED, FEEDBACK_SHOWN)
+
+# time is wall-clock seconds; data holds the kind-specific fields (e.g. the feedback message).
+RepEvent = namedtuple('RepEvent', ['kind', 'time', 'session', 'exercise', 'correct', 'incorrect', 'data'])
+
+DEFAULT_MAX_QUEUE = 100000
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+
+
+def event_to_dict(event):
+    record = event._asdict()
+    record.update(record.pop('data') or {})
+
+    return record
+
+
+
+class EventChannel:
+    # Per-session emitter; publish is any callable taking a RepEvent (EventBus.publish, list.append, ...).
+    def __init__(self, publish, session = None, exercise = None, clock = time.time):
+        self.publish = publish
+        self.session = session
+        self.exercise = exercise
+        self.clock = clock
+
+
+    def emit(self, kind, correct, incorrect, data = None):
+        self.publish(RepEvent(kind, self.clock(), self.session, self.exercise, correct, incorrect, data))
+
+
+    def forward(self, event):
+        # Re-publishes an event emitted elsewhere (e.g. in a worker process) under this session.
+        self.publish(event._replace(session = self.session, exercise = self.exercise))
+
+
+
+# ----------------------------------------------- SINKS -----------------------------------------------
+
+class JsonlSink:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', encoding = 'utf-8')
+
+
+    async def write(self, events):
+        lines = ''.join(json.dumps(event_to_dict(event)) + '\n' for event in events)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, lines)
+
+
+    def _write(self, lines):
+        self._file.write(lines)
+        self._file.flush()
+
+
+    async def close(self):
+        self._file.close()
+
+
+
+class SqliteSink:
+    def __init__(self, path, table = 'rep_events'):
+        self.path = path
+        self.table = table
+
+        # Batches are written one at a time from executor threads.
+        self._conn = sqlite3.connect(path, check_same_thread = False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS {} (time REAL, session TEXT, exercise TEXT, kind TEXT, '
+                           'correct INTEGER, incorrect INTEGER, data TEXT)'.format(table))
+        self._conn.commit()
+
+
+    async def write(self, events):
+        rows = [(event.time, event.session, event.exercise, event.kind, event.correct, event.incorrect,
+                 json.dumps(event.data) if event.data else None) for event in events]
+        await asyncio.get_running_loop().run_in_executor(None, self._write, rows)
+
+
+    def _write(self, rows):
+        with self._conn:
+            self._conn.executemany('INSERT INTO {} VALUES (?, ?, ?, ?, ?, ?, ?)'.format(self.table), rows)
+
+
+    async def close(self):
+        self._conn.close()
+
+
+
+class SocketSink:
+    # Newline-delimited JSON to a local socket: 'unix:/path/to.sock' or 'host:port'.
+    # Reconnects on the next batch after a failure; the failed batch is dropped.
+    def __init__(self, address, timeout = 2.0):
+        self.address = address
+        self.timeout = timeout
+        self._writer = None
+
+
+    async def write(self, events):
+        if self._writer is None:
+            await self._connect()
+
+        self._writer.write(''.join(json.dumps(event_to_dict(event)) + '\n' for event in events).encode())
+        try:
+            await asyncio.wait_for(self._writer.drain(), self.timeout)
+        except Exception:
+            await self.close()
+            raise
+
+
+    async def _connect(self):
+        if self.address.startswith('unix:'):
+            connect = asyncio.open_unix_connection(self.address[len('unix:'):])
+        else:
+            host, port = self.address.rsplit(':', 1)
+            connect = asyncio.open_connection(host, int(port))
+
+        _, self._writer = await asyncio.wait_for(connect, self.timeout)
+
+
+    async def close(self):
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+
+def make_sink(spec):
+    # 'jsonl:<path>', 'sqlite:<path>' or 'socket:<unix:/path | host:port>'.
+    kind, _, target = spec.partition(':')
+    sinks = {'jsonl': JsonlSink, 'sqlite': SqliteSink, 'socket': SocketSink}
+
+    if kind not in sinks or not target:
+        raise ValueError('Unknown event sink {!r}, expected jsonl:<path>, sqlite:<path> or socket:<address>'.format(spec))
+
+    return sinks[kind](target)
+
+
+
+# ------------------------------------------------ BUS ------------------------------------------------
+
+class EventBus:
+    def __init__(self, sinks, max_queue = DEFAULT_MAX_QUEUE, batch_size = DEFAULT_BATCH_SIZE, flush_interval = DEFAULT_FLUSH_INTERVAL):
+        self.sinks = list(sinks)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = deque(maxlen = max_queue)
+
+        self.published = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.sink_errors = 0
+
+        self._loop = asyncio.new_event_loop()
+        self._stopping = asyncio.Event()
+        self._closed = False
+        self._thread = threading.Thread(target = self._run, name = 'event-bus', daemon = True)
+        self._thread.start()
+
+        atexit.register(self.close)
+
+
+    def channel(self, session, exercise = None):
+        return EventChannel(self.publish, session, exercise)
+
+
+    def publish(self, event):
+        # Called from frame threads: never blocks.
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+
+        self._queue.append(event)
+        self.published += 1
+
+
+    def stats(self):
+        return {
+            'published'   : self.published,
+            'queued'      : len(self._queue),
+            'dropped'     : self.dropped,
+            'written'     : self.written,
+            'batches'     : self.batches,
+            'sink_errors' : self.sink_errors,
+        }
+
+
+    def close(self, timeout = 5.0):
+        # Writes out what is still queued, then closes the sinks.
+        if self._closed:
+            return
+        self._closed = True
+
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join(timeout)
+
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._drain())
+        self._loop.close()
+
+
+    async def _drain(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            while self._queue:
+                await self._write_batch(self._take_batch())
+
+        for sink in self.sinks:
+            try:
+                await sink.close()
+            except Exception:
+                self.sink_errors += 1
+
+
+    def _take_batch(self):
+        batch = []
+        queue = self._queue
+
+        while queue and len(batch) < self.batch_size:
+            batch.append(queue.popleft())
+
+        return batch
+
+
+    async def _write_batch(self, batch):
+        self.batches += 1
+
+        for sink in self.sinks:
+            try:
+                await sink.write(batch)
+            except Exception:
+                # One failing sink must not keep the others from getting the batch.
+                self.sink_errors += 1
+
+        self.written += len(batch)
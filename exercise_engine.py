@@ -0,0 +1,785 @@
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from event_bus import REP_COMPLETED, REP_INCORRECT, COUNTERS_RESET, CAMERA_MISALIGNED, FEEDBACK_SHOWN
+from metrics import NULL_TIMER
+from utils import get_landmark_matrix, denormalize_landmarks, get_joint_angles, JOINT_ANGLE_INDEX, JOINT_ANGLE_NAMES, \
+                  LEFT_LANDMARK_IDS, RIGHT_LANDMARK_IDS, NOSE_LANDMARK_ID, draw_text_cached, draw_dotted_line, draw_angle_arc, mirror_coords
+
+
+# Generic, table-driven exercise engine.
+#
+# An exercise is described declaratively (ExerciseDefinition): which joint angle drives the
+# s1/s2/s3 states and their angle bands, the feedback rules, and what to draw. compile_exercise()
+# turns it into lookup tables once, and ExerciseProcessor runs any compiled exercise with a fixed
+# amount of work per frame.
+
+
+# States. NO_STATE means the tracked angle is outside every band.
+NO_STATE, S1, S2, S3 = 0, 1, 2, 3
+STATE_NAMES = (None, 's1', 's2', 's3')
+
+# Every state_seq the rep logic can build. The engine only stores the index into this tuple.
+STATE_SEQUENCES = ((), ('s2',), ('s2', 's3'), ('s2', 's3', 's2'))
+
+# state_seq conditions for feedback rules, as bitmasks over the sequence ids.
+ANY_SEQ = 0b1111
+S2_ONCE = 0b0110          # state_seq.count('s2') == 1
+NOT_S2_ONCE = 0b1001      # state_seq.count('s2') != 1
+
+# Outcome of returning to s1.
+NO_REP, REP_CORRECT, REP_IMPROPER = 0, 1, 2
+
+# Feedback action that sets the exercise hint ('CURL YOUR ARMS', 'LOWER YOUR HIPS') instead of a banner.
+HINT = -1
+
+# Largest angle get_joint_angles() can return, plus one.
+ANGLE_LUT_SIZE = 181
+
+
+# Fires `action` when lo < angle < hi and the current state_seq matches seq_mask. If `incorrect`
+# is set the running rep is also flagged as having incorrect posture.
+FeedbackRule = namedtuple('FeedbackRule', ['angle', 'lo', 'hi', 'seq_mask', 'action', 'incorrect'])
+
+# Arc from the vertical to the joint angle, drawn around `joint`, plus a dotted vertical guide line.
+ArcSpec = namedtuple('ArcSpec', ['joint', 'angle', 'radius', 'direction', 'line_up', 'line_down'])
+
+# Angle value printed next to `joint`.
+AngleLabel = namedtuple('AngleLabel', ['angle', 'joint', 'dx', 'dy'])
+
+# What process() returns with render=False instead of the annotated frame and play_sound.
+#   state / state_seq   's1'/'s2'/'s3' (None outside every band) and the running sequence
+#   angles              {joint angle name: degrees} as in utils.JOINT_ANGLE_NAMES, empty without a pose
+#   *_delta             change of the counters in this frame (negative when they were reset)
+#   feedback            ids into FEEDBACK_ID_MAP of the banners that would be shown
+#   event               the play_sound value ('1', '2', ..., 'incorrect', 'reset_counters' or None)
+FrameAnalysis = namedtuple('FrameAnalysis', ['pose_detected', 'camera_aligned', 'offset_angle', 'side', 'state', 'state_seq', 'angles',
+                                             'correct', 'incorrect', 'correct_delta', 'incorrect_delta', 'feedback', 'hint', 'event'])
+
+
+
+class ExerciseDefinition:
+    def __init__(
+                    self,
+                    name,
+                    state_angle,
+                    state_bands,
+                    count_key,
+                    improper_key,
+                    hint_key,
+                    hint_text,
+                    feedback_map,
+                    feedback_rules,
+                    arcs,
+                    angle_labels
+                ):
+
+        self.name = name
+
+        # Joint angle ('wrist', 'knee', ...) whose value picks the state, and the NORMAL/TRANS/PASS
+        # bands from thresholds.py (inclusive, first match wins).
+        self.state_angle = state_angle
+        self.state_bands = state_bands
+
+        # Old state_tracker keys of the counters and the hint flag (see SessionState).
+        self.count_key = count_key
+        self.improper_key = improper_key
+        self.hint_key = hint_key
+        self.hint_text = hint_text
+
+        # feedback id -> (text, y position, background color)
+        self.feedback_map = feedback_map
+
+        # List of rule groups. Within a group only the first matching rule fires (if/elif chain).
+        self.feedback_rules = feedback_rules
+
+        self.arcs = arcs
+        self.angle_labels = angle_labels
+
+
+
+def _append_state(state_seq, state):
+    # Reference state_seq update rule; only used to build the transition table.
+    if state == 's2':
+        if (('s3' not in state_seq) and state_seq.count('s2') == 0) or \
+                (('s3' in state_seq) and state_seq.count('s2') == 1):
+            return state_seq + ('s2',)
+
+    elif state == 's3':
+        if ('s3' not in state_seq) and 's2' in state_seq:
+            return state_seq + ('s3',)
+
+    return state_seq
+
+
+
+def _rep_outcome(state_seq, incorrect_posture):
+    # Reference rule for what returning to s1 means; only used to build the outcome table.
+    if len(state_seq) == 3 and not incorrect_posture:
+        return REP_CORRECT
+    elif 's2' in state_seq and len(state_seq) == 1:
+        return REP_IMPROPER
+    elif incorrect_posture:
+        return REP_IMPROPER
+
+    return NO_REP
+
+
+
+def build_state_lut(state_bands):
+    lut = np.full((ANGLE_LUT_SIZE,), NO_STATE, dtype=np.int8)
+
+    for angle in range(ANGLE_LUT_SIZE):
+        for state, band in ((S1, 'NORMAL'), (S2, 'TRANS'), (S3, 'PASS')):
+            if state_bands[band][0] <= angle <= state_bands[band][1]:
+                lut[angle] = state
+                break
+
+    return lut
+
+
+
+def build_transition_table():
+    # transitions[seq_id, state] -> next seq_id
+    transitions = np.zeros((len(STATE_SEQUENCES), len(STATE_NAMES)), dtype=np.int8)
+
+    for seq_id, state_seq in enumerate(STATE_SEQUENCES):
+        for state, state_name in enumerate(STATE_NAMES):
+            transitions[seq_id, state] = STATE_SEQUENCES.index(_append_state(state_seq, state_name))
+
+    return transitions
+
+
+
+def build_outcome_table():
+    # outcomes[seq_id, incorrect_posture] -> NO_REP / REP_CORRECT / REP_IMPROPER
+    outcomes = np.zeros((len(STATE_SEQUENCES), 2), dtype=np.int8)
+
+    for seq_id, state_seq in enumerate(STATE_SEQUENCES):
+        for incorrect in (0, 1):
+            outcomes[seq_id, incorrect] = _rep_outcome(state_seq, bool(incorrect))
+
+    return outcomes
+
+
+
+class CompiledExercise:
+    def __init__(self, definition):
+        self.definition = definition
+
+        self.state_lut = build_state_lut(definition.state_bands)
+        self.transitions = build_transition_table()
+        self.outcomes = build_outcome_table()
+
+        # Sequence ids that contain s3 (the hint is cleared once the top of the rep is reached).
+        self.seq_has_s3 = np.array(['s3' in seq for seq in STATE_SEQUENCES])
+
+        # Per side: landmark ids and angle slots in the get_joint_angles() output.
+        self.sides = {}
+
+        for side, ids in (('left', LEFT_LANDMARK_IDS), ('right', RIGHT_LANDMARK_IDS)):
+            angle_idx = lambda name: JOINT_ANGLE_INDEX[side + '_' + name]
+
+            self.sides[side] = {
+                'ids'         : ids,
+                'state_angle' : angle_idx(definition.state_angle),
+                'rules'       : [
+                                    [(angle_idx(rule.angle), rule.lo, rule.hi, rule.seq_mask, rule.action, rule.incorrect) for rule in group]
+                                    for group in definition.feedback_rules
+                                ],
+                'arcs'        : [(ids[arc.joint], angle_idx(arc.angle), arc.radius, arc.direction, arc.line_up, arc.line_down)
+                                 for arc in definition.arcs],
+                'labels'      : [(angle_idx(label.angle), ids[label.joint], label.dx, label.dy) for label in definition.angle_labels],
+            }
+
+        # Old state_tracker keys of this exercise -> SessionState attributes.
+        self.state_keys = dict(STATE_KEYS, **{definition.count_key: 'correct', definition.improper_key: 'incorrect', definition.hint_key: 'hint'})
+
+        # Plain lists are the fastest thing to index from Python in the per-frame path.
+        self.state_lut_list = self.state_lut.tolist()
+        self.transitions_list = self.transitions.tolist()
+        self.outcomes_list = self.outcomes.tolist()
+        self.seq_has_s3_list = self.seq_has_s3.tolist()
+
+
+
+def compile_exercise(definition):
+    return CompiledExercise(definition)
+
+
+
+# state_tracker dict keys of earlier versions -> SessionState attributes. The counter and hint
+# keys differ per exercise and are added in CompiledExercise.state_keys.
+STATE_KEYS = {
+    'state_seq'                 : 'state_seq',
+    'curr_state'                : 'curr_state',
+    'prev_state'                : 'prev_state',
+    'start_inactive_time'       : 'start_inactive_time',
+    'start_inactive_time_front' : 'start_inactive_time_front',
+    'INACTIVE_TIME'             : 'inactive_time',
+    'INACTIVE_TIME_FRONT'       : 'inactive_time_front',
+    'DISPLAY_TEXT'              : 'display_text',
+    'COUNT_FRAMES'              : 'count_frames',
+    'INCORRECT_POSTURE'         : 'incorrect_posture',
+}
+
+# Attributes kept in a different form than the state_tracker values they replace:
+# attribute -> (to the old value, from the old value).
+LEGACY_VALUES = {
+    'state_seq'    : (lambda seq: list(STATE_SEQUENCES[seq]), lambda value: STATE_SEQUENCES.index(tuple(value))),
+    'curr_state'   : (STATE_NAMES.__getitem__, STATE_NAMES.index),
+    'prev_state'   : (STATE_NAMES.__getitem__, STATE_NAMES.index),
+    'display_text' : (lambda flags: np.array(flags, dtype=bool), lambda value: [bool(flag) for flag in value]),
+    'count_frames' : (lambda counts: np.array(counts, dtype=np.int64), lambda value: [int(count) for count in value]),
+}
+
+
+
+class SessionState:
+    # Per-session state of an ExerciseProcessor. Fixed slots instead of a dict, and the feedback
+    # flags / frame counters are fixed-length lists updated in place (with 4-5 entries, NumPy calls
+    # would only add temporaries), so steady-state frames don't allocate.
+    #
+    # Indexing with the old state_tracker keys returns the old values: state['state_seq'] is a
+    # list like ['s2', 's3'], state['curr_state'] is None or 's1'/'s2'/'s3', DISPLAY_TEXT and
+    # COUNT_FRAMES are NumPy arrays. Those are copies, so changes have to be assigned back
+    # through the key.
+    __slots__ = ('keys', 'feedback_ids', 'state_seq', 'curr_state', 'prev_state', 'start_inactive_time', 'start_inactive_time_front',
+                 'inactive_time', 'inactive_time_front', 'display_text', 'count_frames', 'incorrect_posture', 'hint',
+                 'correct', 'incorrect')
+
+    def __init__(self, num_feedback, keys, now):
+        self.keys = keys
+        self.feedback_ids = tuple(range(num_feedback))
+
+        # Index into STATE_SEQUENCES; curr_state / prev_state are S1/S2/S3 or NO_STATE.
+        self.state_seq = 0
+        self.curr_state = NO_STATE
+        self.prev_state = NO_STATE
+
+        self.start_inactive_time = now
+        self.start_inactive_time_front = now
+        self.inactive_time = 0.0
+        self.inactive_time_front = 0.0
+
+        # Per feedback id: banner shown, and for how many frames.
+        self.display_text = [False] * num_feedback
+        self.count_frames = [0] * num_feedback
+
+        self.incorrect_posture = False
+        self.hint = False
+
+        self.correct = 0
+        self.incorrect = 0
+
+
+    def reset_feedback(self):
+        for idx in self.feedback_ids:
+            self.display_text[idx] = False
+            self.count_frames[idx] = 0
+
+
+    def count_feedback_frame(self):
+        # Banners that are up count one more frame.
+        for idx in self.feedback_ids:
+            if self.display_text[idx]:
+                self.count_frames[idx] += 1
+
+
+    def expire_feedback(self, max_frames):
+        for idx in self.feedback_ids:
+            if self.count_frames[idx] > max_frames:
+                self.display_text[idx] = False
+                self.count_frames[idx] = 0
+
+
+    def __getitem__(self, key):
+        name = self.keys[key]
+        value = getattr(self, name)
+
+        return LEGACY_VALUES[name][0](value) if name in LEGACY_VALUES else value
+
+
+    def __setitem__(self, key, value):
+        name = self.keys[key]
+        setattr(self, name, LEGACY_VALUES[name][1](value) if name in LEGACY_VALUES else value)
+
+
+
+# Skeleton drawn for the tracked side: joint pairs and joints.
+SKELETON_LINES = (('shoulder', 'elbow'), ('wrist', 'elbow'), ('shoulder', 'hip'), ('knee', 'hip'), ('ankle', 'knee'), ('ankle', 'foot'))
+SKELETON_JOINTS = ('shoulder', 'elbow', 'wrist', 'hip', 'knee', 'ankle', 'foot')
+
+
+
+class ExerciseProcessor:
+    def __init__(self, definition, thresholds, flip_frame = False, render = True, clock = time.perf_counter):
+
+        # Set if frame should be flipped or not.
+        self.flip_frame = flip_frame
+
+        # With render=False nothing is drawn or flipped and process() returns a FrameAnalysis.
+        self.render = render
+
+        self.thresholds = thresholds
+
+        # Seconds for the inactivity timers; the wall clock live, a media_clock.MediaClock in replay.
+        self.clock = clock
+
+        self.definition = definition
+        self.compiled = compile_exercise(definition)
+
+        # Optional metrics.SessionMetrics for per-stage latency histograms.
+        self.metrics = None
+        self._timer = NULL_TIMER
+
+        # Optional event_bus.EventChannel receiving rep, reset, alignment and feedback events.
+        self.events = None
+        self._misaligned = False
+
+        # Font type.
+        self.font = cv2.FONT_HERSHEY_SIMPLEX
+
+        # line type
+        self.linetype = cv2.LINE_AA
+
+        # set radius to draw arc
+        self.radius = 20
+
+        # Colors in BGR format.
+        self.COLORS = {
+                        'blue'       : (0, 127, 255),
+                        'red'        : (255, 50, 50),
+                        'green'      : (0, 255, 127),
+                        'light_green': (100, 233, 127),
+                        'yellow'     : (255, 255, 0),
+                        'magenta'    : (255, 0, 255),
+                        'white'      : (255,255,255),
+                        'cyan'       : (0, 255, 255),
+                        'light_blue' : (102, 204, 255)
+                      }
+
+        # Dictionary to maintain the various landmark features.
+        self.dict_features = {
+                                'left' : LEFT_LANDMARK_IDS,
+                                'right': RIGHT_LANDMARK_IDS,
+                                'nose' : NOSE_LANDMARK_ID
+                             }
+
+        self.FEEDBACK_ID_MAP = definition.feedback_map
+        num_feedback = len(self.FEEDBACK_ID_MAP)
+
+        self.count_key = definition.count_key
+        self.improper_key = definition.improper_key
+        self.hint_key = definition.hint_key
+
+        # For tracking counters and sharing states in and out of callbacks.
+        self.state = SessionState(num_feedback, self.compiled.state_keys, clock())
+
+
+    @property
+    def state_tracker(self):
+        # Old name of self.state; supports the same key lookups as the former dict.
+        return self.state
+
+
+    @property
+    def state_seq(self):
+        return list(STATE_SEQUENCES[self.state.state_seq])
+
+
+    def get_state(self, angle):
+        return self.compiled.state_lut_list[min(max(int(angle), 0), ANGLE_LUT_SIZE - 1)]
+
+
+    def process(self, frame: np.array, pose):
+        frame_height, frame_width, _ = frame.shape
+
+        # Stage timings go to self.metrics (a metrics.SessionMetrics) when one is attached.
+        timer = self._timer = self.metrics.timer if self.metrics is not None else NULL_TIMER
+        timer.start()
+
+        counts_before = (self.state.correct, self.state.incorrect)
+
+        # Process the image.
+        keypoints = pose.process(frame)
+        timer.lap('pose', getattr(pose, 'inference_seconds', None))
+
+        if keypoints.pose_landmarks:
+            coords, angles = self._geometry(keypoints.pose_landmarks, frame_width, frame_height)
+            offset_angle = angles[JOINT_ANGLE_INDEX['offset']]
+            timer.lap('landmarks')
+
+            if offset_angle > self.thresholds['OFFSET_THRESH']:
+                play_sound = self._update_misaligned(offset_angle)
+                timer.lap('state')
+                output = self._draw_misaligned(frame, coords, offset_angle) if self.render else \
+                         self._analysis(play_sound, counts_before, angles, offset_angle, aligned=False)
+                timer.lap('draw')
+
+            # Camera is aligned properly.
+            else:
+                side = self._select_side(coords)
+                timer.lap('landmarks')
+                play_sound = self._update_aligned(angles, side)
+                timer.lap('state')
+                output = self._draw_aligned(frame, coords, angles, side) if self.render else \
+                         self._analysis(play_sound, counts_before, angles, offset_angle, aligned=True, side=side)
+                timer.lap('draw')
+                self._expire_feedback()
+                timer.lap('state')
+
+        else:
+            play_sound = self._update_no_pose()
+            timer.lap('state')
+            output = self._draw_no_pose(frame) if self.render else self._analysis(play_sound, counts_before)
+            timer.lap('draw')
+
+        timer.finish()
+
+        if not self.render:
+            return output
+
+        return output, play_sound
+
+
+    def _analysis(self, play_sound, counts_before, angles = None, offset_angle = None, aligned = False, side = None):
+        state = self.state
+        correct, incorrect = state.correct, state.incorrect
+
+        return FrameAnalysis(
+            pose_detected = angles is not None,
+            camera_aligned = aligned,
+            offset_angle = offset_angle,
+            side = side,
+            state = STATE_NAMES[state.curr_state],
+            state_seq = STATE_SEQUENCES[state.state_seq],
+            angles = dict(zip(JOINT_ANGLE_NAMES, angles)) if angles is not None else {},
+            correct = correct,
+            incorrect = incorrect,
+            correct_delta = correct - counts_before[0],
+            incorrect_delta = incorrect - counts_before[1],
+            feedback = tuple(np.flatnonzero(state.count_frames).tolist()) if aligned else (),
+            hint = aligned and state.hint,
+            event = play_sound,
+        )
+
+
+    # ------------------------------------------ GEOMETRY ------------------------------------------
+
+    def _geometry(self, pose_landmarks, frame_width, frame_height):
+        # All landmarks and every joint angle are computed in one pass each.
+        coords = denormalize_landmarks(get_landmark_matrix(pose_landmarks.landmark), frame_width, frame_height)
+        angles = get_joint_angles(coords).tolist()
+
+        return coords, angles
+
+
+    def _select_side(self, coords):
+        # Track the side whose shoulder-to-foot span is larger, i.e. the one facing the camera.
+        dist_l_sh_hip = abs(coords[LEFT_LANDMARK_IDS['foot'], 1] - coords[LEFT_LANDMARK_IDS['shoulder'], 1])
+        dist_r_sh_hip = abs(coords[RIGHT_LANDMARK_IDS['foot'], 1] - coords[RIGHT_LANDMARK_IDS['shoulder'], 1])
+
+        return 'left' if dist_l_sh_hip > dist_r_sh_hip else 'right'
+
+
+    # ---------------------------------------- STATE UPDATES ----------------------------------------
+
+    def _emit(self, kind, data = None):
+        # Only called on state changes, never per frame.
+        if self.events is not None:
+            self.events.emit(kind, self.state.correct, self.state.incorrect, data)
+
+
+    def _reset_counters(self, reason):
+        # The reset event carries the counts that were reset.
+        self._emit(COUNTERS_RESET, {'reason': reason})
+        self.state.correct = 0
+        self.state.incorrect = 0
+
+
+    def _update_misaligned(self, offset_angle):
+        play_sound = None
+        state = self.state
+
+        if not self._misaligned:
+            self._misaligned = True
+            self._emit(CAMERA_MISALIGNED, {'offset_angle': round(offset_angle, 1)})
+
+        end_time = self.clock()
+        state.inactive_time_front += end_time - state.start_inactive_time_front
+        state.start_inactive_time_front = end_time
+
+        if state.inactive_time_front >= self.thresholds['INACTIVE_THRESH']:
+            self._reset_counters('inactive_front')
+            play_sound = 'reset_counters'
+            state.inactive_time_front = 0.0
+            state.start_inactive_time_front = self.clock()
+
+        # Reset inactive times for side view.
+        state.start_inactive_time = self.clock()
+        state.inactive_time = 0.0
+        state.prev_state = NO_STATE
+        state.curr_state = NO_STATE
+
+        return play_sound
+
+
+    def _update_aligned(self, angles, side):
+        play_sound = None
+        state = self.state
+        compiled = self.compiled
+        side_tables = compiled.sides[side]
+
+        state.inactive_time_front = 0.0
+        state.start_inactive_time_front = self.clock()
+        self._misaligned = False
+
+        current_state = compiled.state_lut_list[angles[side_tables['state_angle']]]
+        state.curr_state = current_state
+        seq = state.state_seq = compiled.transitions_list[state.state_seq][current_state]
+
+        # -------------------------------------- COMPUTE COUNTERS --------------------------------------
+
+        if current_state == S1:
+            outcome = compiled.outcomes_list[seq][state.incorrect_posture]
+
+            if outcome == REP_CORRECT:
+                state.correct += 1
+                play_sound = str(state.correct)
+                self._emit(REP_COMPLETED, {'side': side})
+
+            elif outcome == REP_IMPROPER:
+                state.incorrect += 1
+                play_sound = 'incorrect'
+                self._emit(REP_INCORRECT, {'side': side})
+
+            seq = state.state_seq = 0
+            state.incorrect_posture = False
+
+        # -------------------------------------- PERFORM FEEDBACK ACTIONS --------------------------------------
+
+        else:
+            display_text = state.display_text
+            seq_bit = 1 << seq
+
+            for group in side_tables['rules']:
+                for angle_idx, lo, hi, seq_mask, action, incorrect in group:
+                    if lo < angles[angle_idx] < hi and seq_mask & seq_bit:
+                        if action == HINT:
+                            state.hint = True
+                        elif not display_text[action]:
+                            display_text[action] = True
+                            self._emit(FEEDBACK_SHOWN, {'feedback_id': action, 'message': self.FEEDBACK_ID_MAP[action][0]})
+
+                        if incorrect:
+                            state.incorrect_posture = True
+                        break
+
+        # ----------------------------------- COMPUTE INACTIVITY ---------------------------------------------
+
+        if state.curr_state == state.prev_state:
+
+            end_time = self.clock()
+            state.inactive_time += end_time - state.start_inactive_time
+            state.start_inactive_time = end_time
+
+            if state.inactive_time >= self.thresholds['INACTIVE_THRESH']:
+                self._reset_counters('inactive')
+                play_sound = 'reset_counters'
+                state.start_inactive_time = self.clock()
+                state.inactive_time = 0.0
+
+        else:
+            state.start_inactive_time = self.clock()
+            state.inactive_time = 0.0
+
+        # -------------------------------------------------------------------------------------------------------
+
+        if compiled.seq_has_s3_list[seq] or current_state == S1:
+            state.hint = False
+
+        state.count_feedback_frame()
+        state.prev_state = current_state
+
+        return play_sound
+
+
+    def _expire_feedback(self):
+        # Feedback banners stay up for CNT_FRAME_THRESH frames.
+        self.state.expire_feedback(self.thresholds['CNT_FRAME_THRESH'])
+
+
+    def _update_no_pose(self):
+        play_sound = None
+        state = self.state
+
+        end_time = self.clock()
+        state.inactive_time += end_time - state.start_inactive_time
+        state.start_inactive_time = end_time
+
+        if state.inactive_time >= self.thresholds['INACTIVE_THRESH']:
+            self._reset_counters('no_pose')
+            play_sound = 'reset_counters'
+            state.start_inactive_time = self.clock()
+            state.inactive_time = 0.0
+
+        # Reset all other state variables
+        state.prev_state = NO_STATE
+        state.curr_state = NO_STATE
+        state.inactive_time_front = 0.0
+        state.incorrect_posture = False
+        state.reset_feedback()
+        state.start_inactive_time_front = self.clock()
+
+        return play_sound
+
+
+    # ------------------------------------------- DRAWING -------------------------------------------
+
+    # With flip_frame the frame is mirrored once, in place, before anything is drawn, and all
+    # drawing happens in mirrored (display) coordinates. Inference always sees the original frame.
+    # Clients that mirror the video themselves should use flip_frame=False.
+
+    def _flip(self, frame):
+        self._timer.lap('draw')
+        cv2.flip(frame, 1, frame)
+        self._timer.lap('flip')
+
+        return frame
+
+
+    def _display_coords(self, coords, frame_width):
+        return mirror_coords(coords, frame_width) if self.flip_frame else coords
+
+
+    def _draw_counters(self, frame, frame_width):
+        draw_text_cached(
+            frame,
+            "CORRECT: " + str(self.state.correct),
+            pos=(int(frame_width*0.68), 30),
+            text_color=(255, 255, 230),
+            font_scale=0.7,
+            text_color_bg=(18, 185, 0)
+        )
+
+        draw_text_cached(
+            frame,
+            "INCORRECT: " + str(self.state.incorrect),
+            pos=(int(frame_width*0.68), 80),
+            text_color=(255, 255, 230),
+            font_scale=0.7,
+            text_color_bg=(221, 0, 0),
+        )
+
+
+    def _show_feedback(self, frame, c_frame, dict_maps, hint_disp):
+
+        if hint_disp:
+            draw_text_cached(
+                    frame,
+                    self.definition.hint_text,
+                    pos=(30, 80),
+                    text_color=(0, 0, 0),
+                    font_scale=0.6,
+                    text_color_bg=(255, 255, 0)
+                )
+
+        for idx in np.where(c_frame)[0]:
+            draw_text_cached(
+                    frame,
+                    dict_maps[idx][0],
+                    pos=(30, dict_maps[idx][1]),
+                    text_color=(255, 255, 230),
+                    font_scale=0.6,
+                    text_color_bg=dict_maps[idx][2]
+                )
+
+        return frame
+
+
+    def _draw_misaligned(self, frame, coords, offset_angle):
+        frame_height, frame_width, _ = frame.shape
+
+        if self.flip_frame:
+            frame = self._flip(frame)
+        coords = self._display_coords(coords, frame_width)
+
+        cv2.circle(frame, coords[NOSE_LANDMARK_ID], 7, self.COLORS['white'], -1)
+        cv2.circle(frame, coords[LEFT_LANDMARK_IDS['shoulder']], 7, self.COLORS['yellow'], -1)
+        cv2.circle(frame, coords[RIGHT_LANDMARK_IDS['shoulder']], 7, self.COLORS['magenta'], -1)
+
+        self._draw_counters(frame, frame_width)
+
+        draw_text_cached(
+            frame,
+            'CAMERA NOT ALIGNED PROPERLY!!!',
+            pos=(30, frame_height-60),
+            text_color=(255, 255, 230),
+            font_scale=0.65,
+            text_color_bg=(255, 153, 0),
+        )
+
+        draw_text_cached(
+            frame,
+            'OFFSET ANGLE: '+str(offset_angle),
+            pos=(30, frame_height-30),
+            text_color=(255, 255, 230),
+            font_scale=0.65,
+            text_color_bg=(255, 153, 0),
+        )
+
+        return frame
+
+
+    def _draw_aligned(self, frame, coords, angles, side):
+        frame_height, frame_width, _ = frame.shape
+        side_tables = self.compiled.sides[side]
+        ids = side_tables['ids']
+
+        if self.flip_frame:
+            frame = self._flip(frame)
+        coords = self._display_coords(coords, frame_width)
+
+        multiplier = -1 if side == 'left' else 1
+
+        # ------------------- Vertical angle arcs --------------
+        for joint_id, angle_idx, radius, direction, line_up, line_down in side_tables['arcs']:
+            joint_coord = coords[joint_id]
+            draw_angle_arc(frame, joint_coord, radius, angles[angle_idx], direction * multiplier, self.COLORS['white'],
+                           mirror=self.flip_frame, lineType=self.linetype)
+
+            draw_dotted_line(frame, joint_coord, start=joint_coord[1] - line_up, end=joint_coord[1] + line_down, line_color=self.COLORS['blue'])
+
+        # Join landmarks.
+        for joint_a, joint_b in SKELETON_LINES:
+            cv2.line(frame, coords[ids[joint_a]], coords[ids[joint_b]], self.COLORS['light_blue'], 4, lineType=self.linetype)
+
+        # Plot landmark points
+        for joint in SKELETON_JOINTS:
+            cv2.circle(frame, coords[ids[joint]], 7, self.COLORS['yellow'], -1, lineType=self.linetype)
+
+        frame = self._show_feedback(frame, self.state.count_frames, self.FEEDBACK_ID_MAP, self.state.hint)
+
+        for angle_idx, joint_id, dx, dy in side_tables['labels']:
+            joint_coord = coords[joint_id]
+            cv2.putText(frame, str(int(angles[angle_idx])), (joint_coord[0] + dx, joint_coord[1] + dy), self.font, 0.6,
+                        self.COLORS['light_green'], 2, lineType=self.linetype)
+
+        self._draw_counters(frame, frame_width)
+
+        return frame
+
+
+    def _draw_no_pose(self, frame):
+        frame_width = frame.shape[1]
+
+        if self.flip_frame:
+            frame = self._flip(frame)
+
+        self._draw_counters(frame, frame_width)
+
+        return frame
@@ -0,0 +1,185 @@
+import sys
+
+import av
+import cv2
+import numpy as np
+
+
+# Preallocated frame buffers for the WebRTC callback.
+#
+# frame.to_ndarray() and av.VideoFrame.from_ndarray() allocate and convert two full frames per
+# callback. Instead, every session owns a FrameBufferPool sized from the negotiated resolution:
+# incoming yuv420p planes are copied into one I420 buffer and converted into one RGB working
+# buffer that the processors draw on in place, and the result is converted back into one of a
+# few rotating I420 buffers that back pre-built output VideoFrames (from_numpy_buffer shares
+# the memory). An output frame is only reused once nothing downstream (aiortc's encoder,
+# streamlit-webrtc's queues) references it any more; while all of them are held the ring grows.
+#
+# Steady-state frames therefore allocate no pixel memory in the in-place path. Pipelines that
+# keep submitted frames need a fresh array per frame (decode_new). `allocations` counts every
+# buffer the pool created, including those, so this can be checked.
+
+# Output frames handed to the encoder, initially.
+DEFAULT_NUM_OUTPUT = 4
+
+# Upper bound for the output ring; beyond it the oldest frame is reused even if still held.
+MAX_NUM_OUTPUT = 32
+
+
+
+def _plane_view(plane, shape):
+    # Zero-copy view of a (possibly row-padded) av plane.
+    strides = (plane.line_size,) + ((3, 1) if len(shape) == 3 else (1,))
+    return np.ndarray(shape, dtype=np.uint8, buffer=plane, strides=strides)
+
+
+
+class FrameBufferPool:
+    def __init__(self, num_output = DEFAULT_NUM_OUTPUT, max_output = MAX_NUM_OUTPUT):
+        self.num_output = num_output
+        self.max_output = max_output
+
+        self.width = None
+        self.height = None
+
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.fallback_decodes = 0
+        self.busy_reuses = 0
+        self.frames = 0
+
+        self._next_output = 0
+
+
+    def decode(self, frame):
+        # Returns the pooled RGB working buffer holding `frame`. It is overwritten by the next call.
+        self._ensure_size(frame.width, frame.height)
+
+        return self._decode_into(frame, self.rgb)
+
+
+    def decode_new(self, frame):
+        # Like decode(), but into a new RGB array the caller may keep (e.g. for a pipeline that
+        # holds on to submitted frames). Counted in `allocations`.
+        self._ensure_size(frame.width, frame.height)
+
+        return self._decode_into(frame, self._alloc((frame.height, frame.width, 3)))
+
+
+    def encode(self, img, source = None):
+        # Converts an RGB image into the next free pooled output frame, carrying over the timing of `source`.
+        height, width = img.shape[:2]
+        self._ensure_size(width, height)
+
+        buffer, out = self._next_free_output()
+
+        cv2.cvtColor(img, cv2.COLOR_RGB2YUV_I420, dst=buffer)
+
+        if source is not None:
+            out.pts = source.pts
+            out.time_base = source.time_base
+
+        return out
+
+
+    def luma(self, out):
+        # Writable view of the Y plane of a frame returned by encode(). Overlays drawn here only
+        # end up in that outgoing frame, never in the RGB image (which a pipeline may still own).
+        plane = out.planes[0]
+        return _plane_view(plane, (plane.height, plane.width))
+
+
+    def stats(self):
+        return {
+            'resolution'       : '{}x{}'.format(self.width, self.height) if self.width else None,
+            'frames'           : self.frames,
+            'allocations'      : self.allocations,
+            'allocated_bytes'  : self.allocated_bytes,
+            'fallback_decodes' : self.fallback_decodes,
+            'outputs'          : len(self._outputs) if self.width else 0,
+            'busy_reuses'      : self.busy_reuses,
+        }
+
+
+    def _alloc(self, shape):
+        buffer = np.empty(shape, dtype=np.uint8)
+        self.allocations += 1
+        self.allocated_bytes += buffer.nbytes
+
+        return buffer
+
+
+    def _decode_into(self, frame, rgb):
+        self.frames += 1
+
+        format_name = frame.format.name
+
+        if format_name == 'yuv420p':
+            for plane, dst in zip(frame.planes, self._yuv_planes):
+                np.copyto(dst, _plane_view(plane, (plane.height, plane.width)))
+            cv2.cvtColor(self._yuv_in, cv2.COLOR_YUV2RGB_I420, dst=rgb)
+
+        elif format_name == 'rgb24':
+            plane = frame.planes[0]
+            np.copyto(rgb, _plane_view(plane, (plane.height, plane.width, 3)))
+
+        else:
+            # Uncommon formats go through PyAV, which allocates.
+            self.fallback_decodes += 1
+            np.copyto(rgb, frame.to_ndarray(format='rgb24'))
+
+        return rgb
+
+
+    def _new_output(self):
+        buffer = self._alloc((self.height * 3 // 2, self.width))
+        return buffer, av.VideoFrame.from_numpy_buffer(buffer, format='yuv420p')
+
+
+    def _next_free_output(self):
+        # Oldest output frame that only the ring still references.
+        outputs = self._outputs
+        for i in range(len(outputs)):
+            index = (self._next_output + i) % len(outputs)
+            if sys.getrefcount(outputs[index][1]) <= self._idle_refcount:
+                self._next_output = (index + 1) % len(outputs)
+                return outputs[index]
+
+        # Every frame is still queued downstream.
+        if len(outputs) < self.max_output:
+            outputs.insert(self._next_output, self._new_output())
+            self._next_output += 1
+            return outputs[self._next_output - 1]
+
+        self.busy_reuses += 1
+        index = self._next_output
+        self._next_output = (index + 1) % len(outputs)
+        return outputs[index]
+
+
+    def _ensure_size(self, width, height):
+        # (Re)allocates every buffer when the negotiated resolution changes. I420 needs even sizes.
+        if (width, height) == (self.width, self.height):
+            return
+
+        if width % 2 or height % 2:
+            raise ValueError('Frame size needs to be even for I420, got {}x{}'.format(width, height))
+
+        self.width, self.height = width, height
+
+        self.rgb = self._alloc((height, width, 3))
+        self._yuv_in = self._alloc((height * 3 // 2, width))
+
+        flat = self._yuv_in.reshape(-1)
+        y_size, c_size = width * height, (width // 2) * (height // 2)
+        self._yuv_planes = (
+            flat[:y_size].reshape(height, width),
+            flat[y_size:y_size + c_size].reshape(height // 2, width // 2),
+            flat[y_size + c_size:].reshape(height // 2, width // 2),
+        )
+
+        self._outputs = [self._new_output() for _ in range(self.num_output)]
+        self._next_output = 0
+
+        # Reference count of an output frame that nothing outside the ring holds.
+        self._idle_refcount = sys.getrefcount(self._outputs[0][1])
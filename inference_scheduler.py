@@ -0,0 +1,248 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from pose_replay import PrecomputedPose
+
+
+# Shared inference scheduler for many camera streams in one server process.
+#
+# Every stream (one webrtc_streamer session) keeps its own pose graph, so landmark tracking never
+# mixes between members, and its own ProcessFrame state machine. What is shared is a fixed set
+# of worker threads: each stream holds at most one pending frame (a newer frame replaces it), and
+# streams with a pending frame wait in a single round-robin queue, so every stream gets one
+# frame processed per turn however fast its camera sends. A frame that waited longer than the
+# stream's deadline is dropped instead of being processed late.
+#
+# Capacity is workers / service time frames per second in total, independent of how many streams
+# are connected; stats() reports the measured numbers for capacity planning.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEADLINE = 0.1
+
+# A stream that keeps failing logs its traceback at most this often (seconds).
+ERROR_LOG_INTERVAL = 10.0
+
+
+
+class ScheduledStream:
+    # Per-session handle with the same interface as async_pipeline.AsyncFrameProcessor.
+    def __init__(self, scheduler, processor, pose, deadline):
+        self.scheduler = scheduler
+        self.processor = processor
+        self.pose = pose
+        self.deadline = deadline
+
+        self.active = True
+
+        self._pending = None         # (frame, submit time)
+        self._queued = False
+        self._busy = False
+        self._latest_frame = None
+
+        # play_sound values are queued so none are lost when the callback skips results.
+        self.sounds = deque(maxlen = 32)
+
+        self.submitted = 0
+        self.completed = 0
+        self.replaced = 0
+        self.expired = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_latency = None
+        self._error_logged_at = None
+
+
+    def submit(self, frame):
+        self.scheduler._submit(self, frame)
+
+
+    def latest(self):
+        return self._latest_frame
+
+
+    def process(self, frame):
+        # Callback helper: submit the new frame and return the newest finished one (or the input).
+        self.submit(frame)
+        latest = self._latest_frame
+
+        return frame if latest is None else latest
+
+
+    def pop_sound(self):
+        return self.sounds.popleft() if self.sounds else None
+
+
+    def stats(self):
+        return {
+            'submitted'    : self.submitted,
+            'completed'    : self.completed,
+            'replaced'     : self.replaced,
+            'expired'      : self.expired,
+            'errors'       : self.errors,
+            'last_error'   : self.last_error,
+            'last_latency' : self.last_latency,
+        }
+
+
+    def stop(self, timeout = None):
+        self.scheduler.unregister(self)
+
+
+
+class InferenceScheduler:
+    def __init__(self, num_workers = None, deadline = DEFAULT_DEADLINE, poll_interval = 0.1):
+        self.num_workers = num_workers or os.cpu_count()
+        self.deadline = deadline
+        self.poll_interval = poll_interval
+
+        self._cond = threading.Condition()
+        self._ready = deque()
+        self._streams = []
+
+        self.completed = 0
+        self.busy_time = 0.0
+        self.service_ema = None
+        self.started_at = time.perf_counter()
+
+        self._running = True
+        self._threads = [threading.Thread(target = self._worker_loop, name = 'inference-{}'.format(i), daemon = True)
+                         for i in range(self.num_workers)]
+        for thread in self._threads:
+            thread.start()
+
+
+    def register(self, processor, pose, deadline = None):
+        stream = ScheduledStream(self, processor, pose, self.deadline if deadline is None else deadline)
+        with self._cond:
+            self._streams.append(stream)
+
+        return stream
+
+
+    def unregister(self, stream):
+        with self._cond:
+            stream.active = False
+            if stream._queued:
+                self._ready.remove(stream)
+                stream._queued = False
+            stream._pending = None
+            if stream in self._streams:
+                self._streams.remove(stream)
+
+
+    def stats(self, target_fps = 30.0):
+        with self._cond:
+            elapsed = time.perf_counter() - self.started_at
+            service = self.service_ema
+
+            return {
+                'workers'         : self.num_workers,
+                'streams'         : len(self._streams),
+                'ready'           : len(self._ready),
+                'completed'       : self.completed,
+                'utilization'     : self.busy_time / (elapsed * self.num_workers) if elapsed > 0 else 0.0,
+                'service_ms'      : service * 1e3 if service else None,
+                # Total frames per second the workers can sustain, and streams that fit at target_fps.
+                'capacity_fps'    : self.num_workers / service if service else None,
+                'max_streams'     : int(self.num_workers / service / target_fps) if service else None,
+                'expired'         : sum(stream.expired for stream in self._streams),
+                'replaced'        : sum(stream.replaced for stream in self._streams),
+            }
+
+
+    def stop(self, timeout = 1.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+    def _submit(self, stream, frame):
+        with self._cond:
+            if not stream.active:
+                return
+
+            stream.submitted += 1
+            if stream._pending is not None:
+                stream.replaced += 1
+            stream._pending = (frame, time.perf_counter())
+
+            # A stream that is being processed is re-queued when its worker is done.
+            if not stream._busy and not stream._queued:
+                self._ready.append(stream)
+                stream._queued = True
+                self._cond.notify()
+
+
+    def _next_frame(self):
+        # Blocks for the next stream in round-robin order. Returns (stream, frame, submit time) or None on shutdown.
+        with self._cond:
+            while self._running:
+                if not self._ready:
+                    self._cond.wait(self.poll_interval)
+                    continue
+
+                stream = self._ready.popleft()
+                stream._queued = False
+                frame, submitted_at = stream._pending
+                stream._pending = None
+
+                if time.perf_counter() - submitted_at > stream.deadline:
+                    stream.expired += 1
+                    continue
+
+                stream._busy = True
+                return stream, frame, submitted_at
+
+        return None
+
+
+    def _worker_loop(self):
+        precomputed = PrecomputedPose()
+
+        while True:
+            item = self._next_frame()
+            if item is None:
+                return
+
+            stream, frame, submitted_at = item
+            start = time.perf_counter()
+
+            try:
+                precomputed.result = stream.pose.process(frame)
+                precomputed.inference_seconds = time.perf_counter() - start
+                frame, play_sound = stream.processor.process(frame, precomputed)
+
+                if play_sound is not None:
+                    stream.sounds.append(play_sound)
+
+                stream._latest_frame = frame
+                stream.completed += 1
+            except Exception as e:
+                # One broken stream must not take a shared worker down with it.
+                stream.errors += 1
+                stream.last_error = repr(e)
+
+                if stream._error_logged_at is None or start - stream._error_logged_at >= ERROR_LOG_INTERVAL:
+                    stream._error_logged_at = start
+                    logger.exception('inference failed for stream %#x (%d errors so far)', id(stream), stream.errors)
+            finally:
+                end = time.perf_counter()
+                stream.last_latency = end - submitted_at
+
+                with self._cond:
+                    self.completed += 1
+                    self.busy_time += end - start
+                    self.service_ema = end - start if self.service_ema is None else 0.9 * self.service_ema + 0.1 * (end - start)
+
+                    stream._busy = False
+                    if stream.active and stream._pending is not None and not stream._queued:
+                        self._ready.append(stream)
+                        stream._queued = True
+                        self._cond.notify()
@@ -0,0 +1,194 @@
+import math
+import time
+
+import numpy as np
+
+from pose_replay import NUM_LANDMARKS, landmarks_to_array, pose_result_from_array
+from utils import LEFT_LANDMARK_IDS, RIGHT_LANDMARK_IDS, NOSE_LANDMARK_ID
+
+
+# Adaptive low-pass filtering of pose landmarks (One-Euro filter).
+#
+# The lite model (model_complexity=0) jitters by a few pixels from frame to frame, which is
+# enough to flip _get_state between neighbouring states near a threshold and count improper
+# reps. A One-Euro filter removes that jitter while the joint is still and follows quickly when
+# it moves: the cutoff frequency rises with the (filtered) speed,
+#
+#   cutoff = min_cutoff + beta * |dx/dt|
+#
+# so a low min_cutoff kills jitter and a high beta limits lag during a rep. All 33 landmarks are
+# filtered at once as arrays, with per-landmark parameters; x, y and z are filtered, visibility is
+# passed through. Coordinates are normalized, so speeds are in frame widths / heights per second.
+
+DEFAULT_MIN_CUTOFF = 1.0
+DEFAULT_BETA = 20.0
+DEFAULT_D_CUTOFF = 1.0
+
+# Per-joint (min_cutoff, beta), applied to both sides. Wrists and elbows move fastest during a
+# curl and need the least lag; hips and feet barely move and can be filtered harder.
+JOINT_PARAMS = {
+    'wrist'    : (1.5, 30.0),
+    'elbow'    : (1.2, 25.0),
+    'shoulder' : (1.0, 20.0),
+    'hip'      : (0.7, 15.0),
+    'knee'     : (1.0, 20.0),
+    'ankle'    : (0.7, 15.0),
+    'foot'     : (0.5, 10.0),
+}
+
+# Used when the previous timestamp is missing or not increasing.
+FALLBACK_DT = 1 / 30
+
+
+
+def joint_params(min_cutoff = DEFAULT_MIN_CUTOFF, beta = DEFAULT_BETA, overrides = None):
+    # Returns (min_cutoff, beta) arrays of shape (33,). overrides maps a joint name from
+    # JOINT_PARAMS, 'nose' or a landmark index to (min_cutoff, beta) and wins over JOINT_PARAMS.
+    min_cutoffs = np.full(NUM_LANDMARKS, min_cutoff, dtype=np.float64)
+    betas = np.full(NUM_LANDMARKS, beta, dtype=np.float64)
+
+    params = dict(JOINT_PARAMS)
+    params.update(overrides or {})
+
+    for key, (joint_min_cutoff, joint_beta) in params.items():
+        if key == 'nose':
+            ids = [NOSE_LANDMARK_ID]
+        elif isinstance(key, str):
+            ids = [LEFT_LANDMARK_IDS[key], RIGHT_LANDMARK_IDS[key]]
+        else:
+            ids = [key]
+
+        min_cutoffs[ids] = joint_min_cutoff
+        betas[ids] = joint_beta
+
+    return min_cutoffs, betas
+
+
+
+def _alpha(cutoff, dt):
+    # Smoothing factor of an exponential filter with the given cutoff frequency.
+    tau = 1.0 / (2 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+
+class OneEuroFilter:
+    # Filters (33, 4) landmark arrays of x, y, z, visibility; one call per frame.
+    def __init__(self, min_cutoff = DEFAULT_MIN_CUTOFF, beta = DEFAULT_BETA, d_cutoff = DEFAULT_D_CUTOFF, overrides = None):
+        min_cutoffs, betas = joint_params(min_cutoff, beta, overrides)
+
+        # Column vectors so they broadcast over the x, y, z columns.
+        self.min_cutoff = min_cutoffs[:, None]
+        self.beta = betas[:, None]
+        self.d_cutoff = d_cutoff
+
+        self._x = None
+        self._dx = None
+        self._t = None
+
+        # Scratch buffers reused every frame.
+        self._speed = np.empty((NUM_LANDMARKS, 3))
+        self._cutoff = np.empty((NUM_LANDMARKS, 3))
+
+
+    def reset(self):
+        self._x = None
+        self._t = None
+
+
+    def __call__(self, landmarks, t):
+        x = np.asarray(landmarks, dtype=np.float64)
+
+        if self._x is None:
+            self._x = x[:, :3].copy()
+            self._dx = np.zeros_like(self._x)
+            self._t = t
+            return x.astype(np.float32)
+
+        dt = t - self._t if t > self._t else FALLBACK_DT
+        self._t = t
+
+        # Filtered speed, then a speed-dependent cutoff per landmark and axis.
+        a_d = _alpha(self.d_cutoff, dt)
+        np.subtract(x[:, :3], self._x, out = self._speed)
+        self._speed /= dt
+        self._dx += a_d * (self._speed - self._dx)
+
+        np.abs(self._dx, out = self._cutoff)
+        self._cutoff *= self.beta
+        self._cutoff += self.min_cutoff
+
+        # alpha = 1 / (1 + tau / dt) with tau = 1 / (2 pi cutoff), elementwise.
+        self._cutoff *= 2 * math.pi * dt
+        alpha = self._cutoff / (1.0 + self._cutoff)
+
+        self._x += alpha * (x[:, :3] - self._x)
+
+        out = np.empty((NUM_LANDMARKS, 4), dtype=np.float32)
+        out[:, :3] = self._x
+        out[:, 3] = x[:, 3]
+
+        return out
+
+
+
+class SmoothedPose:
+    # Drop-in wrapper around a MediaPipe Pose object that hands back filtered landmarks.
+    # The filter restarts when the pose is lost or frames are more than max_gap seconds apart.
+    def __init__(self, pose, min_cutoff = DEFAULT_MIN_CUTOFF, beta = DEFAULT_BETA, d_cutoff = DEFAULT_D_CUTOFF, overrides = None,
+                 max_gap = 0.5, clock = time.perf_counter):
+        self.pose = pose
+        self.filter = OneEuroFilter(min_cutoff, beta, d_cutoff, overrides)
+        self.max_gap = max_gap
+        self.clock = clock
+
+        self.filtered_frames = 0
+        self.resets = 0
+        self._last_t = None
+
+
+    def process(self, frame):
+        result = self.pose.process(frame)
+        t = self.clock()
+
+        landmarks = landmarks_to_array(result.pose_landmarks)
+
+        if landmarks is None or (self._last_t is not None and t - self._last_t > self.max_gap):
+            self.filter.reset()
+            self.resets += 1
+
+        self._last_t = t
+
+        if landmarks is None:
+            return result
+
+        self.filtered_frames += 1
+
+        return pose_result_from_array(self.filter(landmarks, t))
+
+
+    def stats(self):
+        return {
+            'filtered_frames' : self.filtered_frames,
+            'resets'          : self.resets,
+        }
+
+
+
+def smooth_landmarks(landmark_seq, fps, timestamps = None, **filter_kwargs):
+    # Offline version for (num_frames, 33, 4) sequences; NaN rows (no pose) restart the filter.
+    # timestamps are the frames' media times in seconds (variable frame rate, dropped frames);
+    # without them frames are taken to be 1 / fps apart.
+    one_euro = OneEuroFilter(**filter_kwargs)
+    smoothed = np.array(landmark_seq, dtype=np.float32)
+
+    if timestamps is None:
+        timestamps = np.arange(len(smoothed)) / fps
+
+    for idx in range(len(smoothed)):
+        if np.isnan(smoothed[idx, 0, 0]):
+            one_euro.reset()
+            continue
+        smoothed[idx] = one_euro(smoothed[idx], float(timestamps[idx]))
+
+    return smoothed
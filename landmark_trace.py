@@ -0,0 +1,366 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from pose_replay import NUM_LANDMARKS, landmarks_to_array
+
+
+# Compact on-disk traces of the raw per-frame pose output.
+#
+# A trace stores, for every processed frame, the 33 landmarks (x, y, z, visibility) and a
+# timestamp, so sessions can be re-analysed with new thresholds or state logic without rerunning
+# MediaPipe. Landmarks are stored as int16 fixed point (1/8192 steps, about 0.25 px at 1080p),
+# written in chunks so a crashed recording is still readable up to its last complete chunk.
+#
+# Layout (all little endian, every section 8-byte aligned so it can be viewed straight from a
+# memory map):
+#
+#   header  MAGIC, uint32 header length, uint32 0, JSON header (fps, frame_shape, meta, ...)
+#   chunk   uint32 n, uint32 0, float64 timestamps[n], int16 landmarks[n, 33, 4]    (repeated)
+#   index   int64 [num_chunks, 3] of (first frame, n, offset), int64 num_chunks, INDEX_MAGIC
+#
+# The index is only written on close(); without it the reader walks the chunks instead. The header
+# is written with the first chunk, so a live writer that was not given fps or frame_shape fills
+# them in from the frames it records (the shape passed to append() and the measured frame rate).
+
+MAGIC = b'LMTRACE\x01'
+INDEX_MAGIC = b'LMINDEX\x01'
+
+TRACE_SUFFIX = '.lmtrace'
+
+SCALE = 8192.0
+
+# Stored in the first value of a frame that had no pose.
+MISSING = np.iinfo(np.int16).min
+
+DEFAULT_CHUNK_FRAMES = 256
+
+_FRAME_BYTES = NUM_LANDMARKS * 4 * 2
+
+
+
+def _pad8(n):
+    return (n + 7) // 8 * 8
+
+
+
+def quantize_landmarks(landmark_seq):
+    # (n, 33, 4) float landmarks, NaN rows for missing poses -> (n, 33, 4) int16.
+    landmark_seq = np.asarray(landmark_seq, dtype=np.float32)
+    missing = np.isnan(landmark_seq[:, 0, 0])
+
+    q = np.rint(np.nan_to_num(landmark_seq) * SCALE)
+    q = np.clip(q, MISSING + 1, np.iinfo(np.int16).max).astype(np.int16)
+    q[missing, 0, 0] = MISSING
+
+    return q
+
+
+
+def dequantize_landmarks(q):
+    # Inverse of quantize_landmarks(); missing poses come back as NaN rows.
+    landmark_seq = q.astype(np.float32) / SCALE
+    landmark_seq[q[..., 0, 0] == MISSING] = np.nan
+
+    return landmark_seq
+
+
+
+def measure_fps(timestamps):
+    # Frame rate from the median frame interval, or None with fewer than two distinct timestamps.
+    intervals = np.diff(np.asarray(timestamps, dtype=np.float64))
+    intervals = intervals[intervals > 0]
+    if not len(intervals):
+        return None
+
+    return round(1.0 / float(np.median(intervals)), 3)
+
+
+
+class TraceWriter:
+    # append() / close() may be called from different threads (e.g. a WebRTC callback and the
+    # script thread); frames appended after close() are ignored.
+    def __init__(self, path, fps = None, frame_shape = None, chunk_frames = DEFAULT_CHUNK_FRAMES, meta = None):
+        self.path = path
+        self.fps = float(fps) if fps else None
+        self.frame_shape = tuple(int(d) for d in frame_shape) if frame_shape is not None else None
+        self.chunk_frames = chunk_frames
+        self.meta = meta or {}
+        self.num_frames = 0
+
+        self._file = open(path, 'wb')
+        self._header_written = False
+        self._index = []
+        self._timestamps = []
+        self._landmarks = []
+        self._lock = threading.Lock()
+
+
+    def append(self, landmarks, timestamp, frame_shape = None):
+        # landmarks: (33, 4) array or None when no pose was detected. frame_shape is the shape of
+        # the frame the landmarks came from; it fills in the header if none was given.
+        if landmarks is None:
+            landmarks = np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+
+        with self._lock:
+            if self._file.closed:
+                return
+
+            if self.frame_shape is None and frame_shape is not None:
+                self.frame_shape = tuple(int(d) for d in frame_shape)
+
+            self._landmarks.append(landmarks)
+            self._timestamps.append(timestamp)
+            self.num_frames += 1
+
+            if len(self._landmarks) >= self.chunk_frames:
+                self._flush()
+
+
+    def extend(self, landmark_seq, timestamps):
+        with self._lock:
+            for start in range(0, len(landmark_seq), self.chunk_frames):
+                self._write_chunk(np.asarray(timestamps[start:start + self.chunk_frames], dtype=np.float64),
+                                  quantize_landmarks(landmark_seq[start:start + self.chunk_frames]))
+            self.num_frames += len(landmark_seq)
+
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._flush()
+
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+
+            self._flush()
+            self._write_header()
+
+            index = np.array(self._index, dtype='<i8').reshape(-1, 3)
+            self._file.write(index.tobytes() + np.array([len(index)], dtype='<i8').tobytes() + INDEX_MAGIC)
+            self._file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _flush(self):
+        if self._landmarks:
+            self._write_chunk(np.array(self._timestamps, dtype=np.float64), quantize_landmarks(np.stack(self._landmarks)))
+            self._timestamps.clear()
+            self._landmarks.clear()
+        self._file.flush()
+
+
+    def _write_header(self, timestamps = None):
+        if self._header_written:
+            return
+        self._header_written = True
+
+        if self.fps is None and timestamps is not None:
+            self.fps = measure_fps(timestamps)
+
+        header = json.dumps({
+            'version'     : 1,
+            'fps'         : self.fps,
+            'frame_shape' : list(self.frame_shape) if self.frame_shape is not None else None,
+            'landmarks'   : NUM_LANDMARKS,
+            'scale'       : SCALE,
+            'meta'        : self.meta,
+        }).encode()
+        header += b' ' * (_pad8(len(header)) - len(header))
+
+        self._file.write(MAGIC + np.array([len(header), 0], dtype='<u4').tobytes() + header)
+
+
+    def _write_chunk(self, timestamps, q):
+        self._write_header(timestamps)
+
+        first_frame = self._index[-1][0] + self._index[-1][1] if self._index else 0
+        self._index.append((first_frame, len(q), self._file.tell()))
+
+        self._file.write(np.array([len(q), 0], dtype='<u4').tobytes())
+        self._file.write(timestamps.astype('<f8').tobytes())
+        self._file.write(q.astype('<i2').tobytes())
+
+
+
+class TraceReader:
+    # Memory-mapped, read-only view of a trace. Indexing returns (33, 4) float32 landmarks (NaN for
+    # no pose), so a reader can be passed anywhere a landmark sequence is expected, e.g. ReplayPose.
+    def __init__(self, path):
+        self.path = path
+        self._map = np.memmap(path, dtype=np.uint8, mode='r')
+
+        if bytes(self._map[:8]) != MAGIC:
+            raise ValueError('Not a landmark trace: {}'.format(path))
+
+        header_len = int(self._map[8:12].view('<u4')[0])
+        self.header = json.loads(bytes(self._map[16:16 + header_len]))
+        self.fps = self.header['fps']
+        self.frame_shape = tuple(self.header['frame_shape']) if self.header['frame_shape'] else None
+        self.meta = self.header['meta']
+
+        index = self._read_index()
+        if index is None:
+            index = self._scan_chunks(16 + header_len)
+
+        self._chunk_first = index[:, 0].copy()
+        self._chunks = [self._chunk_views(n, offset) for _, n, offset in index.tolist()]
+        self.num_frames = int(index[:, 1].sum())
+
+
+    def __len__(self):
+        return self.num_frames
+
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(self.num_frames)
+            return self.landmarks(start, stop)[::step]
+
+        if idx < 0:
+            idx += self.num_frames
+        if not 0 <= idx < self.num_frames:
+            raise IndexError('Frame {} out of range for a trace of {} frames'.format(idx, self.num_frames))
+
+        chunk = np.searchsorted(self._chunk_first, idx, side='right') - 1
+        _, q = self._chunks[chunk]
+
+        return dequantize_landmarks(q[idx - self._chunk_first[chunk]][None])[0]
+
+
+    def landmarks(self, start = 0, stop = None):
+        # Decoded (n, 33, 4) float32 landmarks for frames [start, stop).
+        stop = self.num_frames if stop is None else min(stop, self.num_frames)
+        if start >= stop:
+            return np.empty((0, NUM_LANDMARKS, 4), dtype=np.float32)
+
+        return dequantize_landmarks(self._gather(1, start, stop))
+
+
+    @property
+    def timestamps(self):
+        if not self.num_frames:
+            return np.empty((0,), dtype=np.float64)
+
+        return self._gather(0, 0, self.num_frames).astype(np.float64)
+
+
+    def close(self):
+        self._chunks = []
+        self._map = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _gather(self, part, start, stop):
+        first = np.searchsorted(self._chunk_first, start, side='right') - 1
+        last = np.searchsorted(self._chunk_first, stop - 1, side='right') - 1
+
+        pieces = []
+        for chunk in range(first, last + 1):
+            base = self._chunk_first[chunk]
+            pieces.append(self._chunks[chunk][part][max(start - base, 0):stop - base])
+
+        return np.concatenate(pieces)
+
+
+    def _chunk_views(self, n, offset):
+        timestamps = np.ndarray((n,), dtype='<f8', buffer=self._map, offset=offset + 8)
+        q = np.ndarray((n, NUM_LANDMARKS, 4), dtype='<i2', buffer=self._map, offset=offset + 8 + n * 8)
+
+        return timestamps, q
+
+
+    def _read_index(self):
+        size = len(self._map)
+        if size < 16 or bytes(self._map[size - 8:]) != INDEX_MAGIC:
+            return None
+
+        num_chunks = int(self._map[size - 16:size - 8].view('<i8')[0])
+        start = size - 16 - num_chunks * 24
+
+        return np.array(self._map[start:size - 16].view('<i8')).reshape(-1, 3)
+
+
+    def _scan_chunks(self, offset):
+        # Recovery path for traces that were never closed: stop at the first incomplete chunk.
+        size = len(self._map)
+        index = []
+        first_frame = 0
+
+        while offset + 8 <= size:
+            n = int(self._map[offset:offset + 4].view('<u4')[0])
+            end = offset + 8 + n * (8 + _FRAME_BYTES)
+            if n == 0 or end > size:
+                break
+
+            index.append((first_frame, n, offset))
+            first_frame += n
+            offset = end
+
+        return np.array(index, dtype=np.int64).reshape(-1, 3)
+
+
+
+def save_trace(path, landmark_seq, fps = None, frame_shape = None, timestamps = None, meta = None):
+    # Writes a whole (num_frames, 33, 4) landmark sequence. Timestamps default to frame_idx / fps.
+    if timestamps is None:
+        timestamps = np.arange(len(landmark_seq)) / (fps or 1.0)
+
+    with TraceWriter(path, fps, frame_shape, meta = meta) as writer:
+        writer.extend(landmark_seq, timestamps)
+
+
+
+def load_landmarks(path):
+    # Landmark sequence from either a trace or a .npy array.
+    if path.endswith(TRACE_SUFFIX):
+        with TraceReader(path) as reader:
+            return reader.landmarks()
+
+    return np.load(path)
+
+
+
+def session_trace_path(directory, name):
+    os.makedirs(directory, exist_ok = True)
+    return os.path.join(directory, '{}-{}{}'.format(name, time.strftime('%Y%m%d-%H%M%S'), TRACE_SUFFIX))
+
+
+
+class RecordingPose:
+    # Wraps a Pose object and records every result it returns into a TraceWriter.
+    def __init__(self, pose, writer, clock = time.time):
+        self.pose = pose
+        self.writer = writer
+        self.clock = clock
+
+
+    def process(self, frame):
+        result = self.pose.process(frame)
+        self.writer.append(landmarks_to_array(result.pose_landmarks), self.clock(), frame.shape)
+
+        return result
+
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1,41 @@
+# Clocks for the exercise processors.
+#
+# ExerciseProcessor times inactivity (INACTIVE_THRESH) with its `clock`, a callable returning
+# seconds. Live sessions use the wall clock. Offline replay runs many times faster than real time,
+# so a wall clock would reset counters at the wrong moments and make the result depend on machine
+# speed. A MediaClock instead reports the timestamp of the frame being processed: set it to the
+# frame's presentation time (av.VideoFrame), its recorded trace timestamp or frame_idx / fps
+# before calling process().
+
+
+
+class MediaClock:
+    # Never runs backwards: if the timestamps jump back (e.g. a stream restarts its PTS at 0) the
+    # clock carries on from where it was, so no inactivity is counted for the jump.
+    def __init__(self, start = 0.0):
+        self.time = start
+        self._offset = 0.0
+        self._last = None
+
+
+    def __call__(self):
+        return self.time
+
+
+    def set(self, timestamp):
+        if self._last is not None and timestamp < self._last:
+            self._offset += self._last - timestamp
+        self._last = timestamp
+        self.time = timestamp + self._offset
+
+
+    def set_frame(self, frame, fallback = None):
+        # Presentation time of an av.VideoFrame in seconds (pts * time_base). Frames without a pts
+        # use fallback (e.g. frame_idx / fps) if given, else leave the clock where it is.
+        timestamp = frame.time if frame.time is not None else fallback
+        if timestamp is not None:
+            self.set(timestamp)
+
+
+    def set_frame_index(self, frame_idx, fps):
+        self.set(frame_idx / fps)
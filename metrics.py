@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+# Per-stage latency instrumentation for the live frame path.
+#
+# Each session owns a SessionMetrics with one rolling histogram per stage. The frame processors
+# time their stages through a StageTimer (pose, landmarks, state, draw, flip); the WebRTC callback
+# adds decode, encode and callback totals. All sessions are registered in REGISTRY, which renders
+# p50/p95/p99 in the Prometheus text format over HTTP or into a textfile.
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Order in which stages are listed on the debug HUD.
+HUD_STAGES = ('decode', 'pose', 'landmarks', 'state', 'draw', 'flip', 'encode', 'callback')
+
+
+
+class RollingHistogram:
+    # Fixed-size ring buffer of the most recent observations.
+    def __init__(self, size = 1024):
+        self.values = np.zeros((size,), dtype=np.float64)
+        self.count = 0
+        self.total = 0.0
+
+
+    def observe(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+        self.total += value
+
+
+    def quantiles(self, qs = QUANTILES):
+        filled = self.values[:min(self.count, len(self.values))]
+        if not len(filled):
+            return [float('nan')] * len(qs)
+        return np.quantile(filled, qs).tolist()
+
+
+
+class StageTimer:
+    # Accumulates per-stage time for one frame; finish() pushes the totals into the histograms.
+    __slots__ = ('metrics', 'frame_start', 'last', 'laps')
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.laps = {}
+        self.frame_start = self.last = 0.0
+
+
+    def start(self):
+        self.laps.clear()
+        self.frame_start = self.last = time.perf_counter()
+
+
+    def lap(self, stage, seconds = None):
+        # Attributes the time since the previous lap (or start) to `stage`, or `seconds` if the
+        # stage actually ran elsewhere (e.g. pose inference on a pipeline's inference thread).
+        now = time.perf_counter()
+        self.laps[stage] = self.laps.get(stage, 0.0) + (now - self.last if seconds is None else seconds)
+        self.last = now
+
+
+    def finish(self, total_stage = 'process'):
+        for stage, elapsed in self.laps.items():
+            self.metrics.observe(stage, elapsed)
+        self.metrics.observe(total_stage, self.last - self.frame_start)
+
+
+
+class _NullTimer:
+    # Used when instrumentation is off; every call is a no-op.
+    __slots__ = ()
+
+    def start(self):
+        pass
+
+    def lap(self, stage, seconds = None):
+        pass
+
+    def finish(self, total_stage = 'process'):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+
+class SessionMetrics:
+    def __init__(self, session_id, histogram_size = 1024):
+        self.session_id = session_id
+        self.histogram_size = histogram_size
+        self.histograms = {}
+        self.timer = StageTimer(self)
+
+
+    def observe(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = RollingHistogram(self.histogram_size)
+        histogram.observe(seconds)
+
+
+    def summary(self):
+        # stage -> {'p50': ..., 'p95': ..., 'p99': ..., 'count': ...} in milliseconds.
+        out = {}
+        for stage, histogram in list(self.histograms.items()):
+            p50, p95, p99 = histogram.quantiles()
+            out[stage] = {'p50': p50 * 1e3, 'p95': p95 * 1e3, 'p99': p99 * 1e3, 'count': histogram.count}
+        return out
+
+
+
+class MetricsRegistry:
+    def __init__(self):
+        # Sessions disappear from the export once Streamlit drops them.
+        self._sessions = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+
+    def session(self, session_id):
+        with self._lock:
+            metrics = self._sessions.get(session_id)
+            if metrics is None:
+                metrics = SessionMetrics(session_id)
+                self._sessions[session_id] = metrics
+            return metrics
+
+
+    def remove(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+    def render_prometheus(self):
+        lines = [
+            '# HELP fitness_stage_latency_seconds Per-stage frame processing latency over the most recent frames.',
+            '# TYPE fitness_stage_latency_seconds summary',
+        ]
+
+        with self._lock:
+            sessions = list(self._sessions.values())
+
+        for metrics in sessions:
+            for stage, histogram in list(metrics.histograms.items()):
+                labels = 'session="{}",stage="{}"'.format(metrics.session_id, stage)
+                for q, value in zip(QUANTILES, histogram.quantiles()):
+                    lines.append('fitness_stage_latency_seconds{{{},quantile="{}"}} {:.6g}'.format(labels, q, value))
+                lines.append('fitness_stage_latency_seconds_sum{{{}}} {:.6g}'.format(labels, histogram.total))
+                lines.append('fitness_stage_latency_seconds_count{{{}}} {}'.format(labels, histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+
+    def write_textfile(self, path):
+        # Written atomically so a scraper never reads a partial file.
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render_prometheus())
+
+        os.replace(tmp_path, path)
+
+
+
+REGISTRY = MetricsRegistry()
+
+
+
+def start_metrics_server(port, registry = REGISTRY, host = '0.0.0.0'):
+    # Serves the registry at http://host:port/metrics from a daemon thread.
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') not in ('', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+
+    return server
+
+
+
+def start_textfile_writer(path, interval = 10.0, registry = REGISTRY):
+    def run():
+        while True:
+            registry.write_textfile(path)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='metrics-textfile', daemon=True)
+    thread.start()
+
+    return thread
+
+
+
+def draw_metrics_hud(frame, metrics, stages = HUD_STAGES):
+    # Debug overlay: p50 / p95 per stage in the bottom left corner. frame is an RGB image or a
+    # single luma plane (e.g. FrameBufferPool.luma() of the outgoing frame).
+    import cv2
+
+    summary = metrics.summary()
+    rows = [stage for stage in stages if stage in summary]
+
+    y = frame.shape[0] - 15 * len(rows) - 10
+    for stage in rows:
+        line = '{:<9} p50 {:6.2f}  p95 {:6.2f} ms'.format(stage, summary[stage]['p50'], summary[stage]['p95'])
+        cv2.putText(frame, line, (10, y), cv2.FONT_HERSHEY_PLAIN, 1.0, (255, 255, 255), 1, cv2.LINE_AA)
+        y += 15
+
+    return frame
@@ -0,0 +1,280 @@
+import inspect
+import itertools
+import threading
+import time
+import weakref
+from collections import deque
+
+
+# Process-wide pool of MediaPipe Pose graphs shared by all Streamlit sessions.
+#
+# At most max_instances graphs are alive at once, across all settings. Sessions check a graph out
+# for as long as they need it and give it back when done (or when their lease is garbage
+# collected). When the pool is exhausted callers wait in FIFO order. Graphs that have been idle
+# for longer than idle_timeout are closed.
+
+
+
+def _settings_key(settings):
+    return tuple(sorted(settings.items()))
+
+
+
+def _default_factory(**settings):
+    from utils import get_mediapipe_pose
+    return get_mediapipe_pose(**settings)
+
+
+
+def _factory_defaults(factory):
+    # Keyword defaults of the graph factory, e.g. {'model_complexity': 1, ...} for get_mediapipe_pose.
+    if factory is _default_factory:
+        from utils import get_mediapipe_pose
+        factory = get_mediapipe_pose
+
+    try:
+        params = inspect.signature(factory).parameters.values()
+    except (TypeError, ValueError):
+        return {}
+
+    return {param.name: param.default for param in params
+            if param.default is not param.empty and param.kind in (param.POSITIONAL_OR_KEYWORD, param.KEYWORD_ONLY)}
+
+
+
+def _close_pose(pose):
+    close = getattr(pose, 'close', None)
+    if close is not None:
+        close()
+
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+
+class PoseLease:
+    # A checked-out pose graph. Usable wherever a Pose object is expected.
+    def __init__(self, pool, key, pose):
+        self.key = key
+        self.pose = pose
+        self._finalizer = weakref.finalize(self, pool._release, key, pose)
+
+
+    def process(self, frame):
+        return self.pose.process(frame)
+
+
+    @property
+    def released(self):
+        return not self._finalizer.alive
+
+
+    def release(self):
+        self._finalizer()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+
+class PosePool:
+    def __init__(self, max_instances = 4, idle_timeout = 300.0, factory = _default_factory):
+        if max_instances < 1:
+            raise ValueError('max_instances needs to be at least 1')
+
+        self.max_instances = max_instances
+        self.idle_timeout = idle_timeout
+        self.factory = factory
+
+        # Filled in on first use (reading them imports utils).
+        self._defaults = None
+
+        self._cond = threading.Condition()
+        self._idle = {}              # settings key -> deque of (pose, released_at)
+        self._in_use = 0
+        self._waiters = deque()
+        self._tickets = itertools.count()
+
+        self.created = 0
+        self.evicted = 0
+        self.checkouts = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+    @property
+    def live(self):
+        return self._in_use + sum(len(idle) for idle in self._idle.values())
+
+
+    def checkout(self, timeout = None, **settings):
+        # Blocks until a graph with the given get_mediapipe_pose() settings is available.
+        key = self._key(settings)
+        ticket = next(self._tickets)
+        start = time.perf_counter()
+        deadline = None if timeout is None else start + timeout
+
+        with self._cond:
+            self._waiters.append(ticket)
+            try:
+                while True:
+                    self._evict_expired()
+
+                    if self._waiters[0] == ticket:
+                        pose = self._take(key)
+                        if pose is not None:
+                            break
+
+                    remaining = None if deadline is None else deadline - time.perf_counter()
+                    if remaining is not None and remaining <= 0:
+                        raise PoolTimeout('No pose graph became available within {:.1f}s'.format(timeout))
+
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters.remove(ticket)
+                self._cond.notify_all()
+
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self._in_use += 1
+            if waited > 0.001:
+                self.wait_count += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+        # Creating a graph is slow; do it outside the lock. The slot is already counted in _in_use.
+        if pose is _CREATE:
+            try:
+                pose = self.factory(**settings)
+            except BaseException:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                self.created += 1
+
+        return PoseLease(self, key, pose)
+
+
+    def prewarm(self, warm_frame = None, **settings):
+        # Builds a graph ahead of the first checkout, runs it once on warm_frame (graph start-up and
+        # model loading happen on the first process() call) and parks it as idle. Does nothing if
+        # a graph with these settings is already idle or the pool is full. Returns whether it did.
+        key = self._key(settings)
+
+        with self._cond:
+            if self._idle.get(key) or self.live >= self.max_instances:
+                return False
+            self._in_use += 1
+
+        try:
+            pose = self.factory(**settings)
+            if warm_frame is not None:
+                pose.process(warm_frame)
+        except BaseException:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify_all()
+            raise
+
+        # Not through _release(): resetting would throw the warm state away again.
+        with self._cond:
+            self.created += 1
+            self._in_use -= 1
+            self._idle.setdefault(key, deque()).append((pose, time.perf_counter()))
+            self._cond.notify_all()
+
+        return True
+
+
+    def evict_idle(self):
+        with self._cond:
+            self._evict_expired()
+
+
+    def close(self):
+        with self._cond:
+            for idle in self._idle.values():
+                for pose, _ in idle:
+                    _close_pose(pose)
+                    self.evicted += 1
+            self._idle.clear()
+
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_instances'  : self.max_instances,
+                'live'           : self.live,
+                'in_use'         : self._in_use,
+                'idle'           : self.live - self._in_use,
+                'waiting'        : len(self._waiters),
+                'occupancy'      : self._in_use / self.max_instances,
+                'created'        : self.created,
+                'evicted'        : self.evicted,
+                'checkouts'      : self.checkouts,
+                'waited'         : self.wait_count,
+                'wait_mean'      : self.wait_total / self.checkouts if self.checkouts else 0.0,
+                'wait_max'       : self.wait_max,
+            }
+
+
+    def _key(self, settings):
+        # Settings are completed with the factory defaults, so checkout() and
+        # checkout(model_complexity=1) share graphs instead of building one each.
+        if self._defaults is None:
+            self._defaults = _factory_defaults(self.factory)
+
+        return _settings_key(dict(self._defaults, **settings))
+
+
+    def _take(self, key):
+        # Called with the lock held. Returns an idle graph, _CREATE, or None if the pool is full.
+        idle = self._idle.get(key)
+        if idle:
+            return idle.pop()[0]
+
+        if self.live < self.max_instances:
+            return _CREATE
+
+        # Full, but an idle graph with other settings can make room.
+        for other_idle in self._idle.values():
+            if other_idle:
+                _close_pose(other_idle.popleft()[0])
+                self.evicted += 1
+                return _CREATE
+
+        return None
+
+
+    def _release(self, key, pose):
+        reset = getattr(pose, 'reset', None)
+        if reset is not None:
+            reset()
+
+        with self._cond:
+            self._in_use -= 1
+            self._idle.setdefault(key, deque()).append((pose, time.perf_counter()))
+            self._cond.notify_all()
+
+
+    def _evict_expired(self):
+        now = time.perf_counter()
+        for idle in self._idle.values():
+            while idle and now - idle[0][1] > self.idle_timeout:
+                _close_pose(idle.popleft()[0])
+                self.evicted += 1
+
+
+
+# Marker returned by PosePool._take() when a new graph should be created.
+_CREATE = object()
@@ -0,0 +1,76 @@
+from collections import namedtuple
+import numpy as np
+from utils import get_landmark_matrix
+
+
+# Mirrors the attributes of a MediaPipe NormalizedLandmark that the frame processors read.
+Landmark = namedtuple('Landmark', ['x', 'y', 'z', 'visibility'])
+
+NUM_LANDMARKS = 33
+
+
+
+class _LandmarkList:
+    def __init__(self, landmark):
+        self.landmark = landmark
+
+
+
+class PoseResult:
+    # Stand-in for the object returned by mp.solutions.pose.Pose.process().
+    def __init__(self, pose_landmarks = None):
+        self.pose_landmarks = pose_landmarks
+
+
+
+def landmarks_to_array(pose_landmarks):
+    # Returns a (33, 4) float32 array of x, y, z, visibility, or None if no pose was detected.
+    if not pose_landmarks:
+        return None
+
+    return get_landmark_matrix(pose_landmarks.landmark).astype(np.float32)
+
+
+
+def pose_result_from_array(landmarks):
+    # Inverse of landmarks_to_array(). Rows filled with NaN mean "no pose detected".
+    if landmarks is None or np.isnan(landmarks[0, 0]):
+        return PoseResult()
+
+    return PoseResult(_LandmarkList([Landmark(*row) for row in landmarks.tolist()]))
+
+
+
+class ReplayPose:
+    # Drop-in replacement for a MediaPipe Pose object that hands back precomputed landmarks,
+    # one entry per call to process(), in order. The frame passed in is ignored.
+    def __init__(self, landmark_seq):
+        self.landmark_seq = landmark_seq
+        self.index = 0
+
+
+    def __len__(self):
+        return len(self.landmark_seq)
+
+
+    def process(self, frame):
+        if self.index >= len(self.landmark_seq):
+            raise IndexError('ReplayPose exhausted after {} frames'.format(self.index))
+
+        result = pose_result_from_array(self.landmark_seq[self.index])
+        self.index += 1
+
+        return result
+
+
+
+class PrecomputedPose:
+    # Pose stand-in that returns a result which was computed elsewhere (e.g. on another thread).
+    # inference_seconds is how long computing it took there; the processor reports it as 'pose'.
+    def __init__(self, result = None, inference_seconds = None):
+        self.result = result
+        self.inference_seconds = inference_seconds
+
+
+    def process(self, frame):
+        return self.result
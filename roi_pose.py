@@ -0,0 +1,126 @@
+import cv2
+import numpy as np
+
+from pose_replay import landmarks_to_array, pose_result_from_array
+
+
+# Region-of-interest cropping for pose inference.
+#
+# The previous frame's landmarks give a padded square box around the athlete. Only that crop,
+# downscaled to at most input_size pixels per side, is handed to pose.process; the landmarks are
+# then mapped back to full-frame normalized coordinates, so get_landmark_features and the
+# processors never see the crop. When tracking is lost the full frame is used again.
+
+
+
+class RoiCropPose:
+    # Drop-in wrapper around a MediaPipe Pose object.
+    def __init__(self, pose, padding = 0.3, input_size = 256, min_visibility = 0.5, max_area_ratio = 0.8):
+        self.pose = pose
+        self.padding = padding
+        self.input_size = input_size
+        self.min_visibility = min_visibility
+        self.max_area_ratio = max_area_ratio
+
+        # Current crop as pixel bounds (x0, y0, x1, y1), or None to use the full frame.
+        self.roi = None
+
+        self.roi_frames = 0
+        self.full_frames = 0
+        self.pixels_in = 0
+        self.pixels_total = 0
+
+
+    def process(self, frame):
+        frame_height, frame_width = frame.shape[:2]
+        self.pixels_total += frame_height * frame_width
+
+        landmarks = None
+
+        if self.roi is not None:
+            landmarks = self._process_roi(frame, self.roi)
+
+        # No ROI yet or tracking lost inside it: fall back to the full frame.
+        if landmarks is None:
+            self.full_frames += 1
+            self.pixels_in += frame_height * frame_width
+            landmarks = landmarks_to_array(self.pose.process(frame).pose_landmarks)
+
+        self.roi = self._update_roi(landmarks, frame_width, frame_height)
+
+        return pose_result_from_array(landmarks)
+
+
+    def stats(self):
+        return {
+            'roi_frames'  : self.roi_frames,
+            'full_frames' : self.full_frames,
+            'pixel_ratio' : self.pixels_in / self.pixels_total if self.pixels_total else None,
+        }
+
+
+    def _process_roi(self, frame, roi):
+        frame_height, frame_width = frame.shape[:2]
+        x0, y0, x1, y1 = roi
+        crop_w, crop_h = x1 - x0, y1 - y0
+
+        crop = frame[y0:y1, x0:x1]
+        scale = min(1.0, self.input_size / max(crop_w, crop_h))
+
+        if scale < 1.0:
+            crop = cv2.resize(crop, (max(1, round(crop_w * scale)), max(1, round(crop_h * scale))), interpolation=cv2.INTER_AREA)
+        else:
+            crop = np.ascontiguousarray(crop)
+
+        self.roi_frames += 1
+        self.pixels_in += crop.shape[0] * crop.shape[1]
+
+        landmarks = landmarks_to_array(self.pose.process(crop).pose_landmarks)
+        if landmarks is None:
+            self.roi = None
+            return None
+
+        # Crop-normalized -> frame-normalized coordinates. z shares the scale of x.
+        landmarks[:, 0] = (landmarks[:, 0] * crop_w + x0) / frame_width
+        landmarks[:, 1] = (landmarks[:, 1] * crop_h + y0) / frame_height
+        landmarks[:, 2] = landmarks[:, 2] * crop_w / frame_width
+
+        return landmarks
+
+
+    def _update_roi(self, landmarks, frame_width, frame_height):
+        if landmarks is None:
+            return None
+
+        visible = landmarks[landmarks[:, 3] >= self.min_visibility]
+        if len(visible) < 2:
+            return None
+
+        xs = visible[:, 0] * frame_width
+        ys = visible[:, 1] * frame_height
+        bx0, bx1, by0, by1 = xs.min(), xs.max(), ys.min(), ys.max()
+
+        # Keep the current crop while the athlete stays well inside it; a stable crop keeps
+        # MediaPipe's own tracking consistent from frame to frame.
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.roi
+            margin = 0.5 * self.padding * max(bx1 - bx0, by1 - by0)
+            if bx0 - margin >= x0 and by0 - margin >= y0 and bx1 + margin <= x1 and by1 + margin <= y1:
+                return self.roi
+
+        side = max(bx1 - bx0, by1 - by0) * (1 + 2 * self.padding)
+        cx, cy = (bx0 + bx1) / 2, (by0 + by1) / 2
+
+        x0 = int(max(0, cx - side / 2))
+        y0 = int(max(0, cy - side / 2))
+        x1 = int(min(frame_width, cx + side / 2))
+        y1 = int(min(frame_height, cy + side / 2))
+
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return None
+
+        # Not worth cropping when the athlete fills most of the frame.
+        if (x1 - x0) * (y1 - y0) > self.max_area_ratio * frame_width * frame_height:
+            return None
+
+        return (x0, y0, x1, y1)
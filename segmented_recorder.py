@@ -0,0 +1,260 @@
+import os
+import queue
+import threading
+import time
+import weakref
+from collections import deque
+from fractions import Fraction
+
+import numpy as np
+
+from landmark_trace import TRACE_SUFFIX, TraceWriter
+
+
+# Background session recording.
+#
+# The frame path only copies the frame into one of a fixed number of recorder-owned buffers and
+# queues it; a dedicated thread encodes and writes it. When every buffer is queued (the encoder
+# is behind) the frame is dropped and counted instead of stalling the live stream. Output is split
+# into segments of segment_seconds, each its own file named after the session:
+#
+#   <directory>/<name>-<mode>-<YYYYmmdd-HHMMSS>-<segment>.mp4      (raw / annotated)
+#   <directory>/<name>-landmarks-<YYYYmmdd-HHMMSS>-<segment>.lmtrace
+#
+# In landmarks mode the recorder takes the place of a TraceWriter (e.g. behind RecordingPose)
+# and no video is encoded at all.
+#
+# close() finalizes the current segment (mp4 trailer / trace index). A recorder that is never
+# closed is finalized at interpreter exit, before its daemon encoder thread is stopped.
+
+RECORD_MODES = ('annotated', 'raw', 'landmarks')
+
+DEFAULT_SEGMENT_SECONDS = 300.0
+DEFAULT_QUEUE_SIZE = 16
+
+# Landmark records are tiny, so landmarks mode queues this many times more of them.
+LANDMARK_QUEUE_FACTOR = 64
+
+# Video timestamps are written in milliseconds, so dropped frames keep the real timing.
+TIME_BASE = Fraction(1, 1000)
+
+# Frame rate hint for the video encoder when none is given; the timing itself comes from the pts.
+DEFAULT_VIDEO_RATE = 30
+
+PREFERRED_CODECS = ('libx264', 'h264', 'mpeg4')
+
+# Recording runs next to live inference, so trade file size for encoder CPU.
+CODEC_OPTIONS = {'libx264': {'preset': 'veryfast'}}
+
+
+
+def pick_codec():
+    import av
+
+    for name in PREFERRED_CODECS:
+        try:
+            av.codec.Codec(name, 'w')
+            return name
+        except Exception:
+            continue
+
+    raise RuntimeError('None of the video encoders {} is available'.format(', '.join(PREFERRED_CODECS)))
+
+
+
+class SegmentedRecorder:
+    def __init__(self, directory, name, mode = 'annotated', segment_seconds = DEFAULT_SEGMENT_SECONDS, queue_size = DEFAULT_QUEUE_SIZE,
+                 fps = None, codec = None, clock = time.time):
+
+        if mode not in RECORD_MODES:
+            raise ValueError('Unknown recording mode {!r}, expected one of {}'.format(mode, ', '.join(RECORD_MODES)))
+
+        os.makedirs(directory, exist_ok = True)
+
+        self.directory = directory
+        self.name = name
+        self.mode = mode
+        self.segment_seconds = segment_seconds
+        self.fps = fps
+        self.codec = codec or (pick_codec() if mode != 'landmarks' else None)
+        self.clock = clock
+        self.queue_size = queue_size
+
+        # Frame buffers are allocated on first use (and again if the resolution changes).
+        self._free = deque([None] * queue_size)
+        self._queue = queue.Queue()
+
+        self.segments = []
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.allocations = 0
+
+        self._started = time.strftime('%Y%m%d-%H%M%S')
+        self._output = None           # av container / TraceWriter of the current segment
+        self._stream = None
+        self._segment_start = None
+        self._last_pts = -1
+        self._closed = False
+
+        self._thread = threading.Thread(target = self._run, name = 'recorder-{}'.format(name), daemon = True)
+        self._thread.start()
+
+        self._finalizer = weakref.finalize(self, _finish, self._queue, self._thread)
+
+
+    def submit(self, img, timestamp = None):
+        # Frame path (raw / annotated modes): copies img into a free buffer, never blocks.
+        if self._closed:
+            return
+
+        self.submitted += 1
+
+        try:
+            buffer = self._free.popleft()
+        except IndexError:
+            self.dropped += 1
+            return
+
+        if buffer is None or buffer.shape != img.shape:
+            buffer = np.empty(img.shape, dtype=np.uint8)
+            self.allocations += 1
+
+        np.copyto(buffer, img)
+        self._queue.put_nowait(('frame', buffer, self.clock() if timestamp is None else timestamp))
+
+
+    def append(self, landmarks, timestamp, frame_shape = None):
+        # TraceWriter interface for landmarks mode; landmarks is a (33, 4) array or None.
+        if self._closed:
+            return
+
+        self.submitted += 1
+
+        if self._queue.qsize() >= self.queue_size * LANDMARK_QUEUE_FACTOR:
+            self.dropped += 1
+            return
+
+        self._queue.put_nowait(('landmarks', (None if landmarks is None else np.array(landmarks), frame_shape), timestamp))
+
+
+    def stats(self):
+        return {
+            'mode'      : self.mode,
+            'segments'  : len(self.segments),
+            'current'   : self.segments[-1] if self.segments else None,
+            'submitted' : self.submitted,
+            'written'   : self.written,
+            'dropped'   : self.dropped,
+            'queued'    : self._queue.qsize(),
+            'errors'    : self.errors,
+        }
+
+
+    def close(self, timeout = 10.0):
+        # Writes out what is queued and finalizes the current segment.
+        self._closed = True
+
+        if self._finalizer.detach() is not None:
+            _finish(self._queue, self._thread, timeout)
+
+
+    # ----------------------------------------- ENCODER THREAD -----------------------------------------
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            kind, payload, timestamp = item
+
+            try:
+                if kind == 'frame':
+                    self._write_frame(payload, timestamp)
+                else:
+                    self._write_landmarks(*payload, timestamp)
+                self.written += 1
+            except Exception:
+                # A bad frame or full disk must not kill the recorder thread.
+                self.errors += 1
+            finally:
+                if kind == 'frame':
+                    self._free.append(payload)
+
+        try:
+            self._close_segment()
+        except Exception:
+            self.errors += 1
+
+
+    def _segment_path(self, suffix):
+        return os.path.join(self.directory, '{}-{}-{}-{:03d}{}'.format(self.name, self.mode, self._started, len(self.segments), suffix))
+
+
+    def _needs_new_segment(self, timestamp):
+        return self._output is None or timestamp - self._segment_start >= self.segment_seconds
+
+
+    def _write_frame(self, img, timestamp):
+        import av
+
+        height, width = img.shape[:2]
+
+        if self._needs_new_segment(timestamp) or (self._stream.width, self._stream.height) != (width, height):
+            self._close_segment()
+
+            path = self._segment_path('.mp4')
+            self._output = av.open(path, 'w')
+            self._stream = self._output.add_stream(self.codec, rate = self.fps or DEFAULT_VIDEO_RATE)
+            self._stream.width, self._stream.height = width, height
+            self._stream.pix_fmt = 'yuv420p'
+            self._stream.options = CODEC_OPTIONS.get(self.codec, {})
+            self._stream.codec_context.time_base = TIME_BASE
+
+            self._segment_start = timestamp
+            self._last_pts = -1
+            self.segments.append(path)
+
+        frame = av.VideoFrame.from_ndarray(img, format='rgb24')
+        frame.time_base = TIME_BASE
+        frame.pts = self._last_pts = max(self._last_pts + 1, int((timestamp - self._segment_start) * 1000))
+
+        for packet in self._stream.encode(frame):
+            self._output.mux(packet)
+
+
+    def _write_landmarks(self, landmarks, frame_shape, timestamp):
+        if self._needs_new_segment(timestamp):
+            self._close_segment()
+
+            path = self._segment_path(TRACE_SUFFIX)
+            # Without a known fps the trace measures it from the timestamps; the frame shape comes with the landmarks.
+            self._output = TraceWriter(path, fps = self.fps, meta = {'session': self.name})
+            self._segment_start = timestamp
+            self.segments.append(path)
+
+        self._output.append(landmarks, timestamp, frame_shape)
+
+
+    def _close_segment(self):
+        output, self._output = self._output, None
+        if output is None:
+            return
+
+        if isinstance(output, TraceWriter):
+            output.close()
+            return
+
+        stream, self._stream = self._stream, None
+        for packet in stream.encode(None):
+            output.mux(packet)
+        output.close()
+
+
+
+def _finish(queue, thread, timeout = 10.0):
+    # Lets the encoder thread write out what is queued and close the current segment.
+    queue.put(None)
+    thread.join(timeout)
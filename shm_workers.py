@@ -0,0 +1,400 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# Multiprocess execution mode: pose inference and ProcessFrame.process run in worker processes.
+#
+# Frames travel through one multiprocessing.shared_memory block divided into fixed-size slots;
+# only slot numbers and small result records are pickled. Every session owns a few slots and is
+# pinned to one worker, which keeps that session's pose graph and state machine. The worker draws
+# the annotated frame in place in the slot, so the session reads it back without a copy:
+#
+#   callback:  copy frame into a free slot of the session --(slot id)--> worker process
+#   worker:    pose.process + processor.process in place   --(record)--> collector thread
+#   collector: slot becomes the session's latest frame; the previous latest slot is freed
+#
+# A session's slots are only ever refilled by its own callback thread, so the latest frame stays
+# valid while the callback encodes it.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SHAPE = (1080, 1920, 3)
+
+# Latest displayed frame plus frames in flight, per session.
+DEFAULT_SLOTS_PER_SESSION = 3
+
+
+
+def _default_pose_factory(**pose_kwargs):
+    from utils import get_mediapipe_pose
+    return get_mediapipe_pose(**pose_kwargs)
+
+
+
+def _slot_view(buf, slot, slot_bytes, shape):
+    return np.ndarray(shape, dtype=np.uint8, buffer=buf, offset=slot * slot_bytes)
+
+
+
+def _open_worker_session(exercise, flip_frame, render, pose_options, pose_factory, pose_kwargs):
+    from batch_process import make_processor
+    from event_bus import EventChannel
+
+    pose = pose_factory(**pose_kwargs)
+
+    if pose_options.get('roi_cropping'):
+        from roi_pose import RoiCropPose
+        pose = RoiCropPose(pose)
+
+    if pose_options.get('adaptive_cadence'):
+        from adaptive_pose import AdaptiveCadencePose
+        pose = AdaptiveCadencePose(pose)
+
+    if pose_options.get('smooth_landmarks'):
+        from landmark_filter import SmoothedPose
+        pose = SmoothedPose(pose)
+
+    processor = make_processor(exercise, flip_frame = flip_frame, render = render)
+
+    # Events are collected per frame and sent back with the result record.
+    events = []
+    processor.events = EventChannel(events.append)
+
+    return processor, pose, events
+
+
+
+def _worker_main(shm_name, slot_bytes, tasks, results, pose_factory, pose_kwargs):
+    shm = shared_memory.SharedMemory(name = shm_name)
+    sessions = {}
+
+    # session id -> why the session could not be opened; reported with every frame of it.
+    failed = {}
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+
+            kind, session_id = task[0], task[1]
+
+            if kind == 'open':
+                try:
+                    sessions[session_id] = _open_worker_session(*task[2:], pose_factory, pose_kwargs)
+                except Exception as e:
+                    logger.exception('could not open session %d', session_id)
+                    failed[session_id] = 'session could not be opened: {!r}'.format(e)
+
+            elif kind == 'close':
+                failed.pop(session_id, None)
+                _, pose, _ = sessions.pop(session_id, (None, None, None))
+                close = getattr(pose, 'close', None)
+                if close is not None:
+                    close()
+
+            elif kind == 'frame':
+                _, _, slot, seq, shape, submitted_at = task
+                start = time.perf_counter()
+                record = {'event': None, 'analysis': None, 'error': None, 'submitted': submitted_at}
+
+                try:
+                    processor, pose, events = sessions[session_id]
+                    frame = _slot_view(shm.buf, slot, slot_bytes, shape)
+                    output = processor.process(frame, pose)
+
+                    if processor.render:
+                        frame_out, record['event'] = output
+                        if frame_out is not frame:
+                            np.copyto(frame, frame_out)
+                    else:
+                        record['event'], record['analysis'] = output.event, output
+
+                    record['correct'] = processor.state.correct
+                    record['incorrect'] = processor.state.incorrect
+
+                    if events:
+                        record['events'] = events[:]
+                        events.clear()
+                except Exception as e:
+                    # The slot still has to go back to the session.
+                    record['error'] = failed.get(session_id) or repr(e)
+
+                # No views into the shared block may outlive the frame.
+                frame = frame_out = output = None
+
+                record['service'] = time.perf_counter() - start
+                results.put((session_id, slot, seq, record))
+    finally:
+        shm.close()
+
+
+
+class ShmSession:
+    # Per-session handle with the same interface as async_pipeline.AsyncFrameProcessor.
+    # Frames passed to submit() are copied into shared memory, so callers may reuse them.
+    copies_frames = True
+
+    def __init__(self, pool, session_id, worker, slots, render):
+        self.pool = pool
+        self.session_id = session_id
+        self.worker = worker
+        self.render = render
+
+        self._free = deque(slots)
+        self._slots = tuple(slots)
+        self._shapes = {}
+        self._latest_slot = None
+        self._latest_frame = None
+        self._seq = 0
+        self._lock = threading.Lock()
+
+        self.active = True
+        self.sounds = deque(maxlen = 32)
+        self.latest_record = None
+
+        # Optional event_bus.EventChannel; events emitted in the worker are forwarded to it.
+        self.events = None
+
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_latency = None
+        self.last_service = None
+
+
+    def submit(self, frame):
+        if not self.active:
+            return
+
+        if frame.nbytes > self.pool.slot_bytes:
+            raise ValueError('Frame of {} bytes does not fit a {} byte slot'.format(frame.nbytes, self.pool.slot_bytes))
+
+        with self._lock:
+            self.submitted += 1
+            if not self._free:
+                # Worker is behind: every slot is displayed or in flight.
+                self.dropped += 1
+                return
+            slot = self._free.popleft()
+            self._seq += 1
+            seq = self._seq
+
+        np.copyto(self.pool._slot(slot, frame.shape), frame)
+        self._shapes[slot] = frame.shape
+        self.pool._send(self.worker, ('frame', self.session_id, slot, seq, frame.shape, time.perf_counter()))
+
+
+    def latest(self):
+        return self._latest_frame
+
+
+    def process(self, frame):
+        # Callback helper: submit the new frame and return the newest finished one (or the input).
+        self.submit(frame)
+        latest = self._latest_frame
+
+        return frame if latest is None else latest
+
+
+    def pop_sound(self):
+        return self.sounds.popleft() if self.sounds else None
+
+
+    def stats(self):
+        return {
+            'worker'       : self.worker,
+            'submitted'    : self.submitted,
+            'completed'    : self.completed,
+            'dropped'      : self.dropped,
+            'errors'       : self.errors,
+            'last_error'   : self.last_error,
+            'last_latency' : self.last_latency,
+            'last_service' : self.last_service,
+        }
+
+
+    def stop(self, timeout = None):
+        self.pool._close_session(self)
+
+
+    def _on_result(self, slot, record):
+        # Collector thread.
+        with self._lock:
+            if record['error'] is not None or not self.render:
+                self._free.append(slot)
+            else:
+                previous = self._latest_slot
+                self._latest_slot = slot
+                self._latest_frame = self.pool._slot(slot, self._shapes[slot])
+                if previous is not None:
+                    self._free.append(previous)
+
+        if record['error'] is not None:
+            self.errors += 1
+            self.last_error = record['error']
+            return
+
+        if record['event'] is not None:
+            self.sounds.append(record['event'])
+
+        if self.events is not None:
+            for event in record.get('events', ()):
+                self.events.forward(event)
+
+        self.latest_record = record
+        self.completed += 1
+        self.last_latency = time.perf_counter() - record['submitted']
+        self.last_service = record['service']
+
+
+    def _in_flight(self):
+        with self._lock:
+            return len(self._slots) - len(self._free) - (self._latest_slot is not None)
+
+
+
+class ShmWorkerPool:
+    def __init__(self, num_workers = None, max_sessions = 16, slots_per_session = DEFAULT_SLOTS_PER_SESSION,
+                 max_shape = DEFAULT_MAX_SHAPE, pose_factory = _default_pose_factory, pose_kwargs = None):
+
+        self.num_workers = num_workers or os.cpu_count()
+        self.slots_per_session = slots_per_session
+        self.slot_bytes = int(np.prod(max_shape))
+
+        num_slots = max_sessions * slots_per_session
+        self.shm = shared_memory.SharedMemory(create = True, size = num_slots * self.slot_bytes)
+        self._free_groups = deque(tuple(range(group * slots_per_session, (group + 1) * slots_per_session))
+                                  for group in range(max_sessions))
+
+        # Spawned (not forked) so workers don't inherit Streamlit's or aiortc's threads.
+        ctx = multiprocessing.get_context('spawn')
+        self._results = ctx.Queue()
+        self._tasks = [ctx.Queue() for _ in range(self.num_workers)]
+        self._workers = [ctx.Process(target = _worker_main, name = 'pose-worker-{}'.format(i), daemon = True,
+                                     args = (self.shm.name, self.slot_bytes, self._tasks[i], self._results, pose_factory, pose_kwargs or {}))
+                         for i in range(self.num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+        self._sessions = {}
+        self._closing = {}
+        self._worker_load = [0] * self.num_workers
+        self._session_ids = iter(range(1 << 62))
+        self._lock = threading.Lock()
+
+        self._collector = threading.Thread(target = self._collect, name = 'pose-worker-results', daemon = True)
+        self._collector.start()
+
+        self._finalizer = weakref.finalize(self, _shutdown, self._tasks, self._workers, self._results, self.shm)
+
+
+    def open_session(self, exercise, flip_frame = True, render = True, roi_cropping = False, adaptive_cadence = False, smooth_landmarks = False):
+        with self._lock:
+            if not self._free_groups:
+                raise RuntimeError('All {} session slots are in use'.format(len(self._sessions)))
+
+            session_id = next(self._session_ids)
+            worker = min(range(self.num_workers), key = self._worker_load.__getitem__)
+            self._worker_load[worker] += 1
+
+            session = ShmSession(self, session_id, worker, self._free_groups.popleft(), render)
+            self._sessions[session_id] = session
+
+        pose_options = {'roi_cropping': roi_cropping, 'adaptive_cadence': adaptive_cadence, 'smooth_landmarks': smooth_landmarks}
+        self._send(worker, ('open', session_id, exercise, flip_frame, render, pose_options))
+
+        return session
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers'       : self.num_workers,
+                'alive'         : sum(worker.is_alive() for worker in self._workers),
+                'sessions'      : len(self._sessions),
+                'worker_load'   : list(self._worker_load),
+                'free_sessions' : len(self._free_groups),
+            }
+
+
+    def close(self):
+        self._finalizer()
+
+
+    def _slot(self, slot, shape):
+        return _slot_view(self.shm.buf, slot, self.slot_bytes, shape)
+
+
+    def _send(self, worker, task):
+        self._tasks[worker].put(task)
+
+
+    def _close_session(self, session):
+        with self._lock:
+            if not session.active:
+                return
+            session.active = False
+            session._latest_frame = None
+            self._sessions.pop(session.session_id, None)
+            self._closing[session.session_id] = session
+            self._worker_load[session.worker] -= 1
+
+        self._send(session.worker, ('close', session.session_id))
+        self._release_if_idle(session)
+
+
+    def _release_if_idle(self, session):
+        # A closed session's slots are reused once the results of its frames in flight are back.
+        if session.active or session._in_flight():
+            return
+
+        with self._lock:
+            if self._closing.pop(session.session_id, None) is not None:
+                self._free_groups.append(session._slots)
+
+
+    def _collect(self):
+        while True:
+            try:
+                item = self._results.get()
+            except (EOFError, OSError):
+                return
+            if item is None:
+                return
+
+            session_id, slot, _, record = item
+            with self._lock:
+                session = self._sessions.get(session_id) or self._closing.get(session_id)
+
+            if session is not None:
+                session._on_result(slot, record)
+                self._release_if_idle(session)
+
+
+
+def _shutdown(tasks, workers, results, shm):
+    for queue in tasks:
+        queue.put(None)
+    for worker in workers:
+        worker.join(2.0)
+        if worker.is_alive():
+            worker.terminate()
+
+    results.put(None)
+    try:
+        shm.close()
+    except BufferError:
+        # A session still holds a view of its latest frame; the mapping goes away with the process.
+        pass
+    shm.unlink()
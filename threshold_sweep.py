@@ -0,0 +1,398 @@
+import argparse
+import copy
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch_process import EXERCISES
+from exercise_engine import NO_STATE, S1, HINT, REP_CORRECT, REP_IMPROPER, ANGLE_LUT_SIZE
+from utils import denormalize_landmarks, get_joint_angles, JOINT_ANGLE_INDEX, LEFT_LANDMARK_IDS, RIGHT_LANDMARK_IDS
+
+
+# Threshold tuning over recorded sessions.
+#
+# The geometry (landmarks -> joint angles -> tracked side) does not depend on thresholds.py, so it
+# is computed once per session, vectorized over all frames. The rep state machine is then run
+# for every candidate configuration at once: each piece of per-session state (state_seq, counters,
+# feedback flags, inactivity timers, ...) becomes an array over the configuration axis and every
+# frame is a handful of NumPy operations, however many configurations are swept. Sessions are
+# spread over a process pool.
+#
+# Inactivity is timed with the recorded timestamps (trace files) or frame_idx / fps, i.e. what a
+# live session would have experienced, rather than the replay's wall clock.
+
+DEFAULT_FRAME_SHAPE = (720, 1280, 3)
+
+
+
+def _set_path(thresholds, path, value):
+    # 'KNEE_THRESH.2' or 'HIP_KNEE_VERT.PASS' -> nested assignment.
+    keys = path.split('.')
+    target = thresholds
+    for key in keys[:-1]:
+        target = target[int(key) if isinstance(target, list) else key]
+
+    last = keys[-1]
+    if isinstance(target, list):
+        target[int(last)] = value
+    else:
+        target[last] = tuple(value) if isinstance(value, list) else value
+
+
+
+def expand_grid(base_thresholds, grid):
+    # grid: {path: [values]} -> (list of threshold dicts, list of the overrides that produced them).
+    paths = sorted(grid)
+    configs = []
+    overrides = []
+
+    for values in itertools.product(*(grid[path] for path in paths)):
+        thresholds = copy.deepcopy(base_thresholds)
+        for path, value in zip(paths, values):
+            _set_path(thresholds, path, value)
+
+        configs.append(thresholds)
+        overrides.append(dict(zip(paths, values)))
+
+    return configs, overrides
+
+
+
+def _load_definition(exercise, thresholds):
+    import importlib
+
+    module_name, class_name, _ = EXERCISES[exercise]
+    processor_cls = getattr(importlib.import_module(module_name), class_name)
+
+    # Only the compiled tables are needed; building a processor is the simplest way to get them.
+    return processor_cls(thresholds = thresholds).compiled
+
+
+
+def stack_configs(exercise, configs):
+    # Compiles every configuration and stacks what differs between them along a leading axis.
+    compiled = [_load_definition(exercise, thresholds) for thresholds in configs]
+    first = compiled[0]
+
+    def rule_shape(c):
+        return [[(rule[0], rule[3], rule[4], rule[5]) for rule in group] for side in ('left', 'right') for group in c.sides[side]['rules']]
+
+    for c in compiled[1:]:
+        if rule_shape(c) != rule_shape(first):
+            raise ValueError('All configurations need the same feedback rule structure; only thresholds may differ')
+
+    left_rules = first.sides['left']['rules']
+    right_rules = first.sides['right']['rules']
+
+    groups = []
+    for g, group in enumerate(left_rules):
+        rules = []
+        for r, (left_idx, _, _, seq_mask, action, incorrect) in enumerate(group):
+            lo = np.array([c.sides['left']['rules'][g][r][1] for c in compiled], dtype=np.float64)
+            hi = np.array([c.sides['left']['rules'][g][r][2] for c in compiled], dtype=np.float64)
+            rules.append((left_idx, right_rules[g][r][0], lo, hi, seq_mask, action, incorrect))
+        groups.append(rules)
+
+    return {
+        'num_configs'      : len(configs),
+        'num_feedback'     : len(first.definition.feedback_map),
+        'state_lut'        : np.stack([c.state_lut for c in compiled]),
+        'state_angle'      : (first.sides['left']['state_angle'], first.sides['right']['state_angle']),
+        'transitions'      : first.transitions,
+        'outcomes'         : first.outcomes,
+        'seq_has_s3'       : first.seq_has_s3,
+        'rule_groups'      : groups,
+        'offset_thresh'    : np.array([t['OFFSET_THRESH'] for t in configs], dtype=np.float64),
+        'inactive_thresh'  : np.array([t['INACTIVE_THRESH'] for t in configs], dtype=np.float64),
+        'cnt_frame_thresh' : np.array([t['CNT_FRAME_THRESH'] for t in configs], dtype=np.float64),
+    }
+
+
+
+def session_features(landmark_seq, frame_shape, timestamps):
+    # Threshold-independent per-frame inputs of the state machine, for all frames at once.
+    height, width = frame_shape[:2]
+    has_pose = ~np.isnan(landmark_seq[:, 0, 0])
+
+    coords = denormalize_landmarks(np.nan_to_num(landmark_seq).astype(np.float64), width, height)
+    angles = get_joint_angles(coords)
+
+    dist_left = np.abs(coords[:, LEFT_LANDMARK_IDS['foot'], 1] - coords[:, LEFT_LANDMARK_IDS['shoulder'], 1])
+    dist_right = np.abs(coords[:, RIGHT_LANDMARK_IDS['foot'], 1] - coords[:, RIGHT_LANDMARK_IDS['shoulder'], 1])
+
+    dts = np.diff(np.asarray(timestamps, dtype=np.float64), prepend=timestamps[0] if len(timestamps) else 0.0)
+
+    return {
+        'has_pose' : has_pose,
+        'angles'   : angles,
+        'left'     : dist_left > dist_right,
+        'dts'      : dts,
+    }
+
+
+
+def simulate(features, tables):
+    # Runs the rep state machine of ExerciseProcessor for every configuration in `tables`.
+    num_configs = tables['num_configs']
+    num_feedback = tables['num_feedback']
+    configs = np.arange(num_configs)
+
+    has_pose = features['has_pose']
+    angles = features['angles']
+    left = features['left']
+    dts = features['dts']
+
+    def side_angle(left_idx, right_idx):
+        return np.where(left, angles[:, left_idx], angles[:, right_idx])
+
+    # (num_frames, num_configs) lookups that don't depend on the running state.
+    state_angle = side_angle(*tables['state_angle'])
+    states = np.ascontiguousarray(tables['state_lut'][:, np.clip(state_angle, 0, ANGLE_LUT_SIZE - 1)].T)
+    misaligned = angles[:, JOINT_ANGLE_INDEX['offset'], None] > tables['offset_thresh']
+
+    groups = [[(side_angle(l_idx, r_idx), lo, hi, seq_mask, action, incorrect) for l_idx, r_idx, lo, hi, seq_mask, action, incorrect in group]
+              for group in tables['rule_groups']]
+
+    transitions = tables['transitions']
+    outcomes = tables['outcomes']
+    seq_has_s3 = tables['seq_has_s3']
+    inactive_thresh = tables['inactive_thresh']
+    cnt_frame_thresh = tables['cnt_frame_thresh'][:, None]
+
+    # Per-configuration state, mirroring ExerciseProcessor.state.
+    seq = np.zeros(num_configs, dtype=np.int64)
+    prev_state = np.full(num_configs, NO_STATE, dtype=np.int8)
+    incorrect_posture = np.zeros(num_configs, dtype=bool)
+    hint = np.zeros(num_configs, dtype=bool)
+    display = np.zeros((num_configs, num_feedback), dtype=bool)
+    count_frames = np.zeros((num_configs, num_feedback), dtype=np.int64)
+    inactive = np.zeros(num_configs)
+    inactive_front = np.zeros(num_configs)
+
+    correct = np.zeros(num_configs, dtype=np.int64)
+    improper = np.zeros(num_configs, dtype=np.int64)
+    reps = np.zeros(num_configs, dtype=np.int64)
+    improper_reps = np.zeros(num_configs, dtype=np.int64)
+    resets = np.zeros(num_configs, dtype=np.int64)
+    triggers = np.zeros((num_configs, num_feedback), dtype=np.int64)
+
+    def reset_counters(fire):
+        correct[fire] = 0
+        improper[fire] = 0
+        resets[fire] += 1
+
+    for i in range(len(has_pose)):
+        dt = dts[i]
+
+        if not has_pose[i]:
+            inactive += dt
+            fire = inactive >= inactive_thresh
+            reset_counters(fire)
+            inactive[fire] = 0.0
+
+            prev_state[:] = NO_STATE
+            inactive_front[:] = 0.0
+            incorrect_posture[:] = False
+            display[:] = False
+            count_frames[:] = 0
+            continue
+
+        mis = misaligned[i]
+        aligned = ~mis
+
+        # Camera not aligned: only the front inactivity timer runs.
+        inactive_front = np.where(mis, inactive_front + dt, 0.0)
+        fire = mis & (inactive_front >= inactive_thresh)
+        reset_counters(fire)
+        inactive_front[fire] = 0.0
+
+        # Rep state machine.
+        current_state = states[i]
+        seq = np.where(aligned, transitions[seq, current_state], seq)
+
+        at_s1 = aligned & (current_state == S1)
+        outcome = outcomes[seq, incorrect_posture.view(np.int8)]
+
+        counted = at_s1 & (outcome == REP_CORRECT)
+        flagged = at_s1 & (outcome == REP_IMPROPER)
+        correct += counted
+        reps += counted
+        improper += flagged
+        improper_reps += flagged
+
+        seq[at_s1] = 0
+        incorrect_posture[at_s1] = False
+
+        # Feedback rules; within a group only the first matching rule fires.
+        shown_before = display.copy()
+        seq_bit = 1 << seq
+        in_rep = aligned & ~at_s1
+
+        for group in groups:
+            pending = in_rep.copy()
+            for rule_angle, lo, hi, seq_mask, action, incorrect in group:
+                angle = rule_angle[i]
+                match = pending & (lo < angle) & (angle < hi) & (seq_bit & seq_mask != 0)
+
+                if action == HINT:
+                    hint |= match
+                else:
+                    display[:, action] |= match
+
+                if incorrect:
+                    incorrect_posture |= match
+                pending &= ~match
+
+        triggers += display & ~shown_before
+
+        # Side view inactivity.
+        still = aligned & (current_state == prev_state)
+        inactive = np.where(still, inactive + dt, 0.0)
+        fire = still & (inactive >= inactive_thresh)
+        reset_counters(fire)
+        inactive[fire] = 0.0
+
+        hint[aligned & (seq_has_s3[seq] | (current_state == S1))] = False
+
+        count_frames += display & aligned[:, None]
+        prev_state = np.where(aligned, current_state, NO_STATE).astype(np.int8)
+
+        # Feedback banners expire after CNT_FRAME_THRESH frames.
+        expired = (count_frames > cnt_frame_thresh) & aligned[:, None]
+        display &= ~expired
+        count_frames[expired] = 0
+
+    return {
+        'correct'       : correct,
+        'incorrect'     : improper,
+        'reps'          : reps,
+        'improper_reps' : improper_reps,
+        'resets'        : resets,
+        'feedback'      : triggers,
+    }
+
+
+
+def load_session(path, fps = 30.0, frame_shape = None):
+    # Returns (landmark_seq, timestamps, frame_shape) from a trace or a .npy landmark sequence.
+    from landmark_trace import TRACE_SUFFIX, TraceReader
+
+    if path.endswith(TRACE_SUFFIX):
+        with TraceReader(path) as reader:
+            return reader.landmarks(), reader.timestamps, reader.frame_shape or frame_shape or DEFAULT_FRAME_SHAPE
+
+    landmark_seq = np.load(path)
+
+    return landmark_seq, np.arange(len(landmark_seq)) / fps, frame_shape or DEFAULT_FRAME_SHAPE
+
+
+
+def _sweep_session(task):
+    path, tables, fps, frame_shape = task
+
+    landmark_seq, timestamps, frame_shape = load_session(path, fps, frame_shape)
+
+    return path, simulate(session_features(landmark_seq, frame_shape, timestamps), tables)
+
+
+
+def sweep(session_paths, exercise, configs, workers = None, fps = 30.0, frame_shape = None):
+    # {session path: simulate() results} for every session, each result indexed by configuration.
+    tables = stack_configs(exercise, configs)
+    tasks = [(path, tables, fps, frame_shape) for path in session_paths]
+
+    if workers == 1:
+        return dict(map(_sweep_session, tasks))
+
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        return dict(pool.map(_sweep_session, tasks))
+
+
+
+def rank_configs(results, labels, overrides):
+    # labels: {session: correct count or {'correct': n, 'incorrect': m}}, matched by path or file name.
+    # Configurations are ranked by the total absolute rep count error over the labelled sessions.
+    num_configs = len(overrides)
+    error = np.zeros(num_configs)
+    sessions = {}
+
+    for path, result in results.items():
+        label = labels.get(path, labels.get(os.path.basename(path)))
+        if label is None:
+            continue
+        if not isinstance(label, dict):
+            label = {'correct': label}
+
+        error += np.abs(result['reps'] - label['correct'])
+        if 'incorrect' in label:
+            error += np.abs(result['improper_reps'] - label['incorrect'])
+
+        sessions[path] = label
+
+    ranking = []
+    for idx in np.argsort(error, kind='stable'):
+        ranking.append({
+            'config'    : int(idx),
+            'overrides' : overrides[idx],
+            'error'     : float(error[idx]),
+            'sessions'  : {
+                            path: {'correct': int(results[path]['reps'][idx]), 'incorrect': int(results[path]['improper_reps'][idx]),
+                                   'label': label}
+                            for path, label in sessions.items()
+                          },
+        })
+
+    return ranking
+
+
+
+def _parse_param(text):
+    path, values = text.split('=', 1)
+    return path, json.loads(values)
+
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Sweep threshold configurations over recorded landmark sessions.')
+    parser.add_argument('sessions', nargs = '+', help = 'Landmark traces (.lmtrace) or (num_frames, 33, 4) .npy sequences.')
+    parser.add_argument('--exercise', choices = sorted(EXERCISES), required = True)
+    parser.add_argument('--grid', help = 'JSON file mapping threshold paths (e.g. "KNEE_THRESH.2", "HIP_KNEE_VERT.PASS") to candidate values.')
+    parser.add_argument('--param', action = 'append', type = _parse_param, default = [],
+                        help = 'PATH=JSON_LIST, e.g. OFFSET_THRESH=[30,35,40]. Can be repeated.')
+    parser.add_argument('--labels', required = True, help = 'JSON file mapping session file names to labelled rep counts.')
+    parser.add_argument('--workers', type = int, default = os.cpu_count())
+    parser.add_argument('--fps', type = float, default = 30.0, help = 'Frame rate of .npy sessions.')
+    parser.add_argument('--top', type = int, default = 10)
+    parser.add_argument('--json', help = 'Write the full ranking to this file.')
+    args = parser.parse_args(argv)
+
+    grid = {}
+    if args.grid:
+        with open(args.grid) as f:
+            grid.update(json.load(f))
+    grid.update(dict(args.param))
+
+    with open(args.labels) as f:
+        labels = json.load(f)
+
+    import importlib
+    base_thresholds = getattr(importlib.import_module('thresholds'), EXERCISES[args.exercise][2])()
+    configs, overrides = expand_grid(base_thresholds, grid)
+
+    results = sweep(args.sessions, args.exercise, configs, args.workers, args.fps)
+    ranking = rank_configs(results, labels, overrides)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(ranking, f, indent = 2)
+
+    for entry in ranking[:args.top]:
+        print('{:>8.1f}  {}'.format(entry['error'], json.dumps(entry['overrides'])))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
+import threading
+from collections import OrderedDict
 import cv2
-import mediapipe as mp
 import numpy as np
 
 def draw_rounded_rect(img, rect_start, rect_end, corner_width, box_color):
@@ -34,6 +35,30 @@ def draw_rounded_rect(img, rect_start, rect_end, corner_width, box_color):
 
 
 
+def mirror_coords(coords, frame_width):
+    # Horizontal mirror of (..., 2) pixel coordinates, matching cv2.flip(frame, 1). Used to draw
+    # straight onto a frame that was mirrored once instead of flipping the annotated frame.
+    mirrored = coords.copy()
+    mirrored[..., 0] = frame_width - 1 - coords[..., 0]
+
+    return mirrored
+
+
+
+
+def draw_angle_arc(frame, center, radius, angle, direction, color, thickness = 3, mirror = False, lineType = cv2.LINE_AA):
+    # Arc starting at the upward vertical and sweeping `angle` degrees (direction 1: clockwise on
+    # screen). With mirror the sweep is reversed, as it would be after flipping the frame.
+    sweep = -direction * angle if mirror else direction * angle
+
+    cv2.ellipse(frame, center, (radius, radius), angle=0, startAngle=-90, endAngle=-90 + sweep,
+                color=color, thickness=thickness, lineType=lineType)
+
+    return frame
+
+
+
+
 def draw_dotted_line(frame, lm_coord, start, end, line_color):
     pix_step = 0
 
@@ -83,6 +108,143 @@ def draw_text(
 
 
 
+class _TextSprite:
+    # A draw_text() label rendered once. 'premult' holds the color already multiplied by alpha and
+    # 'inv_alpha' holds 255 - alpha per channel, so compositing is one multiply and one add.
+    __slots__ = ('premult', 'inv_alpha', 'dx', 'dy', 'text_size')
+
+    def __init__(self, premult, inv_alpha, dx, dy, text_size):
+        self.premult = premult
+        self.inv_alpha = inv_alpha
+        self.dx = dx
+        self.dy = dy
+        self.text_size = text_size
+
+    @property
+    def rgba(self):
+        alpha = 255 - self.inv_alpha[..., :1]
+        return np.concatenate([self.premult, alpha], axis=-1)
+
+
+
+
+class TextSpriteCache:
+    # LRU cache of rendered draw_text() labels keyed by everything that affects their pixels
+    # except the position. Shared by all sessions, hence the lock.
+    def __init__(self, maxsize = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._sprites = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._sprites)
+
+
+    def clear(self):
+        with self._lock:
+            self._sprites.clear()
+
+
+    def get(self, msg, width, font, font_scale, font_thickness, text_color, text_color_bg, box_offset):
+        key = (msg, width, font, font_scale, font_thickness, tuple(text_color), tuple(text_color_bg), tuple(box_offset))
+
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self._sprites.move_to_end(key)
+                self.hits += 1
+                return sprite
+
+        sprite = self._render(*key)
+
+        with self._lock:
+            self.misses += 1
+            self._sprites[key] = sprite
+            if len(self._sprites) > self.maxsize:
+                self._sprites.popitem(last=False)
+
+        return sprite
+
+
+    @staticmethod
+    def _render(msg, width, font, font_scale, font_thickness, text_color, text_color_bg, box_offset):
+        (text_w, text_h), baseline = cv2.getTextSize(msg, font, font_scale, font_thickness)
+
+        # Lay the label out on a canvas large enough for the box and any glyph overhang.
+        pad = font_thickness + 4
+        origin = (box_offset[0] + pad, box_offset[1] + pad)
+        canvas_w = text_w + 2 * box_offset[0] + 2 * pad
+        canvas_h = text_h + 2 * box_offset[1] + baseline + 2 * pad
+
+        # Drawing over black yields color premultiplied by alpha; the same calls on a
+        # single-channel canvas yield the (antialiased) coverage mask.
+        color = np.zeros((canvas_h, canvas_w, 3), dtype=np.uint8)
+        alpha = np.zeros((canvas_h, canvas_w), dtype=np.uint8)
+
+        draw_text(color, msg, width, font, origin, font_scale, font_thickness, text_color, text_color_bg, box_offset)
+        text_size = draw_text(alpha, msg, width, font, origin, font_scale, font_thickness, 255, 255, box_offset)
+
+        x, y, w, h = cv2.boundingRect(alpha)
+        premult = np.ascontiguousarray(color[y:y+h, x:x+w])
+        inv_alpha = np.ascontiguousarray(np.repeat(255 - alpha[y:y+h, x:x+w, None], 3, axis=-1))
+
+        return _TextSprite(premult, inv_alpha, x - origin[0], y - origin[1], text_size)
+
+
+
+
+_TEXT_SPRITE_CACHE = TextSpriteCache()
+
+
+def get_text_sprite_cache():
+    return _TEXT_SPRITE_CACHE
+
+
+
+
+def draw_text_cached(
+    img,
+    msg,
+    width = 8,
+    font=cv2.FONT_HERSHEY_SIMPLEX,
+    pos=(0, 0),
+    font_scale=1,
+    font_thickness=2,
+    text_color=(0, 255, 0),
+    text_color_bg=(0, 0, 0),
+    box_offset=(20, 10),
+):
+    # Same output as draw_text(), but the label is rendered once and alpha blended from the sprite cache.
+    if img.ndim != 3 or img.shape[2] != 3 or img.dtype != np.uint8:
+        return draw_text(img, msg, width, font, pos, font_scale, font_thickness, text_color, text_color_bg, box_offset)
+
+    sprite = _TEXT_SPRITE_CACHE.get(msg, width, font, font_scale, font_thickness, text_color, text_color_bg, box_offset)
+
+    img_h, img_w = img.shape[:2]
+    sprite_h, sprite_w = sprite.premult.shape[:2]
+
+    x0 = int(pos[0]) + sprite.dx
+    y0 = int(pos[1]) + sprite.dy
+
+    # Clip the sprite against the frame borders.
+    sx0, sy0 = max(0, -x0), max(0, -y0)
+    sx1, sy1 = min(sprite_w, img_w - x0), min(sprite_h, img_h - y0)
+
+    if sx1 <= sx0 or sy1 <= sy0:
+        return sprite.text_size
+
+    roi = img[y0+sy0:y0+sy1, x0+sx0:x0+sx1]
+    cv2.multiply(roi, sprite.inv_alpha[sy0:sy1, sx0:sx1], dst=roi, scale=1/255)
+    cv2.add(roi, sprite.premult[sy0:sy1, sx0:sx1], dst=roi)
+
+    return sprite.text_size
+
+
+
+
 def find_angle(p1, p2, ref_pt = np.array([0,0])):
     p1_ref = p1 - ref_pt
     p2_ref = p2 - ref_pt
@@ -96,6 +258,68 @@ def find_angle(p1, p2, ref_pt = np.array([0,0])):
 
 
 
+# Landmark ids of the joints used by the frame processors.
+LEFT_LANDMARK_IDS = {'shoulder': 11, 'elbow': 13, 'wrist': 15, 'hip': 23, 'knee': 25, 'ankle': 27, 'foot': 31}
+RIGHT_LANDMARK_IDS = {'shoulder': 12, 'elbow': 14, 'wrist': 16, 'hip': 24, 'knee': 26, 'ankle': 28, 'foot': 32}
+NOSE_LANDMARK_ID = 0
+
+
+# Every angle the processors need as (p1, p2, ref, vertical). For vertical angles p2 is replaced by the
+# point straight above ref at y = 0, i.e. find_angle(p1, np.array([ref[0], 0]), ref).
+_JOINT_ANGLE_SPECS = [('offset', (11, 12, 0, False))]
+
+for _side, _ids in (('left', LEFT_LANDMARK_IDS), ('right', RIGHT_LANDMARK_IDS)):
+    _JOINT_ANGLE_SPECS += [
+        (_side + '_elbow',    (_ids['shoulder'], _ids['elbow'],    _ids['elbow'],    True)),
+        (_side + '_shoulder', (_ids['elbow'],    _ids['shoulder'], _ids['shoulder'], True)),
+        (_side + '_wrist',    (_ids['elbow'],    _ids['wrist'],    _ids['wrist'],    True)),
+        (_side + '_hip',      (_ids['shoulder'], _ids['hip'],      _ids['hip'],      True)),
+        (_side + '_knee',     (_ids['hip'],      _ids['knee'],     _ids['knee'],     True)),
+        (_side + '_ankle',    (_ids['knee'],     _ids['ankle'],    _ids['ankle'],    True)),
+    ]
+
+JOINT_ANGLE_NAMES = tuple(name for name, _ in _JOINT_ANGLE_SPECS)
+JOINT_ANGLE_INDEX = {name: idx for idx, name in enumerate(JOINT_ANGLE_NAMES)}
+
+_ANGLE_P1 = np.array([spec[0] for _, spec in _JOINT_ANGLE_SPECS])
+_ANGLE_P2 = np.array([spec[1] for _, spec in _JOINT_ANGLE_SPECS])
+_ANGLE_REF = np.array([spec[2] for _, spec in _JOINT_ANGLE_SPECS])
+_ANGLE_VERTICAL = np.array([spec[3] for _, spec in _JOINT_ANGLE_SPECS])
+
+
+
+
+def find_angles(p1, p2, ref_pt):
+    # Vectorized find_angle() over the leading axes of (..., 2) point arrays. Degenerate
+    # (zero-length) vectors give 0 instead of raising.
+    p1_ref = p1 - ref_pt
+    p2_ref = p2 - ref_pt
+
+    norms = np.linalg.norm(p1_ref, axis=-1) * np.linalg.norm(p2_ref, axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_theta = np.einsum('...i,...i->...', p1_ref, p2_ref) / norms
+
+    theta = np.arccos(np.clip(np.nan_to_num(cos_theta, nan=1.0), -1.0, 1.0))
+
+    # Same (truncated) degree conversion as find_angle(), which the thresholds were tuned against.
+    return (int(180 / np.pi) * theta).astype(np.int64)
+
+
+
+
+def get_joint_angles(coords):
+    # coords: (33, 2) or (num_frames, 33, 2) denormalized landmark coordinates.
+    # Returns every angle in JOINT_ANGLE_NAMES with shape (13,) or (num_frames, 13).
+    p1 = coords[..., _ANGLE_P1, :]
+    ref = coords[..., _ANGLE_REF, :]
+    p2 = coords[..., _ANGLE_P2, :].copy()
+    p2[..., _ANGLE_VERTICAL, 1] = 0
+
+    return find_angles(p1, p2, ref)
+
+
+
 
 
 def get_landmark_array(pose_landmark, key, frame_width, frame_height):
@@ -108,6 +332,20 @@ def get_landmark_array(pose_landmark, key, frame_width, frame_height):
 
 
 
+def get_landmark_matrix(landmarks):
+    # Converts pose_landmarks.landmark into a single (33, 4) array of x, y, z, visibility.
+    return np.array([(lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks], dtype=np.float64)
+
+
+
+
+def denormalize_landmarks(landmark_matrix, frame_width, frame_height):
+    # (..., 33, 4) normalized landmarks -> (..., 33, 2) integer pixel coordinates, truncated like get_landmark_array().
+    return (landmark_matrix[..., :2] * (frame_width, frame_height)).astype(np.int64)
+
+
+
+
 def get_landmark_features(kp_results, dict_features, feature, frame_width, frame_height):
 
     if feature == 'nose':
@@ -136,6 +374,9 @@ def get_mediapipe_pose(
                         min_tracking_confidence = 0.5
 
                       ):
+    # mediapipe takes most of a second to import, so only pay for it when a graph is built.
+    import mediapipe as mp
+
     pose = mp.solutions.pose.Pose(
                                     static_image_mode = static_image_mode,
                                     model_complexity = model_complexity,